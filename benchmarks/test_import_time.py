@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+RUNS = 5
+
+# Budgets are cumulative import times in milliseconds, best of RUNS. They
+# leave headroom over a typical laptop; override them on slow CI machines.
+CLI_BUDGET_MS = float(os.environ.get("CM_CLI_IMPORT_BUDGET_MS", "150"))
+FAST_PATH_BUDGET_MS = float(os.environ.get("CM_FAST_IMPORT_BUDGET_MS", "30"))
+
+# Only the commands that need these may import them
+HEAVY_MODULES = ("InquirerPy", "prompt_toolkit", "requests", "asyncio", "rich.progress")
+
+@pytest.fixture(scope="module")
+def env(tmp_path_factory):
+    home = tmp_path_factory.mktemp("home")
+    return dict(os.environ, HOME=str(home), PYTHONPATH=str(SRC))
+
+def import_times(env: Dict[str, str], args: List[str]) -> Dict[str, int]:
+    """Cumulative import time in microseconds per module, from -X importtime"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, module = line.split("|")
+        try:
+            times[module.strip()] = int(cumulative)
+        except ValueError:
+            continue  # Header line
+    return times
+
+def best_of(env: Dict[str, str], args: List[str], modules: List[str]) -> float:
+    """Fastest of RUNS total import times for the given top-level modules, in ms"""
+    runs = []
+    for _ in range(RUNS):
+        times = import_times(env, args)
+        runs.append(sum(times[module] for module in modules))
+    return min(runs) / 1000
+
+def test_cli_skips_heavy_imports(env):
+    modules = import_times(env, ["-c", "import connection_manager.cli.main"])
+    assert not [name for name in modules if name.startswith(HEAVY_MODULES)]
+
+def test_fast_path_skips_cli_stack(env):
+    modules = import_times(env, ["-m", "connection_manager", "list", "--json"])
+    assert "connection_manager.cli.fast" in modules
+    assert not [name for name in modules if name.startswith(("typer", "rich", "connection_manager.cli.main"))]
+
+def test_cli_import_budget(env):
+    elapsed = best_of(env, ["-c", "import connection_manager.cli.main"], ["connection_manager.cli.main"])
+    assert elapsed < CLI_BUDGET_MS, f"cli.main imports in {elapsed:.1f}ms, budget {CLI_BUDGET_MS:.0f}ms"
+
+def test_fast_path_import_budget(env):
+    # Everything the fast path imports hangs off these modules
+    modules = ["connection_manager.cli.fast", "connection_manager.core.config", "connection_manager.core.client"]
+    elapsed = best_of(env, ["-c", "import " + ", ".join(modules)], modules)
+    assert elapsed < FAST_PATH_BUDGET_MS, f"fast path imports in {elapsed:.1f}ms, budget {FAST_PATH_BUDGET_MS:.0f}ms"
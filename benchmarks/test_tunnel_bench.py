@@ -0,0 +1,86 @@
+import http.client
+import os
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from connection_manager.utils.bench import (
+    STUB_MODEL, fake_ssh_on_path, free_port, relay_tunnel, request_once, stub_server
+)
+
+@pytest.fixture(scope="module")
+def home(tmp_path_factory):
+    # Keep keys, control sockets and results out of the real ~/.connections
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        home = tmp_path_factory.mktemp("home")
+        (home / ".connections").mkdir()
+        monkeypatch.setenv("HOME", str(home))
+        yield home
+
+@pytest.fixture(scope="module")
+def ssh_manager(home):
+    from connection_manager.core.ssh import SSHKeyManager
+    use_real_ssh = os.environ.get("BENCH_REAL_SSH") == "1"
+    if use_real_ssh:
+        yield SSHKeyManager()
+    else:
+        with fake_ssh_on_path():
+            yield SSHKeyManager()
+
+@pytest.fixture(scope="module")
+def stub_port():
+    with stub_server() as port:
+        yield port
+
+@pytest.fixture(scope="module")
+def tunnel_port(ssh_manager, stub_port):
+    local_port = free_port()
+    key_path = ssh_manager.get_key_path("bench")
+    process = ssh_manager.setup_tunnel("localhost", 22, key_path, local_port=local_port, remote_port=stub_port)
+    assert process is not None, "tunnel setup failed"
+    yield local_port
+    process.terminate()
+    process.wait()
+
+@pytest.fixture(scope="module")
+def relay_port(ssh_manager, stub_port):
+    key_path = ssh_manager.get_key_path("bench")
+    with relay_tunnel(ssh_manager, "localhost", 22, key_path, remote_port=stub_port) as port:
+        yield port
+
+@pytest.fixture(params=["direct", "tunnel", "relay"])
+def port(request, stub_port):
+    if request.param == "direct":
+        return stub_port
+    return request.getfixturevalue(f"{request.param}_port")
+
+@pytest.fixture
+def connection(port):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    yield connection
+    connection.close()
+
+def test_tags_latency(benchmark, connection):
+    benchmark(request_once, connection, "GET", "/api/tags")
+
+def test_embed_latency(benchmark, connection):
+    body = {"model": STUB_MODEL, "input": ["benchmark input"] * 4}
+    benchmark(request_once, connection, "POST", "/api/embed", body)
+
+def test_generate_stream(benchmark, connection):
+    body = {"model": STUB_MODEL, "prompt": "benchmark", "options": {"num_predict": 500}}
+    size = benchmark(request_once, connection, "POST", "/api/generate", body)
+    benchmark.extra_info["bytes_per_round"] = size
+
+def test_tunnel_setup(benchmark, ssh_manager, stub_port):
+    key_path = ssh_manager.get_key_path("bench")
+
+    def cycle():
+        local_port = free_port()
+        process = ssh_manager.setup_tunnel("localhost", 22, key_path, local_port=local_port, remote_port=stub_port)
+        assert process is not None
+        process.terminate()
+        process.wait()
+
+    benchmark.pedantic(cycle, rounds=5, iterations=1)
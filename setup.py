@@ -10,5 +10,9 @@ install_requires=[
 "inquirerpy>=0.3.4",
 "requests>=2.25.0"
 ],
+extras_require={
+"bench": ["pytest>=7.0", "pytest-benchmark>=4.0"],
+"yaml": ["PyYAML>=5.1"],
+},
 python_requires=">=3.8",
 )
@@ -1,6 +1,11 @@
-from connection_manager.cli.main import app
+import sys
 
 def main():
+    from connection_manager.cli.fast import run
+    code = run(sys.argv[1:])
+    if code is not None:
+        sys.exit(code)
+    from connection_manager.cli.main import app
     app()
 
 if __name__ == "__main__":
@@ -1,3 +1,9 @@
-from .main import app
-
 __all__ = ['app']
+
+def __getattr__(name):
+    # Importing the typer app is deferred so the fast path in cli.fast
+    # doesn't pay for it
+    if name == "app":
+        from .main import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,101 @@
+"""Machine-readable `list --json` and `status --json` without the full CLI
+
+Shell prompts and monitoring scripts call these constantly, so they are
+answered before typer, rich or anything heavier is imported. Anything this
+parser does not recognise falls through to the typer app.
+"""
+import json
+import sys
+from typing import Dict, List, Optional
+
+# option -> (destination, takes a value, repeatable)
+LIST_OPTIONS = {
+    "--filter": ("pattern", True, False), "-f": ("pattern", True, False),
+    "--tag": ("tags", True, True), "-t": ("tags", True, True),
+    "--group": ("group", True, False), "-g": ("group", True, False),
+    "--limit": ("limit", True, False), "-n": ("limit", True, False),
+    "--offset": ("offset", True, False),
+    "--json": ("as_json", False, False),
+}
+STATUS_OPTIONS = {
+    "--health": ("health", False, False),
+    "--json": ("as_json", False, False),
+}
+
+def parse_args(args: List[str], options: Dict, max_positional: int) -> Optional[Dict]:
+    """Parse a simple option list, or return None if anything is unfamiliar"""
+    parsed: Dict = {"positional": []}
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        value = None
+        if arg.startswith("--") and "=" in arg:
+            arg, value = arg.split("=", 1)
+        if arg in options:
+            dest, takes_value, repeatable = options[arg]
+            if not takes_value:
+                if value is not None:
+                    return None
+                parsed[dest] = True
+            else:
+                if value is None:
+                    i += 1
+                    if i >= len(args):
+                        return None
+                    value = args[i]
+                if repeatable:
+                    parsed.setdefault(dest, []).append(value)
+                else:
+                    parsed[dest] = value
+        elif arg.startswith("-") or len(parsed["positional"]) >= max_positional:
+            return None
+        else:
+            parsed["positional"].append(arg)
+        i += 1
+    return parsed
+
+def write_list_json(config_manager, pattern: Optional[str] = None, tags: Optional[List[str]] = None,
+                    group: Optional[str] = None, limit: Optional[int] = None, offset: int = 0):
+    """Stream one JSON object per connection as rows arrive"""
+    write = sys.stdout.write
+    for name, config in config_manager.iter_connections(pattern, tags, group, limit, offset):
+        write(json.dumps(dict(config, name=name)) + "\n")
+
+def write_status_json(name: Optional[str] = None, health: bool = False):
+    """One JSON object per tunnel the supervisor reports"""
+    from ..core.client import SupervisorError, send_request
+    try:
+        tunnels = send_request(
+            "status", timeout=5.0, name=name, health=health, forwards=name is not None
+        ).get("tunnels", [])
+    except SupervisorError:
+        tunnels = []
+    if name and not tunnels:
+        tunnels = [{"name": name, "up": False, "reconnecting": False}]
+    for tunnel in tunnels:
+        sys.stdout.write(json.dumps(tunnel) + "\n")
+
+def run(argv: List[str]) -> Optional[int]:
+    """Serve the command if it is a machine-readable list/status, else None"""
+    if not argv or argv[0] not in ("list", "status"):
+        return None
+    if argv[0] == "list":
+        parsed = parse_args(argv[1:], LIST_OPTIONS, max_positional=0)
+        if parsed is None or not parsed.get("as_json"):
+            return None
+        try:
+            limit = int(parsed["limit"]) if "limit" in parsed else None
+            offset = int(parsed.get("offset", 0))
+        except ValueError:
+            return None
+        from ..core.config import open_config_manager
+        write_list_json(open_config_manager(), parsed.get("pattern"), parsed.get("tags"),
+                        parsed.get("group"), limit, offset)
+        return 0
+
+    parsed = parse_args(argv[1:], STATUS_OPTIONS, max_positional=1)
+    if parsed is None or not parsed.get("as_json"):
+        return None
+    name = parsed["positional"][0] if parsed["positional"] else None
+    write_status_json(name, parsed.get("health", False))
+    return 0
@@ -1,20 +1,20 @@
 import typer
-from typing import Optional
+from typing import List, Optional
 from pathlib import Path
 from rich.console import Console
 from rich.table import Table
-from rich.progress import Progress
-from rich.panel import Panel
-from InquirerPy import inquirer
-from InquirerPy.base.control import Choice
-import asyncio
 import time
 import json
-import signal
-import os
-import atexit
-from ..core.config import ConfigManager
-from ..core.ssh import SSHKeyManager
+from ..core.config import connection_tags, connection_user, open_config_manager
+from ..core.defaults import (
+    DEFAULT_CACHE_SIZE_MB, DEFAULT_CONCURRENCY, DEFAULT_CONTROL_PERSIST, DEFAULT_DISK_CACHE_SIZE_MB,
+    DEFAULT_GATEWAY_PORT, DEFAULT_GATEWAY_RETRIES, DEFAULT_MAX_QUEUE, DEFAULT_READY_TIMEOUT
+)
+from .fast import write_list_json, write_status_json
+
+# Heavy modules (InquirerPy, asyncio, requests, the ssh and supervisor
+# machinery) are imported inside the commands that use them so that quick
+# commands like `status` and `list` start fast
 
 # Create the Typer app with a name and description
 app = typer.Typer(
@@ -22,11 +22,30 @@ app = typer.Typer(
     help="A CLI tool for managing SSH tunnels to remote servers"
 )
 console = Console()
-config_manager = ConfigManager()
+_config_manager = None
+SPARKS = "▁▂▃▄▅▆▇█"
+SPARKLINE_WIDTH = 60
+WATERFALL_WIDTH = 40
+
+def get_config_manager():
+    """Open the connection store on first use"""
+    global _config_manager
+    if _config_manager is None:
+        _config_manager = open_config_manager()
+    return _config_manager
+
+def get_ssh_manager(config: dict):
+    """Create an SSH manager honouring the connection's ControlPersist setting"""
+    from ..core.ssh import SSHKeyManager
+    return SSHKeyManager(control_persist=config.get("control_persist", DEFAULT_CONTROL_PERSIST))
 
 @app.command()
 def setup():
     """Interactive setup for new connection"""
+    import asyncio
+    from InquirerPy import inquirer
+    from rich.panel import Panel
+    from rich.progress import Progress
     console.print(Panel.fit("Connection Setup Wizard", style="bold blue"))
     
     async def interactive_setup():
@@ -60,7 +79,7 @@ def setup():
     
     with Progress() as progress:
         task = progress.add_task("Creating configuration...", total=100)
-        config_manager.save_connection(name, config)
+        get_config_manager().save_connection(name, config)
         progress.update(task, completed=100)
     
     console.print("[green]Setup complete![/green]")
@@ -73,7 +92,10 @@ def setup_key(
     force: bool = typer.Option(False, "--force", "-f", help="Force regenerate key even if it exists")
 ):
     """Generate SSH key for a connection"""
-    config = config_manager.get_connection(name)
+    from rich.panel import Panel
+    from rich.progress import Progress
+    from ..core.ssh import SSHKeyManager
+    config = get_config_manager().get_connection(name)
     if not config:
         console.print(f"[red]No connection found with name: {name}[/red]")
         return
@@ -96,18 +118,113 @@ def setup_key(
         console.print("1. Add this public key to ~/.ssh/authorized_keys on your server")
         console.print(f"2. Run 'python -m connection_manager verify-key {name}' to test the connection")
 
+@app.command("import")
+def import_inventory(
+    path: Optional[Path] = typer.Argument(None, help="~/.ssh/config-style file, CSV or YAML inventory (default: ~/.ssh/config)"),
+    fmt: Optional[str] = typer.Option(None, "--format", help="ssh, csv or yaml (default: from the file extension)"),
+    update: bool = typer.Option(False, "--update", "-u", help="Overwrite connections that exist with other settings"),
+    group: Optional[str] = typer.Option(None, "--group", "-g", help="Put imported connections without a group in this one"),
+    keys: bool = typer.Option(True, "--keys/--no-keys", help="Link each IdentityFile, or generate an ed25519 key, where one is missing"),
+    workers: Optional[int] = typer.Option(None, "--workers", "-w", help="Keys generated at once (default: one per CPU)"),
+    dry_run: bool = typer.Option(False, "--dry-run", "-n", help="Report what would change without saving anything"),
+    as_json: bool = typer.Option(False, "--json", help="One JSON object per entry instead of a table")
+):
+    """Add or update many connections from an inventory in one write"""
+    from ..core.importer import SSH_CONFIG_PATH, InventoryError, import_connections, provision_keys, read_inventory
+    path = path or SSH_CONFIG_PATH
+    started = time.monotonic()
+    try:
+        results = import_connections(get_config_manager(), read_inventory(path, fmt), update=update,
+                                     group=group, dry_run=dry_run)
+    except InventoryError as e:
+        console.print(f"[red]{e}[/red]")
+        return
+    if keys and not dry_run:
+        if as_json:
+            provision_keys(results, workers)
+        else:
+            with console.status("Provisioning keys...") as status:
+                done = 0
+
+                def progress(result):
+                    nonlocal done
+                    done += 1
+                    status.update(f"Provisioning keys... {done}")
+
+                provision_keys(results, workers, on_done=progress)
+    total = time.monotonic() - started
+    if as_json:
+        for result in results:
+            print(json.dumps(result.to_dict()))
+        return
+    show_import_summary(results, total, dry_run)
+
+def show_import_summary(results, total: float, dry_run: bool):
+    """Per-entry outcome of an import, conflicts and failures first"""
+    order = {"invalid": 0, "conflict": 1, "duplicate": 2, "added": 3, "updated": 4, "unchanged": 5}
+    styles = {"invalid": "red", "conflict": "yellow", "duplicate": "yellow", "added": "green",
+              "updated": "blue", "unchanged": "dim"}
+    table = Table(title="Import (dry run)" if dry_run else "Import")
+    table.add_column("Name", style="cyan")
+    table.add_column("Host", style="green")
+    table.add_column("Status")
+    table.add_column("Key")
+    table.add_column("Details")
+    for result in sorted(results, key=lambda result: (order[result.status], result.name or "")):
+        style = styles[result.status]
+        key_style = "red" if result.key == "failed" else "dim"
+        # Point at the entry in the inventory wherever something needs fixing
+        detail = result.detail or ""
+        if not result.imported or result.key == "failed":
+            detail = f"{detail} ({result.where})".strip()
+        table.add_row(
+            result.name or "-",
+            result.host or "-",
+            f"[{style}]{result.status}[/{style}]",
+            f"[{key_style}]{result.key}[/{key_style}]" if result.key else "-",
+            detail
+        )
+    console.print(table)
+    counts = {status: sum(1 for result in results if result.status == status) for status in order}
+    summary = ", ".join(f"{count} {status}" for status, count in counts.items() if count)
+    outcomes = {outcome: sum(1 for result in results if result.key == outcome)
+                for outcome in ("generated", "linked", "failed")}
+    provisioned = ", ".join(f"{count} {outcome}" for outcome, count in outcomes.items() if count)
+    console.print(f"[blue]{len(results)} entries in {total:.2f}s: {summary or 'nothing to import'}"
+                  + (f"; keys: {provisioned}" if provisioned else "") + "[/blue]")
+    if counts["conflict"] and not dry_run:
+        console.print("[yellow]Conflicting connections were left as they are; use --update to overwrite them.[/yellow]")
+
 @app.command()
 def verify_key(
-    name: str = typer.Argument(..., help="Connection name"),
-    verbose: bool = typer.Option(False, "--verbose", "-v", help="Show verbose SSH output")
+    name: Optional[str] = typer.Argument(None, help="Connection name"),
+    verbose: bool = typer.Option(False, "--verbose", "-v", help="Show verbose SSH output"),
+    profile: bool = typer.Option(False, "--profile", help="Time each phase of the handshake and show a waterfall"),
+    trace_file: Optional[Path] = typer.Option(None, "--trace", help="Append the phase spans to this JSON-lines file"),
+    all_connections: bool = typer.Option(False, "--all", "-a", help="Verify every configured connection at once"),
+    pattern: Optional[str] = typer.Option(None, "--filter", "-f", help="Verify connections whose name or host matches this word or glob"),
+    tags: Optional[List[str]] = typer.Option(None, "--tag", "-t", help="Verify connections with this tag (repeatable)"),
+    group: Optional[str] = typer.Option(None, "--group", "-g", help="Verify every connection in this group"),
+    concurrency: int = typer.Option(DEFAULT_CONCURRENCY, "--concurrency", "-c", help="Maximum logins in flight when verifying many"),
+    as_json: bool = typer.Option(False, "--json", help="With many connections, one JSON object per connection instead of a table")
 ):
     """Verify SSH key connection"""
-    config = config_manager.get_connection(name)
+    from contextlib import nullcontext
+    from ..utils.tracing import Trace, activate
+    if all_connections or pattern or tags or group:
+        if profile or trace_file or verbose:
+            console.print("[yellow]--profile, --trace and --verbose apply to single connections; ignoring them.[/yellow]")
+        verify_keys(pattern, tags, group, concurrency, as_json)
+        return
+    if not name:
+        console.print("[red]Give a connection name, or use --all/--filter/--tag/--group.[/red]")
+        return
+    config = get_config_manager().get_connection(name)
     if not config:
         console.print(f"[red]No connection found with name: {name}[/red]")
         return
 
-    ssh_manager = SSHKeyManager()
+    ssh_manager = get_ssh_manager(config)
     key_path = ssh_manager.get_key_path(name)
     
     if not key_path.exists():
@@ -115,81 +232,1033 @@ def verify_key(
         return
     
     console.print("[yellow]Testing SSH connection...[/yellow]")
-    if ssh_manager.test_connection(config['host'], config['port'], key_path, verbose=verbose):
+    trace = Trace(f"verify-key-{name}") if profile or trace_file else None
+    with activate(trace) if trace is not None else nullcontext():
+        connected = ssh_manager.test_connection(config['host'], config['port'], key_path, verbose=verbose,
+                                                user=connection_user(config))
+    if trace is not None:
+        report_trace(trace, profile, trace_file)
+    if connected:
         console.print("[green]SSH connection successful![/green]")
         console.print("\n[blue]Next steps:[/blue]")
         console.print(f"Run 'python -m connection_manager connect {name}' to establish the tunnel")
     else:
         console.print("[red]SSH connection failed. Please verify your key is properly set up on the server.[/red]")
 
+def verify_keys(pattern: Optional[str], tags: Optional[List[str]], group: Optional[str], concurrency: int,
+                as_json: bool):
+    """Verify the keys of many connections concurrently and report them by login time"""
+    import asyncio
+    from ..core.ssh import SSHKeyManager
+    from ..core.sweep import KeySweep, sort_checks
+    connections = dict(get_config_manager().iter_connections(pattern, tags, group))
+    if not connections:
+        console.print("[yellow]No matching connections configured.[/yellow]")
+        return
+    sweep = KeySweep(SSHKeyManager(), concurrency=concurrency)
+
+    async def run():
+        if as_json:
+            return await sweep.run(connections)
+        with console.status(f"Verifying {len(connections)} keys...") as status:
+            task = asyncio.ensure_future(sweep.run(connections))
+            while not task.done():
+                await asyncio.wait([task], timeout=0.2)
+                status.update(f"Verifying keys... {sweep.done}/{len(connections)}")
+            return task.result()
+
+    started = time.monotonic()
+    checks = sort_checks(asyncio.run(run()))
+    total = time.monotonic() - started
+    if as_json:
+        for check in checks:
+            print(json.dumps(check.to_dict()))
+        return
+
+    table = Table(title="Key Verification")
+    table.add_column("Name", style="cyan")
+    table.add_column("Host", style="green")
+    table.add_column("TCP", justify="right")
+    table.add_column("Login", justify="right", style="yellow")
+    table.add_column("Status")
+    for check in checks:
+        table.add_row(
+            check.name,
+            check.host if check.address in (None, check.host) else f"{check.host} ({check.address})",
+            f"{check.tcp_latency * 1000:.1f}ms" if check.tcp_latency is not None else "-",
+            f"{check.auth_latency * 1000:.0f}ms" if check.auth_latency is not None else "-",
+            "🟢 OK" if check.ok else f"🔴 {check.error}"
+        )
+    console.print(table)
+    verified = sum(1 for check in checks if check.ok)
+    console.print(f"[blue]{verified}/{len(checks)} keys verified in {total:.2f}s[/blue]")
+
 @app.command()
-def list():
+def list(
+    pattern: Optional[str] = typer.Option(None, "--filter", "-f", help="Only names or hosts matching this word or glob"),
+    tags: Optional[List[str]] = typer.Option(None, "--tag", "-t", help="Only connections with this tag (repeatable)"),
+    group: Optional[str] = typer.Option(None, "--group", "-g", help="Only connections in this group"),
+    limit: Optional[int] = typer.Option(None, "--limit", "-n", help="Show at most this many connections"),
+    offset: int = typer.Option(0, "--offset", help="Skip this many matching connections"),
+    as_json: bool = typer.Option(False, "--json", help="Stream one JSON object per line instead of a table")
+):
     """List all configured connections"""
-    connections = config_manager.load_connections()
-    if not connections:
-        console.print("[yellow]No connections configured yet.[/yellow]")
+    if as_json:
+        write_list_json(get_config_manager(), pattern, tags, group, limit, offset)
         return
 
+    connections = get_config_manager().iter_connections(pattern, tags, group, limit, offset)
+
     table = Table(title="Configured Connections")
     table.add_column("Name", style="cyan")
     table.add_column("Host", style="green")
     table.add_column("Port", style="blue")
+    table.add_column("Group")
+    table.add_column("Tags")
     
-    for name, config in connections.items():
+    for name, config in connections:
         table.add_row(
             name,
             config.get("host", "unknown"),
-            str(config.get("port", "unknown"))
+            str(config.get("port", "unknown")),
+            config.get("group") or "",
+            ", ".join(connection_tags(config))
         )
+
+    if not table.rows:
+        if pattern or tags or group or offset:
+            console.print("[yellow]No connections match.[/yellow]")
+        else:
+            console.print("[yellow]No connections configured yet.[/yellow]")
+        return
     
     console.print(table)
 
 @app.command()
 def connect(
-    name: str = typer.Argument(..., help="Connection name"),
-    local_port: int = typer.Option(11434, "--local-port", "-l", help="Local port for Ollama"),
-    foreground: bool = typer.Option(False, "--foreground", "-f", help="Run in foreground mode")
+    name: Optional[str] = typer.Argument(None, help="Connection name"),
+    local_port: Optional[int] = typer.Option(None, "--local-port", "-l", help="Local port for Ollama (default: leased automatically; first port tried in bulk mode)"),
+    foreground: bool = typer.Option(False, "--foreground", "-f", help="Run in foreground instead of handing the tunnel to the supervisor"),
+    timeout: float = typer.Option(DEFAULT_READY_TIMEOUT, "--timeout", "-t", help="Seconds to wait for the tunnel to accept connections"),
+    all_connections: bool = typer.Option(False, "--all", "-a", help="Connect every configured server at once"),
+    group: Optional[str] = typer.Option(None, "--group", "-g", help="Connect every server in this group at once"),
+    concurrency: int = typer.Option(DEFAULT_CONCURRENCY, "--concurrency", "-c", help="Maximum handshakes in flight in bulk mode"),
+    use_socket: bool = typer.Option(False, "--socket", "-s", help="Forward Ollama to a Unix socket in ~/.connections/sockets/ instead of a port"),
+    profile: bool = typer.Option(False, "--profile", help="Time each phase of bring-up and show a waterfall"),
+    trace_file: Optional[Path] = typer.Option(None, "--trace", help="Append the phase spans to this JSON-lines file")
 ):
     """Connect to a configured server"""
-    config = config_manager.get_connection(name)
+    if use_socket and local_port is not None:
+        console.print("[red]Use either --socket or --local-port, not both.[/red]")
+        return
+    if all_connections or group:
+        if profile or trace_file:
+            console.print("[yellow]--profile and --trace apply to single connections; ignoring them.[/yellow]")
+        connect_bulk(group, local_port, timeout, concurrency, use_socket)
+        return
+    if not name:
+        console.print("[red]Give a connection name, or use --all/--group.[/red]")
+        return
+    if not (profile or trace_file):
+        connect_single(name, local_port, foreground, timeout, use_socket)
+        return
+
+    from ..utils.tracing import Trace, activate
+    trace = Trace(f"connect-{name}")
+    reported = False
+
+    def report():
+        nonlocal reported
+        if not reported:
+            reported = True
+            report_trace(trace, profile, trace_file)
+
+    with activate(trace):
+        # In the foreground the tunnel stays up until Ctrl+C, so report once it is ready
+        connect_single(name, local_port, foreground, timeout, use_socket, on_connected=report)
+    report()
+
+def connect_single(name: str, local_port: Optional[int], foreground: bool, timeout: float, use_socket: bool,
+                   on_connected=None):
+    """Connect one server, in this process or through the supervisor"""
+    from ..core.forwards import apply_leases, forwards_from_config, lease_keys, lease_requests
+    from ..core.ports import PortAllocationError, PortAllocator
+    from ..core.sockets import ForwardSocketError, prepare_socket, remove_sockets
+    from ..utils.tracing import span
+    with span("config"):
+        config = get_config_manager().get_connection(name)
     if not config:
         console.print(f"[red]No connection found with name: {name}[/red]")
         return
 
-    ssh_manager = SSHKeyManager()
+    ssh_manager = get_ssh_manager(config)
     key_path = ssh_manager.get_key_path(name)
     
     if not key_path.exists():
         console.print(f"[red]No SSH key found for {name}. Run 'setup-key {name}' first.[/red]")
         return
     
+    if not foreground:
+        connect_background(name, local_port, timeout, use_socket)
+        return
+
+    try:
+        forwards = forwards_from_config(config, local_port, connection=name, use_socket=use_socket)
+        for forward in forwards:
+            if forward.local_socket is not None:
+                prepare_socket(forward.local_socket)
+    except (ValueError, ForwardSocketError) as e:
+        console.print(f"[red]{e}[/red]")
+        return
+    ports = PortAllocator()
+    requests = lease_requests(name, forwards)
+    try:
+        # Ports asked for explicitly, here or in the config, must be honoured
+        strict = any(port is not None for port in requests.values())
+        with span("ports.lease"):
+            apply_leases(name, forwards, ports.allocate_many(requests, strict=strict))
+    except PortAllocationError as e:
+        console.print(f"[red]{e}[/red]")
+        return
+    try:
+        connect_foreground(name, config, key_path, forwards, timeout, ports, on_connected)
+    finally:
+        ports.release(*lease_keys(name, forwards))
+        remove_sockets(forward.local_socket for forward in forwards)
+
+def connect_foreground(name: str, config: dict, key_path: Path, forwards, timeout: float, ports,
+                       on_connected=None):
+    """Run the tunnel in this process until it exits or Ctrl+C"""
+    from rich.progress import Progress
+    from ..core.forwards import lease_keys
+    from ..utils.tracing import current_trace, span
+    ssh_manager = get_ssh_manager(config)
+    user = connection_user(config)
+    # A connection with replicas has a master per address; look for the last one used
+    replica = last_replica(name, config)
+    master_address = replica.address if replica is not None else None
+    master_port = replica.port if replica is not None else config['port']
     with Progress() as progress:
         task = progress.add_task(f"Connecting to {name}...", total=100)
         
-        # Setup the tunnel
-        tunnel_process = ssh_manager.setup_tunnel(
-            config['host'],
-            config['port'],
-            key_path,
-            local_port=local_port
-        )
-        
-        if tunnel_process is None:
-            console.print("[red]Failed to establish tunnel.[/red]")
-            return
+        # Reuse a warm master connection instead of paying for a new handshake
+        with span("ssh.master_check"):
+            on_master = ssh_manager.master_running(config['host'], master_port, user, master_address)
+        if on_master:
+            import asyncio
+            from ..core.readiness import wait_for_forward
+            tunnel_process = None
+            added = []
+            deadline = time.monotonic() + timeout
+            for forward in forwards:
+                with span("ssh.master_forward", forward=forward.name):
+                    ok = ssh_manager.add_forward(config['host'], master_port, forward=forward, user=user,
+                                                 address=master_address)
+                    if ok:
+                        # Bound as far as the master knows, so cancel it too if it does not answer
+                        added.append(forward)
+                        # The master may accept the request and still fail to bind, or be on its way out
+                        ok = asyncio.run(wait_for_forward(forward, deadline))
+                        if not ok:
+                            console.print(f"[red]Forward {forward.name} on master connection: "
+                                          f"not accepting connections after {timeout:g}s[/red]")
+                if not ok:
+                    for done in added:
+                        ssh_manager.cancel_forward(config['host'], master_port, forward=done, user=user,
+                                                   address=master_address)
+                    console.print("[red]Failed to establish tunnel.[/red]")
+                    return
+        else:
+            replicas = rank_replicas(name, config)
+            if replicas == []:
+                console.print("[red]Failed to establish tunnel.[/red]")
+                return
+            # Setup the tunnel, trying the next fastest replica if one fails
+            for candidate in replicas or [None]:
+                started = time.monotonic()
+                tunnel_process = ssh_manager.setup_tunnel(
+                    config['host'],
+                    candidate.port if candidate is not None else config['port'],
+                    key_path,
+                    ready_timeout=timeout,
+                    forwards=forwards,
+                    address=candidate.address if candidate is not None else None,
+                    user=user
+                )
+                if tunnel_process is not None:
+                    break
+            if replicas:
+                from ..core.failover import HostHistory
+                HostHistory().record(name, replicas, candidate if tunnel_process is not None else None,
+                                     time.monotonic() - started)
+                if tunnel_process is not None:
+                    console.print(f"[green]Using replica {candidate.host} ({candidate.address})[/green]")
+            
+            if tunnel_process is None:
+                console.print("[red]Failed to establish tunnel.[/red]")
+                return
+            with span("ports.attach"):
+                ports.attach(dict.fromkeys(lease_keys(name, forwards), tunnel_process.pid))
         
         progress.update(task, completed=100)
 
     console.print(f"[green]Successfully connected to {name}![/green]")
-    console.print(f"[blue]Ollama is available at http://localhost:{local_port}[/blue]")
+    show_forwards([forward.to_dict() for forward in forwards])
+    if current_trace() is not None:
+        first_health_check(next((forward for forward in forwards if forward.primary), None))
+    if on_connected is not None:
+        on_connected()
     
-    if foreground:
-        console.print("\nPress Ctrl+C to disconnect...")
-        try:
+    console.print("\nPress Ctrl+C to disconnect...")
+    try:
+        if tunnel_process is not None:
             tunnel_process.wait()
-        except KeyboardInterrupt:
+        else:
+            while ssh_manager.master_running(config['host'], master_port, user, master_address):
+                time.sleep(5)
+    except KeyboardInterrupt:
+        if tunnel_process is not None:
             tunnel_process.terminate()
-            console.print("\n[yellow]Connection terminated.[/yellow]")
+            tunnel_process.wait()
+        else:
+            for forward in forwards:
+                ssh_manager.cancel_forward(config['host'], master_port, forward=forward, user=user,
+                                           address=master_address)
+        console.print("\n[yellow]Connection terminated.[/yellow]")
+
+def last_replica(name: str, config: dict):
+    """The replica a connection with several last went through, or None"""
+    from ..core.failover import HostHistory, connection_hosts
+    if len(connection_hosts(config)) < 2:
+        return None
+    return HostHistory().chosen(name)
+
+def rank_replicas(name: str, config: dict):
+    """Reachable replicas of a connection, historically fastest first
+
+    None for a connection with a single host; an empty list, after saying
+    why, when none of its replicas answers.
+    """
+    import asyncio
+    from ..core.failover import HostHistory, NoReplica, connection_hosts, select
+    hosts = connection_hosts(config)
+    if len(hosts) < 2:
+        return None
+    history = HostHistory()
+    try:
+        return asyncio.run(select(name, hosts, history))
+    except NoReplica as e:
+        history.record(name, e.candidates, None)
+        console.print(f"[red]{e}[/red]")
+        return []
+
+def first_health_check(forward):
+    """Time the first Ollama probe through a tunnel that just came up"""
+    from ..utils.health import probe_ollama
+    from ..utils.tracing import span
+    if forward is None or forward.kind != "local":
+        return
+    with span("health") as health:
+        result = probe_ollama(forward.local_socket or forward.local_port)
+        health.attributes.update(state=result["state"], error=result["error"])
+
+def report_trace(trace, profile: bool, trace_file: Optional[Path]):
+    """Show the phases as a waterfall with --profile and save them as JSON lines"""
+    records = trace.to_records()
+    if not records:
+        return
+    if profile:
+        show_waterfall(records)
+    try:
+        path = trace.write(trace_file)
+    except OSError as e:
+        console.print(f"[red]Could not write trace: {e}[/red]")
+        return
+    console.print(f"[blue]Trace written to {path}; 'export-trace {path}' converts it for chrome://tracing[/blue]")
+
+def show_waterfall(records: List[dict]):
+    """Every span as a bar on one timeline, indented under its parent"""
+    from ..utils.tracing import depths
+    levels = depths(records)
+    begin = min(record["start"] for record in records)
+    total = max(max(record["start"] + record["duration"] for record in records) - begin, 1e-9)
+    table = Table(title=f"Phases ({total * 1000:.0f}ms)")
+    table.add_column("Phase", style="cyan")
+    table.add_column("Start", style="blue", justify="right")
+    table.add_column("Duration", style="yellow", justify="right")
+    table.add_column("Timeline", style="green")
+    for record in sorted(records, key=lambda record: (record["start"], levels[record["id"]])):
+        offset = min(WATERFALL_WIDTH - 1, int((record["start"] - begin) / total * WATERFALL_WIDTH))
+        length = max(1, min(WATERFALL_WIDTH - offset, round(record["duration"] / total * WATERFALL_WIDTH)))
+        phase = "  " * levels[record["id"]] + record["name"]
+        error = record["attributes"].get("error")
+        if error:
+            phase += f" [red]({error})[/red]"
+        table.add_row(
+            phase,
+            f"+{(record['start'] - begin) * 1000:.1f}ms",
+            f"{record['duration'] * 1000:.1f}ms",
+            " " * offset + "█" * length
+        )
+    console.print(table)
+
+def describe_forward(forward: dict) -> str:
+    if forward.get("local_socket"):
+        return f"{forward['local_socket']} -> {forward['remote_host']}:{forward['remote_port']}"
+    if forward["type"] == "dynamic":
+        return f"SOCKS proxy on localhost:{forward['local_port']}"
+    if forward["type"] == "remote":
+        return f"server port {forward['remote_port']} -> localhost:{forward['local_port']}"
+    return f"localhost:{forward['local_port']} -> {forward['remote_host']}:{forward['remote_port']}"
+
+def show_forwards(forwards: List[dict]):
+    """Tell the user where each forward of a new tunnel can be reached"""
+    for forward in forwards:
+        if forward["name"] == "ollama" and forward.get("local_socket"):
+            console.print(f"[blue]Ollama is available on the Unix socket {forward['local_socket']}[/blue]")
+            console.print(f"[blue]Try: curl --unix-socket {forward['local_socket']} http://localhost/api/tags[/blue]")
+        elif forward["name"] == "ollama" and forward["type"] == "local":
+            console.print(f"[blue]Ollama is available at http://localhost:{forward['local_port']}[/blue]")
+        else:
+            console.print(f"[blue]{forward['name']}: {describe_forward(forward)}[/blue]")
+
+def connect_background(name: str, local_port: Optional[int], timeout: float, use_socket: bool = False):
+    """Hand the tunnel to the supervisor, starting it if needed"""
+    from ..core.client import LOG_PATH, REQUEST_TIMEOUT, SupervisorError, send_request, start_supervisor
+    from ..utils.tracing import current_trace, span
+    with span("supervisor.start"):
+        started = start_supervisor()
+    if not started:
+        console.print(f"[red]Could not start the supervisor. See {LOG_PATH} for details.[/red]")
+        return
+
+    trace = current_trace()
+    try:
+        with console.status(f"Connecting to {name}..."), span("supervisor.connect") as request:
+            response = send_request(
+                "connect",
+                timeout=timeout + REQUEST_TIMEOUT,
+                name=name,
+                local_port=local_port,
+                socket=use_socket,
+                ready_timeout=timeout,
+                # The supervisor times its phases under this span
+                trace={"id": trace.id, "parent": request.id} if trace is not None else None
+            )
+    except SupervisorError as e:
+        console.print(f"[red]{e}[/red]")
+        return
+    if trace is not None:
+        trace.extend(response.get("trace", []))
+
+    if not response.get("ok"):
+        console.print(f"[red]Failed to establish tunnel: {response.get('error')}[/red]")
+        return
+
+    tunnel = response["tunnel"]
+    console.print(f"[green]Connection started in background in {tunnel['elapsed']:.2f}s[/green]")
+    show_forwards(tunnel["forwards"])
+    console.print(f"\nUse 'python -m connection_manager status {name}' to check status")
+    console.print(f"Use 'python -m connection_manager stop {name}' to disconnect")
+
+@app.command()
+def status(
+    name: Optional[str] = typer.Argument(None, help="Connection name"),
+    health: bool = typer.Option(False, "--health", help="Show cached Ollama health and probe latency"),
+    forwards: bool = typer.Option(False, "--forwards", help="Check and list every forward (the default for a single connection)"),
+    models: bool = typer.Option(False, "--models", "-m", help="Show which models each server has loaded or on disk"),
+    as_json: bool = typer.Option(False, "--json", help="Print one JSON object per tunnel instead of a table")
+):
+    """Check status of connections"""
+    from ..core.client import SupervisorError, send_request
+    if as_json:
+        write_status_json(name, health)
+        return
+
+    forwards = forwards or name is not None
+    try:
+        response = send_request("status", timeout=5.0, name=name, health=health, forwards=forwards, models=models)
+    except SupervisorError:
+        response = {"ok": True, "tunnels": []}
+
+    tunnels = response.get("tunnels", [])
+    if not tunnels and not name:
+        console.print("[yellow]No active connections[/yellow]")
+        return
+
+    table = Table(title="Active Connections")
+    table.add_column("Name", style="cyan")
+    table.add_column("PID", style="blue")
+    table.add_column("Local", style="blue")
+    table.add_column("Status", style="green")
+    table.add_column("Reconnects", style="yellow")
+    table.add_column("Downtime", style="yellow")
+    table.add_column("RSS", style="magenta")
+    table.add_column("CPU", style="magenta")
+    table.add_column("FDs", style="magenta")
+    table.add_column("Traffic", style="blue")
+    if health:
+        table.add_column("Health")
+        table.add_column("Latency", style="blue")
+
+    if name and not tunnels:
+        table.add_row(name, "-", "-", "🔴 Stopped", "-", "-", "-", "-", "-", "-", *(["-", "-"] if health else []))
+    for tunnel in tunnels:
+        pid = str(tunnel["pid"]) if tunnel["pid"] else "master"
+        if tunnel["up"]:
+            state = "🟢 Running (external)" if tunnel.get("external") else "🟢 Running"
+        elif tunnel["reconnecting"]:
+            state = "🟡 Reconnecting"
+        else:
+            state = "🔴 Stopped"
+        row = [
+            tunnel["name"],
+            pid,
+            str(tunnel["local_port"] or tunnel.get("local_socket") or "-"),
+            state,
+            str(tunnel["reconnects"]),
+            f"{tunnel['downtime']:.1f}s",
+            *format_process(tunnel.get("process"))
+        ]
+        if health:
+            row.extend(format_health(tunnel.get("health")))
+        table.add_row(*row)
+
+    console.print(table)
+    if forwards and tunnels:
+        show_forward_status(tunnels)
+    if models and tunnels:
+        show_placement(response.get("placement", {}), tunnels)
+    if response.get("gateway") and not name:
+        show_gateway_status(response["gateway"])
+
+def show_forward_status(tunnels: List[dict]):
+    """One row per forward, with the result of the supervisor's live check"""
+    table = Table(title="Forwards")
+    table.add_column("Connection", style="cyan")
+    table.add_column("Forward", style="cyan")
+    table.add_column("Type")
+    table.add_column("Route", style="blue")
+    table.add_column("Status")
+    for tunnel in tunnels:
+        for forward in tunnel.get("forwards", []):
+            if forward["up"]:
+                state = "🟢 Up"
+            elif forward["up"] is None:
+                state = "⏳ Starting"
+            else:
+                state = f"🔴 {forward['error'] or 'Not accepting connections'}"
+            table.add_row(tunnel["name"], forward["name"], forward["type"], describe_forward(forward), state)
+    console.print(table)
+
+def format_bytes(size: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+def show_gateway_status(gateway: dict):
+    """One row per gateway backend with its share of the traffic"""
+    table = Table(title=f"Gateway on http://localhost:{gateway['port']}")
+    table.add_column("Backend", style="cyan")
+    table.add_column("Endpoint", style="blue")
+    table.add_column("Status")
+    table.add_column("Running", style="yellow")
+    table.add_column("Queued", style="yellow")
+    table.add_column("Wait p95", style="magenta")
+    table.add_column("Requests", style="blue")
+    table.add_column("Errors", style="red")
+    table.add_column("Ejections", style="yellow")
+    for backend in gateway["backends"]:
+        state = "🟢 Serving" if backend["healthy"] else f"🔴 Ejected: {backend['last_error']}"
+        admission = backend["admission"]
+        running = sum(admission["running"].values())
+        if admission["max_concurrent"]:
+            running = f"{running}/{admission['max_concurrent']}"
+        queued = admission["queued"]
+        waits = [admission["priorities"][priority]["wait_p95"] for priority in ("interactive", "batch")]
+        table.add_row(
+            backend["name"],
+            str(backend["endpoint"]),
+            state,
+            str(running),
+            f"{queued['interactive']} / {queued['batch']}",
+            " / ".join("-" if wait is None else f"{wait * 1000:.0f}ms" for wait in waits),
+            str(backend["requests"]),
+            str(backend["errors"]),
+            str(backend["ejections"])
+        )
+    console.print(table)
+    console.print(f"[blue]{gateway['requests']} requests, {gateway['retries']} retried, "
+                  f"{gateway['failures']} failed, {gateway['rejected']} rejected by full queues[/blue]")
+    console.print("[dim]Queued and Wait p95 show interactive / batch requests[/dim]")
+    routed = gateway.get("routed", {})
+    if any(routed.values()):
+        console.print(f"[blue]Model requests sent where the model was loaded: {routed['loaded']}, "
+                      f"on disk: {routed['installed']}, elsewhere: {routed['elsewhere']}[/blue]")
+    cache = gateway.get("cache")
+    if cache is not None:
+        rate = f" ({cache['hit_rate']:.0%} answered locally)" if cache["hit_rate"] is not None else ""
+        console.print(f"[blue]Cache: {cache['hits']} hits, {cache['disk_hits']} from disk, "
+                      f"{cache['coalesced']} coalesced, {cache['misses']} misses{rate}; "
+                      f"{cache['entries']} entries, {format_bytes(cache['size'])} of "
+                      f"{format_bytes(cache['max_size'])} in memory[/blue]")
+        if cache["disk"]:
+            console.print(f"[blue]Disk cache: {cache['disk_entries']} entries, "
+                          f"{format_bytes(cache['disk_size'])}[/blue]")
+
+def show_placement(placement: dict, tunnels: List[dict]):
+    """Where each model is: loaded in memory, or only on disk"""
+    if not placement:
+        pending = any(tunnel.get("models") is None for tunnel in tunnels if tunnel["up"])
+        console.print("[yellow]Model inventory is being fetched; try again shortly.[/yellow]" if pending
+                      else "[yellow]No models found on these servers.[/yellow]")
+        return
+    table = Table(title="Model Placement")
+    table.add_column("Model", style="cyan")
+    table.add_column("Loaded On", style="green")
+    table.add_column("On Disk Only", style="blue")
+    for model, where in placement.items():
+        table.add_row(model, ", ".join(where["loaded"]) or "-", ", ".join(where["installed"]) or "-")
+    console.print(table)
+    for tunnel in tunnels:
+        inventory = tunnel.get("models")
+        if inventory and inventory["error"]:
+            console.print(f"[yellow]{tunnel['name']}: could not list models: {inventory['error']}[/yellow]")
+
+def format_process(process: Optional[dict]) -> List[str]:
+    """RSS, CPU, open fds (sockets) and bytes in/out of a tunnel's ssh process"""
+    if process is None:
+        return ["-", "-", "-", "-"]
+    cpu = f"{process['cpu_seconds']:.1f}s"
+    if process["cpu_percent"] is not None:
+        cpu += f" ({process['cpu_percent']:.0f}%)"
+    fds = "-" if process["fds"] is None else f"{process['fds']} ({process['sockets']} sock)"
+    traffic = "-" if process["bytes_read"] is None else \
+        f"{format_bytes(process['bytes_read'])} / {format_bytes(process['bytes_written'])}"
+    return [format_bytes(process["rss"]), cpu, fds, traffic]
+
+def format_health(result: Optional[dict]):
+    """Render a cached probe result as health and latency cells"""
+    if result is None:
+        return "⏳ Checking", "-"
+    labels = {"up": "🟢 Up", "degraded": "🟡 Degraded", "down": "🔴 Down"}
+    age = time.time() - result["checked_at"]
+    return labels[result["state"]], f"{result['latency'] * 1000:.0f}ms ({age:.0f}s ago)"
+
+@app.command()
+def stop(
+    name: str = typer.Argument(..., help="Connection name"),
+    force: bool = typer.Option(False, "--force", "-f", help="Force stop without confirmation")
+):
+    """Stop a running connection"""
+    from ..core.client import SupervisorError, send_request
+    if not force and not typer.confirm(f"Stop connection {name}?"):
+        return
+
+    try:
+        response = send_request("stop", name=name)
+    except SupervisorError:
+        response = {"ok": False, "error": f"No active connection found for {name}"}
+
+    if response.get("ok"):
+        console.print(f"[green]Successfully stopped connection {name}[/green]")
+    else:
+        console.print(f"[yellow]{response.get('error')}[/yellow]")
+
+@app.command()
+def gateway(
+    names: Optional[List[str]] = typer.Argument(None, help="Connections to spread requests over (default: all)"),
+    group: Optional[str] = typer.Option(None, "--group", "-g", help="Use every server in this group"),
+    port: int = typer.Option(DEFAULT_GATEWAY_PORT, "--port", "-p", help="Local port the gateway listens on"),
+    retries: int = typer.Option(DEFAULT_GATEWAY_RETRIES, "--retries", help="Other backends to try when an idempotent request fails"),
+    timeout: float = typer.Option(DEFAULT_READY_TIMEOUT, "--timeout", "-t", help="Seconds to wait for tunnels that are not up yet"),
+    cache: bool = typer.Option(False, "--cache", help="Answer repeated embeddings, model details and model lists from a cache"),
+    cache_size: int = typer.Option(DEFAULT_CACHE_SIZE_MB, "--cache-size", help="Megabytes of responses to keep in memory"),
+    disk_cache: bool = typer.Option(False, "--disk-cache", help="Also keep cached responses on disk, implies --cache"),
+    disk_cache_size: int = typer.Option(DEFAULT_DISK_CACHE_SIZE_MB, "--disk-cache-size", help="Megabytes of responses to keep on disk"),
+    max_concurrent: Optional[int] = typer.Option(None, "--max-concurrent", "-c", help="Requests each server runs at once; the rest queue (a connection's max_concurrent wins)"),
+    max_queue: int = typer.Option(DEFAULT_MAX_QUEUE, "--max-queue", help="Requests of each priority that may wait per server before new ones are rejected"),
+    reserve: int = typer.Option(1, "--reserve", help="Slots per server that only interactive requests may use"),
+    batch_port: Optional[int] = typer.Option(None, "--batch-port", help="Also listen here, treating requests as batch work"),
+    shutdown: bool = typer.Option(False, "--stop", help="Stop the running gateway, leaving its tunnels up")
+):
+    """Serve one Ollama endpoint that balances requests across several tunnels"""
+    from ..core.bulk import select_connections
+    from ..core.cache import CACHE_DIR
+    from ..core.client import LOG_PATH, REQUEST_TIMEOUT, SupervisorError, send_request, start_supervisor
+    if shutdown:
+        try:
+            response = send_request("gateway_stop")
+        except SupervisorError:
+            response = {"ok": False, "error": "Gateway is not running"}
+        if response.get("ok"):
+            console.print("[green]Gateway stopped.[/green]")
+        else:
+            console.print(f"[yellow]{response.get('error')}[/yellow]")
+        return
+
+    if not names:
+        names = [name for name in select_connections(get_config_manager().load_connections(), group)]
+    if not names:
+        console.print("[yellow]No matching connections configured.[/yellow]")
+        return
+    if not start_supervisor():
+        console.print(f"[red]Could not start the supervisor. See {LOG_PATH} for details.[/red]")
+        return
+
+    try:
+        with console.status(f"Starting gateway across {len(names)} connections..."):
+            response = send_request("gateway", timeout=timeout + REQUEST_TIMEOUT,
+                                    names=names, port=port, retries=retries,
+                                    cache_size=cache_size if cache or disk_cache else 0,
+                                    disk_cache=disk_cache, disk_cache_size=disk_cache_size,
+                                    max_concurrent=max_concurrent, max_queue=max_queue, reserve=reserve,
+                                    batch_port=batch_port)
+    except SupervisorError as e:
+        console.print(f"[red]{e}[/red]")
+        return
+
+    for name, error in response.get("errors", {}).items():
+        console.print(f"[yellow]{name}: {error}[/yellow]")
+    if not response.get("ok"):
+        console.print(f"[red]Failed to start gateway: {response.get('error')}[/red]")
+        return
+    gateway = response["gateway"]
+    healthy = sum(1 for backend in gateway["backends"] if backend["healthy"])
+    console.print(f"[green]Gateway listening on http://localhost:{gateway['port']} "
+                  f"({healthy}/{len(gateway['backends'])} backends healthy)[/green]")
+    console.print(f"[blue]Point clients at it with OLLAMA_HOST=http://localhost:{gateway['port']}[/blue]")
+    if gateway["batch_port"]:
+        console.print(f"[blue]Batch jobs can use OLLAMA_HOST=http://localhost:{gateway['batch_port']} "
+                      f"or send an X-Priority: batch header[/blue]")
+    if gateway["cache"] is not None:
+        where = f"in memory and in {CACHE_DIR}" if gateway["cache"]["disk"] else "in memory"
+        console.print(f"[blue]Caching embeddings, model details and model lists {where}[/blue]")
+    console.print("\nUse 'python -m connection_manager status' to see how requests are spread")
+    console.print("Use 'python -m connection_manager gateway --stop' to stop it")
+
+@app.command()
+def daemon(
+    shutdown: bool = typer.Option(False, "--stop", help="Stop the running supervisor and all its tunnels"),
+    watchdog: bool = typer.Option(True, "--watchdog/--no-watchdog", help="Restart tunnels that die or fail health checks"),
+    metrics_port: Optional[int] = typer.Option(None, "--metrics-port", help="Serve Prometheus metrics on this local port"),
+    metrics_file: Optional[Path] = typer.Option(None, "--metrics-file", help="Keep a textfile-collector file with current metrics")
+):
+    """Run the tunnel supervisor in the foreground"""
+    import asyncio
+    from ..core.client import SupervisorError, send_request, supervisor_running
+    from ..core.supervisor import Supervisor
+    if shutdown:
+        try:
+            send_request("shutdown")
+            console.print("[green]Supervisor stopped.[/green]")
+        except SupervisorError:
+            console.print("[yellow]Supervisor is not running.[/yellow]")
+        return
+
+    if supervisor_running():
+        console.print("[yellow]Supervisor is already running.[/yellow]")
+        return
+
+    supervisor = Supervisor(watchdog=watchdog, metrics_port=metrics_port, metrics_file=metrics_file)
+    asyncio.run(supervisor.run())
+
+@app.command()
+def metrics(
+    output: Optional[Path] = typer.Option(None, "--output", "-o", help="Write to a textfile-collector file instead of stdout")
+):
+    """Print tunnel and Ollama metrics in Prometheus text format"""
+    from ..core.client import SupervisorError, send_request
+    from ..utils.metrics import render_metrics, write_textfile
+    try:
+        text = send_request("metrics", timeout=5.0)["metrics"]
+    except SupervisorError:
+        # Nothing is running, but configured connections still report as down
+        text = render_metrics([], get_config_manager().load_connections().keys())
+
+    if output:
+        write_textfile(output, text)
+        console.print(f"[green]Metrics written to {output}[/green]")
+    else:
+        print(text, end="")
+
+@app.command()
+def stats(
+    name: str = typer.Argument(..., help="Connection name"),
+    window: str = typer.Option("1h", "--window", "-w", help="How far back to look, such as 90s, 30m, 1h or 1d"),
+    as_json: bool = typer.Option(False, "--json", help="Print the summary and every sample as JSON")
+):
+    """Show a connection's recorded traffic, read from its stats file without the supervisor"""
+    from ..core.telemetry import load_stats, parse_window
+    try:
+        seconds = parse_window(window)
+    except ValueError as e:
+        console.print(f"[red]{e}[/red]")
+        return
+    try:
+        data = load_stats(name, seconds)
+    except FileNotFoundError:
+        console.print(f"[yellow]No stats recorded for {name}; the supervisor records the tunnels it runs.[/yellow]")
+        return
+    except (OSError, ValueError) as e:
+        console.print(f"[red]Could not read stats for {name}: {e}[/red]")
+        return
+
+    samples, summary = data["samples"], data["summary"]
+    if as_json:
+        print(json.dumps({**{key: data[key] for key in ("name", "interval", "since")}, "summary": summary,
+                          "samples": [sample.to_dict() for sample in samples]}))
+        return
+    if not samples:
+        console.print(f"[yellow]No samples for {name} in the last {window}[/yellow]")
+        return
+
+    def rate(value: Optional[float]) -> str:
+        return "-" if value is None else f"{format_bytes(value)}/s"
+
+    def millis(value: Optional[float]) -> str:
+        return "-" if value is None else f"{value * 1000:.0f}ms"
+
+    table = Table(title=f"{name}, last {window}")
+    table.add_column("Metric", style="cyan")
+    for column in ("Mean", "p50", "p95", "p99", "Max"):
+        table.add_column(column, style="blue")
+    for label, spread, fmt in (("In", summary["rate_in"], rate), ("Out", summary["rate_out"], rate),
+                               ("Probe latency", summary["latency"], millis)):
+        table.add_row(label, *(fmt(spread[key]) for key in ("mean", "p50", "p95", "p99", "max")))
+    connections = summary["connections"]
+    table.add_row(
+        "Connections", "-" if connections["mean"] is None else f"{connections['mean']:.1f}", "-", "-", "-",
+        "-" if connections["max"] is None else str(connections["max"])
+    )
+    table.add_row("Requests", f"{summary['request_rate']:.2f}/s", "-", "-", "-", "-")
+    console.print(table)
+
+    until = time.time()
+    width = min(SPARKLINE_WIDTH, max(1, round(seconds / data["interval"])))
+    for label, value in (("In", lambda sample: sample.bytes_in), ("Out", lambda sample: sample.bytes_out),
+                         ("Latency", lambda sample: sample.latency),
+                         ("Connections", lambda sample: sample.connections),
+                         ("Requests", lambda sample: sample.requests)):
+        console.print(f"{label:<12} [green]{sparkline(samples, value, data['since'], until, width)}[/green]")
+    console.print(f"[blue]{summary['samples']} samples every {data['interval']:.0f}s, "
+                  f"up {summary['uptime']:.0%} of them; {format_bytes(summary['bytes_in'])} read, "
+                  f"{format_bytes(summary['bytes_out'])} written, {summary['requests']} gateway requests[/blue]")
+    console.print("[dim]In and Out are bytes the tunnel's ssh process read and wrote, both legs included[/dim]")
+
+def sparkline(samples, value, since: float, until: float, width: int) -> str:
+    """One bar per slice of the window, scaled to the highest; blank where nothing was recorded"""
+    slices = [[] for _ in range(width)]
+    span = max(until - since, 1e-9)
+    for sample in samples:
+        measured = value(sample)
+        if measured is not None:
+            slices[max(0, min(width - 1, int((sample.timestamp - since) / span * width)))].append(measured)
+    means = [sum(values) / len(values) if values else None for values in slices]
+    top = max((mean for mean in means if mean is not None), default=0)
+    return "".join(
+        " " if mean is None else SPARKS[round(mean / top * (len(SPARKS) - 1)) if top > 0 else 0]
+        for mean in means
+    )
+
+@app.command()
+def export_trace(
+    path: Path = typer.Argument(..., help="JSON-lines trace written by --profile or --trace"),
+    output: Optional[Path] = typer.Option(None, "--output", "-o", help="Where to write it (default: the trace's name with .json)")
+):
+    """Convert a trace to Chrome's trace format, for chrome://tracing or ui.perfetto.dev"""
+    from ..utils.tracing import load_trace, to_chrome
+    try:
+        records = load_trace(path)
+    except (OSError, ValueError) as e:
+        console.print(f"[red]Could not read trace {path}: {e}[/red]")
+        return
+    output = output or path.with_suffix(".json")
+    output.write_text(json.dumps(to_chrome(records)))
+    console.print(f"[green]{len(records)} spans written to {output}[/green]")
+
+def connect_bulk(group: Optional[str], base_port: Optional[int], timeout: float, concurrency: int,
+                 use_socket: bool = False):
+    """Bring up many tunnels concurrently and hold them until interrupted"""
+    import asyncio
+    from ..core.bulk import BulkConnector, select_connections
+    from ..core.ports import DEFAULT_PORT_RANGE, PortAllocationError, PortAllocator
+    from ..core.ssh import SSHKeyManager
+    connections = select_connections(get_config_manager().load_connections(), group)
+    if not connections:
+        console.print("[yellow]No matching connections configured.[/yellow]")
+        return
+
+    # --local-port moves the start of the range ports are leased from
+    port_range = (base_port, base_port + DEFAULT_PORT_RANGE[1] - DEFAULT_PORT_RANGE[0]) if base_port else None
+    connector = BulkConnector(SSHKeyManager(), concurrency=concurrency, timeout=timeout,
+                              ports=PortAllocator(port_range), use_socket=use_socket)
+
+    async def run():
+        started = time.monotonic()
+        with console.status(f"Connecting to {len(connections)} servers..."):
+            tunnels = await connector.start_all(connections)
+        show_bulk_summary(tunnels, time.monotonic() - started)
+
+        if any(tunnel.is_up for tunnel in tunnels):
+            console.print("\nPress Ctrl+C to disconnect all...")
+            await connector.hold()
+
+    try:
+        asyncio.run(run())
+    except (PortAllocationError, ValueError) as e:
+        console.print(f"[red]{e}[/red]")
+    except KeyboardInterrupt:
+        console.print("\n[yellow]Connections terminated.[/yellow]")
+
+def show_bulk_summary(tunnels, total: float):
+    """Display the outcome of a bulk connect"""
+    table = Table(title="Bulk Connect")
+    table.add_column("Name", style="cyan")
+    table.add_column("Host", style="green")
+    table.add_column("Local", style="blue")
+    table.add_column("Time", style="yellow")
+    table.add_column("Status")
+    
+    for tunnel in sorted(tunnels, key=lambda t: t.elapsed):
+        status = "🟢 Connected" if tunnel.is_up else f"🔴 {tunnel.error}"
+        table.add_row(
+            tunnel.name,
+            tunnel.host or tunnel.config.get("host", "unknown"),
+            str(tunnel.endpoint),
+            f"{tunnel.elapsed:.2f}s",
+            status
+        )
+    
+    console.print(table)
+    connected = sum(1 for tunnel in tunnels if tunnel.is_up)
+    console.print(f"[blue]{connected}/{len(tunnels)} connected in {total:.2f}s[/blue]")
+
+@app.command()
+def warm(
+    name: str = typer.Argument(..., help="Connection name"),
+    persist: Optional[str] = typer.Option(None, "--persist", "-p", help="How long the idle master stays open (ssh ControlPersist)")
+):
+    """Open the SSH master connection ahead of time"""
+    config = get_config_manager().get_connection(name)
+    if not config:
+        console.print(f"[red]No connection found with name: {name}[/red]")
+        return
+
+    ssh_manager = get_ssh_manager(config)
+    key_path = ssh_manager.get_key_path(name)
+    
+    if not key_path.exists():
+        console.print(f"[red]No SSH key found for {name}. Run 'setup-key {name}' first.[/red]")
+        return
+    
+    user = connection_user(config)
+    # A connection with replicas has a master per address; connect looks for the last one used
+    replica = last_replica(name, config)
+    if ssh_manager.master_running(config['host'], replica.port if replica is not None else config['port'],
+                                  user, replica.address if replica is not None else None):
+        console.print(f"[green]Master connection for {name} is already open.[/green]")
+        return
+    replicas = rank_replicas(name, config)
+    if replicas == []:
+        console.print("[red]Failed to open master connection.[/red]")
+        return
+    replica = replicas[0] if replicas else None
+
+    if ssh_manager.open_master(config['host'], replica.port if replica is not None else config['port'], key_path,
+                               persist=persist, user=user, address=replica.address if replica is not None else None):
+        if replicas:
+            from ..core.failover import HostHistory
+            HostHistory().record(name, replicas, replica)
+        console.print(f"[green]Master connection for {name} is open.[/green]")
+        console.print(f"Run 'python -m connection_manager connect {name}' to add the tunnel to it")
+    else:
+        console.print("[red]Failed to open master connection.[/red]")
+
+@app.command()
+def bench(
+    name: Optional[str] = typer.Argument(None, help="Connection to tunnel through; the host must reach the stub on its localhost"),
+    fake_ssh: bool = typer.Option(False, "--fake-ssh", help="Tunnel through a local ssh stand-in, for machines without sshd"),
+    relay: bool = typer.Option(False, "--relay", help="Also relay through this process over ssh -W channels instead of ssh -L"),
+    count: int = typer.Option(200, "--requests", "-n", help="Requests per endpoint"),
+    concurrency: int = typer.Option(8, "--concurrency", "-c", help="Concurrent client connections"),
+    tokens: int = typer.Option(2000, "--tokens", help="Tokens per streamed /api/generate response"),
+    output: Optional[Path] = typer.Option(None, "--output", "-o", help="Where to save the JSON results"),
+    baseline: Optional[Path] = typer.Option(None, "--baseline", "-b", help="Earlier JSON results to compare against")
+):
+    """Benchmark tunnel latency and throughput against a stub Ollama server"""
+    from contextlib import ExitStack
+    from ..utils.bench import (
+        direct, fake_ssh_on_path, relay_tunnel, run_benchmarks, save_results, compare_results, ssh_tunnel
+    )
+
+    if relay and not (name or fake_ssh):
+        console.print("[red]--relay needs a connection name or --fake-ssh to relay through.[/red]")
+        return
+
+    forwarders = {"direct": direct}
+    if name or fake_ssh:
+        config = get_config_manager().get_connection(name) if name else {"host": "localhost", "port": 22}
+        if not config:
+            console.print(f"[red]No connection found with name: {name}[/red]")
+            return
+        ssh_manager = get_ssh_manager(config)
+        key_path = ssh_manager.get_key_path(name or "bench")
+        forwarders["tunnel"] = lambda stub_port: ssh_tunnel(
+            ssh_manager, config['host'], config['port'], key_path, remote_port=stub_port,
+            user=connection_user(config)
+        )
+        if relay:
+            forwarders["relay"] = lambda stub_port: relay_tunnel(
+                ssh_manager, config['host'], config['port'], key_path, remote_port=stub_port,
+                user=connection_user(config)
+            )
+
+    with ExitStack() as stack:
+        if fake_ssh:
+            stack.enter_context(fake_ssh_on_path())
+        with console.status("Running benchmarks..."):
+            results = run_benchmarks(forwarders, count=count, concurrency=concurrency, tokens=tokens)
+
+    table = Table(title="Benchmark Results")
+    table.add_column("Mode", style="cyan")
+    table.add_column("Endpoint", style="green")
+    table.add_column("Req/s", style="blue")
+    table.add_column("p50", style="yellow")
+    table.add_column("p99", style="yellow")
+    table.add_column("MB/s", style="blue")
+    table.add_column("Errors", style="red")
+    for mode, suite in results["modes"].items():
+        for endpoint, stats in suite.items():
+            if not isinstance(stats, dict):
+                continue
+            table.add_row(
+                mode,
+                endpoint,
+                f"{stats['rps']:.0f}",
+                f"{stats['p50_ms']:.2f}ms",
+                f"{stats['p99_ms']:.2f}ms",
+                f"{stats['bytes_per_sec'] / 1e6:.1f}",
+                str(stats['errors'])
+            )
+    console.print(table)
+    for mode, suite in results["modes"].items():
+        console.print(f"[blue]{mode} setup: {suite['setup_seconds'] * 1000:.0f}ms[/blue]")
+
+    if baseline:
+        comparison = Table(title=f"Change vs {baseline.name}")
+        comparison.add_column("Mode", style="cyan")
+        comparison.add_column("Endpoint", style="green")
+        comparison.add_column("Metric")
+        comparison.add_column("Change")
+        for row in compare_results(results, json.loads(baseline.read_text())):
+            comparison.add_row(row["mode"], row["endpoint"], row["metric"], f"{row['change'] * 100:+.1f}%")
+        console.print(comparison)
+
+    path = save_results(results, output)
+    console.print(f"[green]Results saved to {path}[/green]")
 
 def main():
     app()
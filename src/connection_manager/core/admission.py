@@ -0,0 +1,137 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+from .defaults import DEFAULT_MAX_QUEUE
+from ..utils.metrics import LatencyHistogram
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+# Highest priority first
+PRIORITIES = (INTERACTIVE, BATCH)
+# Queue waits run far longer than probe latencies
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Recent waits kept per priority for the percentiles status shows
+RECENT_WAITS = 1024
+
+class QueueFull(Exception):
+    """Raised when a request would wait in a queue that is already full"""
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class PriorityStats:
+    """Admissions, rejections and queue waits of one priority on one server"""
+
+    def __init__(self):
+        self.admitted = 0
+        self.rejected = 0
+        self.waits = LatencyHistogram(WAIT_BUCKETS)
+        self.recent: Deque[float] = deque(maxlen=RECENT_WAITS)
+
+    def observe(self, wait: float):
+        self.admitted += 1
+        self.waits.observe(wait)
+        self.recent.append(wait)
+
+    def to_dict(self) -> Dict:
+        recent = list(self.recent)
+        return {
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "wait_p50": percentile(recent, 0.5),
+            "wait_p95": percentile(recent, 0.95),
+            "wait_max": max(recent) if recent else None,
+        }
+
+class Admission:
+    """Caps the requests one server runs at once and queues the rest by priority
+
+    A freed slot goes to the oldest interactive request before any batch
+    request, and `reserve` slots are only ever given to interactive ones, so
+    an interactive request rarely waits behind a full batch of long jobs
+    while batch work still keeps the rest of the server busy. A request
+    that finds its queue full is rejected at once rather than left to time
+    out. With no limit every request is admitted straight away.
+    """
+
+    def __init__(self, max_concurrent: Optional[int] = None, max_queue: int = DEFAULT_MAX_QUEUE,
+                 reserve: int = 1):
+        self.max_concurrent = max_concurrent if max_concurrent and max_concurrent > 0 else None
+        self.max_queue = max(0, max_queue)
+        # Never reserve every slot, or batch requests would never run
+        self.reserve = min(max(0, reserve), self.max_concurrent - 1) if self.max_concurrent else 0
+        self.running: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self.stats: Dict[str, PriorityStats] = {priority: PriorityStats() for priority in PRIORITIES}
+        self._queues: Dict[str, Deque[asyncio.Future]] = {priority: deque() for priority in PRIORITIES}
+
+    @property
+    def active(self) -> int:
+        return sum(self.running.values())
+
+    def queued(self, priority: Optional[str] = None) -> int:
+        """Requests waiting for a slot, of one priority or all"""
+        if priority is not None:
+            return len(self._queues[priority])
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _may_run(self, priority: str) -> bool:
+        if self.max_concurrent is None:
+            return True
+        return self.active < self.max_concurrent - (self.reserve if priority == BATCH else 0)
+
+    async def acquire(self, priority: str = INTERACTIVE) -> float:
+        """Wait for a slot; returns the seconds spent queued"""
+        stats = self.stats[priority]
+        ahead = any(self._queues[other] for other in PRIORITIES[:PRIORITIES.index(priority) + 1])
+        if not ahead and self._may_run(priority):
+            self.running[priority] += 1
+            stats.observe(0.0)
+            return 0.0
+        if len(self._queues[priority]) >= self.max_queue:
+            stats.rejected += 1
+            raise QueueFull(f"Too many {priority} requests queued ({self.max_queue})")
+
+        start = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues[priority].append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(priority)  # Granted just as the request was abandoned
+            elif waiter in self._queues[priority]:
+                self._queues[priority].remove(waiter)
+            raise
+        wait = time.monotonic() - start
+        stats.observe(wait)
+        return wait
+
+    def release(self, priority: str = INTERACTIVE):
+        self.running[priority] -= 1
+        self._grant()
+
+    def _grant(self):
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue and self._may_run(priority):
+                waiter = queue.popleft()
+                if waiter.cancelled():
+                    continue
+                self.running[priority] += 1
+                waiter.set_result(None)
+            if queue:
+                return  # Lower priorities wait until this queue drains
+
+    def to_dict(self) -> Dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "reserve": self.reserve,
+            "running": dict(self.running),
+            "queued": {priority: self.queued(priority) for priority in PRIORITIES},
+            "priorities": {priority: stats.to_dict() for priority, stats in self.stats.items()},
+        }
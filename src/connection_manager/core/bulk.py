@@ -0,0 +1,79 @@
+import asyncio
+from typing import Dict, List, Optional
+from .ssh import SSHKeyManager
+from .readiness import DEFAULT_READY_TIMEOUT
+from .tunnel import Tunnel, start_tunnel, stop_tunnel
+from .forwards import apply_leases, lease_keys, lease_requests
+from .ports import PortAllocationError, PortAllocator
+from .defaults import DEFAULT_CONCURRENCY
+
+def select_connections(connections: Dict[str, Dict], group: Optional[str] = None) -> Dict[str, Dict]:
+    """Pick the connections a bulk connect applies to"""
+    if group is None:
+        return dict(connections)
+    return {name: config for name, config in connections.items() if config.get("group") == group}
+
+class BulkConnector:
+    """Bring up many tunnels at once with a bounded number of handshakes in flight"""
+
+    def __init__(self, ssh_manager: SSHKeyManager, concurrency: int = DEFAULT_CONCURRENCY,
+                 timeout: float = DEFAULT_READY_TIMEOUT, ports: Optional[PortAllocator] = None,
+                 use_socket: bool = False):
+        self.ssh_manager = ssh_manager
+        self.ports = ports or PortAllocator()
+        self.use_socket = use_socket
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.tunnels: List[Tunnel] = []
+
+    async def start_all(self, connections: Dict[str, Dict]) -> List[Tunnel]:
+        """Start a tunnel for every connection and wait for them to become ready"""
+        # Leasing every port up front, under one lock, keeps parallel handshakes
+        # and other CLI processes from ever racing for the same port
+        self.tunnels = [Tunnel(name, config, None, use_socket=self.use_socket)
+                        for name, config in connections.items()]
+        requests = {}
+        ports = {}
+        for tunnel in self.tunnels:
+            wanted = lease_requests(tunnel.name, tunnel.forwards)
+            if all(port is None for port in wanted.values()):
+                requests.update(wanted)
+                continue
+            # Ports the config asks for must be honoured, so a taken one fails
+            # only this connection instead of quietly moving its forward
+            try:
+                ports.update(self.ports.allocate_many(wanted, strict=True))
+            except PortAllocationError as e:
+                tunnel.error = str(e)
+        ports.update(self.ports.allocate_many(requests))
+        for tunnel in self.tunnels:
+            apply_leases(tunnel.name, tunnel.forwards, ports)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(self._start(tunnel, semaphore) for tunnel in self.tunnels
+                               if tunnel.error is None))
+        self.ports.release(*(key for tunnel in self.tunnels if not tunnel.is_up
+                             for key in lease_keys(tunnel.name, tunnel.forwards)))
+        self.ports.attach({key: tunnel.pid for tunnel in self.tunnels if tunnel.is_up
+                           for key in lease_keys(tunnel.name, tunnel.forwards)})
+        return self.tunnels
+
+    async def _start(self, tunnel: Tunnel, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            await start_tunnel(self.ssh_manager, tunnel, self.timeout)
+
+    async def hold(self):
+        """Keep the tunnels open until they all exit or the caller is interrupted"""
+        waits = [tunnel.process.wait() for tunnel in self.tunnels if tunnel.is_up and tunnel.process]
+        if any(tunnel.is_up and tunnel.on_master for tunnel in self.tunnels):
+            # Forwards on a master connection have no process to wait for
+            waits.append(asyncio.Event().wait())
+        try:
+            await asyncio.gather(*waits)
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        """Tear down every tunnel this connector started"""
+        await asyncio.gather(*(stop_tunnel(self.ssh_manager, tunnel) for tunnel in self.tunnels))
+        self.ports.release(*(key for tunnel in self.tunnels for key in lease_keys(tunnel.name, tunnel.forwards)))
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from .defaults import DEFAULT_CACHE_SIZE_MB, DEFAULT_DISK_CACHE_SIZE_MB
+from .inventory import model_key
+from ..utils.files import atomic_write
+
+CACHE_DIR = Path.home() / ".connections" / "cache"
+# Requests whose answer depends only on what they send, and how long the
+# answer stays good; None keeps it until evicted. Model details and the
+# model list change when models are pulled, so they expire. Embeddings are
+# keyed on the model's digest where the inventory knows it; the TTL covers
+# a model pulled again under the same tag when it does not.
+CACHEABLE: Dict[Tuple[str, str], Optional[float]] = {
+    ("POST", "/api/embed"): 86400.0,
+    ("POST", "/api/embeddings"): 86400.0,
+    ("POST", "/api/show"): 300.0,
+    ("GET", "/api/tags"): 30.0,
+}
+# Body fields that change how a server runs a request but not its answer
+IGNORED_FIELDS = ("keep_alive",)
+# One response may take at most this share of the memory budget
+MAX_ENTRY_SHARE = 4
+# Trim the disk tier to this share of its budget once it is over, so
+# eviction does not run on every write
+DISK_LOW_WATER = 0.9
+
+Headers = List[Tuple[str, str]]
+
+def cache_key(method: str, target: str, body: bytes, version: Optional[str] = None) -> Optional[str]:
+    """Content hash of a cacheable request; None when it must go upstream
+
+    JSON bodies are hashed in canonical form, so key order, whitespace and
+    "llama3" versus "llama3:latest" do not defeat the cache. version, such
+    as the model's digest, is hashed too, so answers from a replaced model
+    are not served.
+    """
+    if (method, target.split("?", 1)[0]) not in CACHEABLE:
+        return None
+    payload = None
+    if body:
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return None
+        if not isinstance(payload, dict):
+            return None
+        payload = {field: value for field, value in payload.items() if field not in IGNORED_FIELDS}
+        for field in ("model", "name"):
+            if isinstance(payload.get(field), str) and payload[field]:
+                payload[field] = model_key(payload[field])
+    canonical = json.dumps([method, target, payload] + ([version] if version else []),
+                           sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def cache_ttl(method: str, target: str) -> Optional[float]:
+    return CACHEABLE.get((method, target.split("?", 1)[0]))
+
+class CachedResponse:
+    """A complete upstream response, held so it can be replayed to other clients"""
+
+    def __init__(self, start: str, headers: Headers, body: bytes, backend: str,
+                 expires_at: Optional[float] = None):
+        self.start = start
+        # Without hop-by-hop or framing headers; encode() adds its own
+        self.headers = headers
+        self.body = body
+        self.backend = backend
+        self.expires_at = expires_at
+
+    @property
+    def status(self) -> int:
+        return int(self.start.split(" ", 2)[1])
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(name) + len(value) for name, value in self.headers)
+
+    def expired(self, now: Optional[float] = None) -> bool:
+        return self.expires_at is not None and (now or time.time()) >= self.expires_at
+
+    def encode(self, keep_alive: bool, cache_status: str) -> bytes:
+        head = [self.start]
+        head.extend(f"{name}: {value}" for name, value in self.headers)
+        head.append(f"Content-Length: {len(self.body)}")
+        head.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        head.append(f"X-Gateway-Backend: {self.backend}")
+        head.append(f"X-Gateway-Cache: {cache_status}")
+        return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + self.body
+
+    def dumps(self) -> bytes:
+        meta = {"start": self.start, "headers": self.headers, "backend": self.backend,
+                "expires_at": self.expires_at}
+        return json.dumps(meta).encode() + b"\n" + self.body
+
+    @classmethod
+    def loads(cls, data: bytes) -> "CachedResponse":
+        meta, _, body = data.partition(b"\n")
+        meta = json.loads(meta)
+        return cls(meta["start"], [tuple(header) for header in meta["headers"]], body,
+                   meta["backend"], meta["expires_at"])
+
+class ResponseCache:
+    """Responses to deterministic requests, in an LRU bounded in bytes
+
+    With disk=True entries are also written under CACHE_DIR, one file per
+    key, so they survive a supervisor restart; the disk tier has its own
+    byte budget and drops the least recently used files first. Disk access
+    blocks, so callers run load() and save() off the event loop.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_SIZE_MB * 1024 * 1024, disk: bool = False,
+                 directory: Path = CACHE_DIR, disk_max_bytes: int = DEFAULT_DISK_CACHE_SIZE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk = disk
+        self.directory = Path(directory)
+        self.disk_max_bytes = disk_max_bytes
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stored = 0
+        self.evictions = 0
+        self.disk_errors = 0
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Key -> (last use, bytes) of every file in the disk tier
+        self._files: Dict[str, Tuple[float, int]] = {}
+        self.disk_size = 0
+        if disk:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            for path in self.directory.iterdir():
+                if path.name.startswith("."):
+                    continue  # An interrupted atomic_write
+                try:
+                    info = path.stat()
+                except OSError:
+                    continue
+                self._files[path.name] = (info.st_mtime, info.st_size)
+                self.disk_size += info.st_size
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """The response in memory for key, if it is still good"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expired():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: CachedResponse):
+        if entry.size > self.max_bytes // MAX_ENTRY_SHARE:
+            return
+        self._drop(key)
+        self._entries[key] = entry
+        self.size += entry.size
+        self.stored += 1
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.size
+            self.evictions += 1
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def load(self, key: str) -> Optional[CachedResponse]:
+        """Read key from the disk tier, keeping it in memory from then on"""
+        if not self.disk or key not in self._files:
+            return None
+        path = self.directory / key
+        try:
+            entry = CachedResponse.loads(path.read_bytes())
+        except (OSError, ValueError, KeyError, TypeError):
+            self._forget_file(key)
+            return None
+        if entry.expired():
+            self._forget_file(key)
+            return None
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        with self._lock:
+            if key in self._files:
+                self._files[key] = (now, self._files[key][1])
+        return entry
+
+    def save(self, key: str, entry: CachedResponse):
+        """Write an entry to the disk tier; failures only cost a later miss"""
+        if not self.disk:
+            return
+        data = entry.dumps()
+        try:
+            atomic_write(self.directory / key, data)
+        except OSError:
+            self.disk_errors += 1
+            return
+        with self._lock:
+            previous = self._files.get(key)
+            self.disk_size += len(data) - (previous[1] if previous else 0)
+            self._files[key] = (time.time(), len(data))
+            if self.disk_size <= self.disk_max_bytes:
+                return
+            oldest = sorted(self._files, key=lambda name: self._files[name][0])
+        for name in oldest:
+            if self.disk_size <= self.disk_max_bytes * DISK_LOW_WATER:
+                break
+            self._forget_file(name)
+
+    def _forget_file(self, key: str):
+        with self._lock:
+            info = self._files.pop(key, None)
+            if info is None:
+                return
+            self.disk_size -= info[1]
+        try:
+            os.unlink(self.directory / key)
+        except OSError:
+            pass
+
+    def to_dict(self) -> Dict:
+        lookups = self.hits + self.disk_hits + self.coalesced + self.misses
+        return {
+            "entries": len(self._entries),
+            "size": self.size,
+            "max_size": self.max_bytes,
+            "disk": self.disk,
+            "disk_entries": len(self._files),
+            "disk_size": self.disk_size,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.disk_hits + self.coalesced) / lookups if lookups else None,
+            "stored": self.stored,
+            "evictions": self.evictions,
+            "disk_errors": self.disk_errors,
+        }
@@ -0,0 +1,82 @@
+import json
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict
+from ..utils.files import file_lock
+
+SUPERVISOR_DIR = Path.home() / ".connections"
+SOCKET_PATH = SUPERVISOR_DIR / "supervisor.sock"
+PID_PATH = SUPERVISOR_DIR / "supervisor.pid"
+LOG_PATH = SUPERVISOR_DIR / "supervisor.log"
+# Held by a running supervisor for its whole life
+LOCK_PATH = SUPERVISOR_DIR / "supervisor.lock"
+# Held while a CLI process starts one, so concurrent cold starts spawn only one
+START_LOCK_PATH = SUPERVISOR_DIR / "supervisor.start.lock"
+REQUEST_TIMEOUT = 60.0
+
+class SupervisorError(Exception):
+    """Raised when the supervisor cannot be reached or rejects a request"""
+
+def send_request(command: str, socket_path: Path = SOCKET_PATH,
+                 timeout: float = REQUEST_TIMEOUT, **params) -> Dict:
+    """Send one request to the supervisor and return its response"""
+    request = dict(params, command=command)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(str(socket_path))
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        response = b""
+        while not response.endswith(b"\n"):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            response += chunk
+    except (OSError, socket.timeout) as e:
+        raise SupervisorError(f"Could not reach supervisor: {e}")
+    finally:
+        sock.close()
+    if not response:
+        raise SupervisorError("Supervisor closed the connection")
+    return json.loads(response)
+
+def supervisor_running(socket_path: Path = SOCKET_PATH) -> bool:
+    """Check whether a supervisor answers on the control socket"""
+    if not socket_path.exists():
+        return False
+    try:
+        return send_request("ping", socket_path, timeout=2.0).get("ok", False)
+    except SupervisorError:
+        return False
+
+def start_supervisor(socket_path: Path = SOCKET_PATH, wait: float = 5.0, watchdog: bool = True) -> bool:
+    """Start the supervisor in the background unless it is already running"""
+    if supervisor_running(socket_path):
+        return True
+
+    SUPERVISOR_DIR.mkdir(exist_ok=True)
+    with file_lock(START_LOCK_PATH):
+        # Another CLI may have started one while we waited for the lock
+        if supervisor_running(socket_path):
+            return True
+        command = [sys.executable, "-m", "connection_manager", "daemon"]
+        if not watchdog:
+            command.append("--no-watchdog")
+        with open(LOG_PATH, "a") as log:
+            subprocess.Popen(
+                command,
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                start_new_session=True  # Outlive the CLI and its terminal
+            )
+
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            if supervisor_running(socket_path):
+                return True
+            time.sleep(0.05)
+    return False
@@ -1,29 +1,143 @@
+import copy
+import fnmatch
 import json
+import os
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 from datetime import datetime
+from .defaults import DEFAULT_USER
+from ..utils.files import atomic_write, file_lock
+
+# Set to "json" or "sqlite" to pick the connection store explicitly
+BACKEND_ENV = "CONNECTION_MANAGER_STORE"
+
+def open_config_manager(backend: Optional[str] = None):
+    """Open the configured connection store
+
+    SQLite is used when asked for, or once ~/.connections/connections.db
+    exists; otherwise the JSON file store.
+    """
+    backend = backend or os.environ.get(BACKEND_ENV)
+    if backend is None and (Path.home() / ".connections" / "connections.db").exists():
+        backend = "sqlite"
+    if backend == "sqlite":
+        from .store import SQLiteConfigManager
+        return SQLiteConfigManager()
+    return ConfigManager()
+
+def glob_pattern(pattern: str) -> str:
+    """Bare words match anywhere in the name or host; wildcards are used as given"""
+    if not any(ch in pattern for ch in "*?["):
+        return f"*{pattern}*"
+    return pattern
+
+def connection_tags(config: Dict) -> List[str]:
+    tags = config.get("tags") or []
+    if isinstance(tags, str):
+        tags = [tag.strip() for tag in tags.split(",")]
+    return sorted({tag for tag in tags if tag})
+
+def connection_user(config: Dict) -> str:
+    return config.get("user") or DEFAULT_USER
+
+def matches_filter(name: str, config: Dict, pattern: Optional[str] = None,
+                   tags: Optional[List[str]] = None, group: Optional[str] = None) -> bool:
+    if pattern:
+        pattern = glob_pattern(pattern)
+        if not (fnmatch.fnmatchcase(name, pattern) or fnmatch.fnmatchcase(str(config.get("host", "")), pattern)):
+            return False
+    if group and config.get("group") != group:
+        return False
+    if tags and not set(tags) <= set(connection_tags(config)):
+        return False
+    return True
 
 class ConfigManager:
     def __init__(self):
         self.config_dir = Path.home() / ".connections"
         self.config_file = self.config_dir / "config.json"
+        self.lock_file = self.config_dir / "config.json.lock"
         self.keys_dir = self.config_dir / "keys"
+        # Parsed document plus the (mtime, size, inode) it was read at
+        self._cache: Optional[Dict] = None
+        self._cache_key: Optional[Tuple[int, int, int]] = None
         self._ensure_dirs()
 
     def _ensure_dirs(self):
         self.config_dir.mkdir(exist_ok=True)
         self.keys_dir.mkdir(exist_ok=True)
         if not self.config_file.exists():
-            self.config_file.write_text("{}")
+            with file_lock(self.lock_file):
+                if not self.config_file.exists():
+                    self._write({})
+
+    def _read(self) -> Dict:
+        """Return the parsed config, re-reading it only when the file changed"""
+        stat = self.config_file.stat()
+        key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if self._cache is None or key != self._cache_key:
+            self._cache = json.loads(self.config_file.read_text())
+            self._cache_key = key
+        return self._cache
+
+    def _write(self, connections: Dict):
+        atomic_write(self.config_file, json.dumps(connections, indent=2))
+        stat = self.config_file.stat()
+        self._cache = connections
+        self._cache_key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    @contextmanager
+    def batch(self) -> Iterator[Dict]:
+        """Apply many changes under one lock and a single write
+
+        The yielded dict is the current config; edit it in place. Nothing is
+        written if the block raises.
+        """
+        with file_lock(self.lock_file):
+            # A deep copy, so edits cannot leak into the cache if the block fails
+            connections = copy.deepcopy(self._read())
+            yield connections
+            self._write(connections)
 
     def save_connection(self, name: str, config: Dict):
-        connections = self.load_connections()
         config['last_modified'] = datetime.now().isoformat()
-        connections[name] = config
-        self.config_file.write_text(json.dumps(connections, indent=2))
+        with self.batch() as connections:
+            connections[name] = config
 
+    def delete_connection(self, name: str) -> bool:
+        with file_lock(self.lock_file):
+            connections = self._read()
+            if name not in connections:
+                return False
+            self._write({other: config for other, config in connections.items() if other != name})
+        return True
+
+    # Readers get deep copies: the cache is only re-read when the file
+    # changes, so a caller editing a nested value would corrupt it
     def load_connections(self) -> Dict:
-        return json.loads(self.config_file.read_text())
+        return copy.deepcopy(self._read())
 
     def get_connection(self, name: str) -> Optional[Dict]:
-        return self.load_connections().get(name)
+        return copy.deepcopy(self._read().get(name))
+
+    def count_connections(self) -> int:
+        return len(self._read())
+
+    def iter_connections(self, pattern: Optional[str] = None, tags: Optional[List[str]] = None,
+                         group: Optional[str] = None, limit: Optional[int] = None,
+                         offset: int = 0) -> Iterator[Tuple[str, Dict]]:
+        """Yield (name, config) pairs in name order matching the filters"""
+        connections = self._read()
+        skipped = yielded = 0
+        for name in sorted(connections):
+            if limit is not None and yielded >= limit:
+                return
+            config = connections[name]
+            if not matches_filter(name, config, pattern, tags, group):
+                continue
+            if skipped < offset:
+                skipped += 1
+                continue
+            yielded += 1
+            yield name, copy.deepcopy(config)
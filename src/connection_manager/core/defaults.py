@@ -0,0 +1,13 @@
+# Kept free of imports so the CLI can use them as option defaults without
+# loading asyncio or the ssh machinery at startup
+DEFAULT_READY_TIMEOUT = 15.0
+DEFAULT_CONCURRENCY = 16
+DEFAULT_CONTROL_PERSIST = "10m"
+# Remote user of connections whose config does not name one
+DEFAULT_USER = "root"
+# Outside the range tunnels lease ports from
+DEFAULT_GATEWAY_PORT = 11400
+DEFAULT_GATEWAY_RETRIES = 2
+DEFAULT_CACHE_SIZE_MB = 256
+DEFAULT_DISK_CACHE_SIZE_MB = 4096
+DEFAULT_MAX_QUEUE = 64
@@ -0,0 +1,252 @@
+import asyncio
+import json
+import os
+import re
+import socket
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from ..utils.files import atomic_write, file_lock
+from ..utils.tracing import span
+
+HOSTS_PATH = Path.home() / ".connections" / "hosts.json"
+# How long a replica gets to accept a TCP connection on its ssh port
+PROBE_TIMEOUT = 2.0
+# Once one replica answers, how much longer the others get before the race starts
+PROBE_GRACE = 0.1
+# Delay between starting handshakes, the connection attempt delay of RFC 8305
+STAGGER = 0.25
+MAX_RACERS = 3
+# Weight of the newest measurement in each address's running RTT
+RTT_WEIGHT = 0.3
+# host, host:port, [v6 address] or [v6 address]:port
+HOST_RE = re.compile(r"^(?:\[(?P<v6>[^\]]+)\]|(?P<host>[^:\s]+))(?::(?P<port>\d+))?$")
+
+def connection_hosts(config: Dict) -> List[Tuple[str, int]]:
+    """Host and port of a connection and each of its replicas, primary first
+
+    Replicas come from the config's "hosts" list and may carry their own
+    port; a bare IPv6 address is taken whole.
+    """
+    port = int(config.get("port", 22))
+    hosts = []
+    for entry in [config["host"], *config.get("hosts", [])]:
+        match = HOST_RE.match(str(entry).strip())
+        if match is None:
+            hosts.append((str(entry).strip(), port))
+        else:
+            hosts.append((match.group("v6") or match.group("host"),
+                          int(match.group("port")) if match.group("port") else port))
+    return list(dict.fromkeys(host for host in hosts if host[0]))
+
+class Candidate:
+    """One address a connection could reach its server at"""
+
+    def __init__(self, host: str, port: int, address: str):
+        self.host = host
+        self.port = port
+        self.address = address
+        # Seconds to open a TCP connection to it just now; None if it did not answer
+        self.rtt: Optional[float] = None
+        # Running RTT over earlier connects, this one included
+        self.average: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.address}:{self.port}"
+
+    def to_dict(self) -> Dict:
+        return {
+            "host": self.host,
+            "port": self.port,
+            "address": self.address,
+            "rtt": self.rtt,
+            "average": self.average,
+            "error": self.error,
+        }
+
+async def resolve(hosts: List[Tuple[str, int]]) -> List[Candidate]:
+    """Every A and AAAA record of every host, in the order given"""
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(
+        *(loop.getaddrinfo(host, port, type=socket.SOCK_STREAM) for host, port in hosts),
+        return_exceptions=True
+    )
+    candidates: Dict[str, Candidate] = {}
+    for (host, port), result in zip(hosts, results):
+        if isinstance(result, Exception):
+            candidate = Candidate(host, port, host)
+            candidate.error = f"Could not resolve {host}: {getattr(result, 'strerror', None) or result}"
+            candidates.setdefault(candidate.key, candidate)
+            continue
+        for _, _, _, _, address in result:
+            candidate = Candidate(host, port, address[0])
+            candidates.setdefault(candidate.key, candidate)
+    return list(candidates.values())
+
+async def _probe(candidate: Candidate, timeout: float):
+    started = time.monotonic()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(candidate.address, candidate.port), timeout)
+    except asyncio.TimeoutError:
+        candidate.error = f"No answer on port {candidate.port} within {timeout:g}s"
+        return
+    except OSError as e:
+        # asyncio puts the address in strerror; errno alone reads like ssh
+        candidate.error = os.strerror(e.errno) if e.errno else str(e)
+        return
+    candidate.rtt = time.monotonic() - started
+    writer.close()
+
+async def probe_all(candidates: List[Candidate], timeout: float = PROBE_TIMEOUT, grace: float = PROBE_GRACE):
+    """Open a TCP connection to every candidate at once
+
+    Returns `grace` after the first answer rather than waiting out replicas
+    that drop packets; those are left without an RTT or an error.
+    """
+    tasks = [asyncio.ensure_future(_probe(candidate, timeout)) for candidate in candidates if candidate.error is None]
+    pending = set(tasks)
+    deadline = asyncio.get_running_loop().time() + timeout
+    try:
+        while pending:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            _, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if any(candidate.rtt is not None for candidate in candidates):
+                if pending:
+                    await asyncio.wait(pending, timeout=grace)
+                break
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+class HostHistory:
+    """Which replica each connection last used and a running RTT per address
+
+    Kept in ~/.connections/hosts.json and changed under a lock, as the
+    supervisor and foreground connects may both record a choice.
+    """
+
+    def __init__(self, path: Path = HOSTS_PATH):
+        self.path = Path(path)
+        self.lock_file = self.path.with_name(self.path.name + ".lock")
+
+    def load(self) -> Dict:
+        try:
+            return json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def chosen(self, name: str) -> Optional[Candidate]:
+        """The replica the connection last connected through, whose master may still be open"""
+        entry = self.load().get(name, {}).get("chosen")
+        if not entry:
+            return None
+        return Candidate(entry["host"], entry["port"], entry["address"])
+
+    def rank(self, name: str, candidates: List[Candidate]) -> List[Candidate]:
+        """Candidates worth trying, historically fastest first
+
+        Those that answered the probe come first, ordered by their running
+        RTT with this probe folded in; those that never answered follow in
+        case the probe was unlucky. Refused and unresolvable ones are left out.
+        """
+        averages = self.load().get(name, {}).get("rtt", {})
+        for candidate in candidates:
+            if candidate.rtt is None:
+                continue
+            previous = averages.get(candidate.key)
+            candidate.average = candidate.rtt if previous is None \
+                else RTT_WEIGHT * candidate.rtt + (1 - RTT_WEIGHT) * previous
+        answered = sorted((candidate for candidate in candidates if candidate.average is not None),
+                          key=lambda candidate: candidate.average)
+        silent = [candidate for candidate in candidates if candidate.rtt is None and candidate.error is None]
+        return answered + silent
+
+    def record(self, name: str, candidates: List[Candidate], chosen: Optional[Candidate],
+               handshake: Optional[float] = None):
+        """Save this connect's RTTs and, if one was kept, the replica chosen"""
+        self.path.parent.mkdir(exist_ok=True)
+        with file_lock(self.lock_file):
+            history = self.load()
+            entry = history.setdefault(name, {})
+            averages = entry.setdefault("rtt", {})
+            for candidate in candidates:
+                if candidate.average is not None:
+                    averages[candidate.key] = candidate.average
+            if chosen is not None:
+                entry["chosen"] = {**chosen.to_dict(), "handshake": handshake, "chosen_at": time.time()}
+            atomic_write(self.path, json.dumps(history, indent=2))
+
+async def race(candidates: List[Candidate], attempt: Callable[[Candidate], Awaitable[Tuple[bool, Optional[str]]]],
+               stagger: float = STAGGER, max_racers: int = MAX_RACERS) -> Tuple[Optional[Candidate], Dict[str, str]]:
+    """Run attempt() on the best candidates `stagger` apart and keep the first to succeed
+
+    A failed attempt starts the next candidate at once. Attempts still
+    running when one succeeds are cancelled and must clean up after
+    themselves. Returns the winner, or None, and the error of every
+    candidate that failed.
+    """
+    loop = asyncio.get_running_loop()
+    queue = list(candidates[:max_racers])
+    running: Dict[asyncio.Future, Candidate] = {}
+    errors: Dict[str, str] = {}
+    next_start = loop.time()
+    try:
+        while queue or running:
+            if queue and (not running or loop.time() >= next_start):
+                candidate = queue.pop(0)
+                running[asyncio.ensure_future(_traced_attempt(attempt, candidate))] = candidate
+                next_start = loop.time() + stagger
+                continue
+            timeout = max(0.0, next_start - loop.time()) if queue else None
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                candidate = running.pop(task)
+                if task.exception() is not None:
+                    ok, error = False, str(task.exception()) or type(task.exception()).__name__
+                else:
+                    ok, error = task.result()
+                if ok:
+                    return candidate, errors
+                errors[candidate.key] = error or "failed"
+                next_start = loop.time()
+        return None, errors
+    finally:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+async def _traced_attempt(attempt, candidate: Candidate) -> Tuple[bool, Optional[str]]:
+    with span("ssh.attempt", host=candidate.host, address=candidate.address) as current:
+        ok, error = await attempt(candidate)
+        if current is not None and not ok:
+            current.attributes["error"] = error
+        return ok, error
+
+async def select(name: str, hosts: List[Tuple[str, int]], history: HostHistory) -> List[Candidate]:
+    """Resolve and probe every replica; the candidates worth trying, best first
+
+    Raises NoReplica, carrying every candidate and its error, when none is
+    worth trying.
+    """
+    with span("resolve", hosts=len(hosts)):
+        candidates = await resolve(hosts)
+    with span("probe", candidates=len(candidates)):
+        await probe_all(candidates)
+    ranked = history.rank(name, candidates)
+    if not ranked:
+        raise NoReplica(candidates)
+    return ranked
+
+class NoReplica(Exception):
+    """Raised when no host or address of a connection answers on its ssh port"""
+
+    def __init__(self, candidates: List[Candidate]):
+        self.candidates = candidates
+        super().__init__("No replica is reachable: " + "; ".join(
+            f"{candidate.address}:{candidate.port}: {candidate.error}" for candidate in candidates
+        ))
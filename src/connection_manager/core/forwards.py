@@ -0,0 +1,142 @@
+import os
+from typing import Dict, List, Optional
+from .sockets import socket_path
+
+FORWARD_TYPES = ("local", "remote", "dynamic")
+# Flag ssh uses for each kind of forward
+SSH_FLAGS = {"local": "-L", "remote": "-R", "dynamic": "-D"}
+PRIMARY_FORWARD = "ollama"
+OLLAMA_PORT = 11434
+
+class Forward:
+    """One port forward carried by a connection's ssh process
+
+    local and dynamic forwards listen on local_port, or a local forward on
+    the Unix socket local_socket instead; a remote forward listens on
+    remote_port on the server and connects back to local_port here. The
+    primary forward is the Ollama API the rest of the tool probes.
+    """
+
+    def __init__(self, name: str, kind: str = "local", local_port: Optional[int] = None,
+                 remote_port: Optional[int] = None, remote_host: str = "localhost",
+                 primary: bool = False, local_socket: Optional[str] = None):
+        if kind not in FORWARD_TYPES:
+            raise ValueError(f"Unknown forward type {kind!r} for {name}; use one of {', '.join(FORWARD_TYPES)}")
+        if kind != "dynamic" and remote_port is None:
+            raise ValueError(f"Forward {name} needs a remote_port")
+        if kind == "remote" and local_port is None:
+            raise ValueError(f"Remote forward {name} needs a local_port to connect back to")
+        if local_socket is not None and kind != "local":
+            raise ValueError(f"Only local forwards can listen on a Unix socket, not {kind} forward {name}")
+        self.name = name
+        self.kind = kind
+        self.local_port = local_port
+        self.remote_port = remote_port
+        self.remote_host = remote_host
+        self.primary = primary
+        self.local_socket = local_socket
+        self.ready = False
+        self.up: Optional[bool] = None
+        self.error: Optional[str] = None
+
+    @property
+    def binds_local_port(self) -> bool:
+        return self.kind in ("local", "dynamic") and self.local_socket is None
+
+    @property
+    def spec(self) -> str:
+        if self.local_socket is not None:
+            return f"{self.local_socket}:{self.remote_host}:{self.remote_port}"
+        if self.kind == "local":
+            return f"{self.local_port}:{self.remote_host}:{self.remote_port}"
+        if self.kind == "remote":
+            return f"{self.remote_port}:{self.remote_host}:{self.local_port}"
+        return str(self.local_port)
+
+    def ssh_args(self) -> List[str]:
+        return [SSH_FLAGS[self.kind], self.spec]
+
+    def reset(self):
+        self.ready = False
+        self.up = None
+        self.error = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "type": self.kind,
+            "local_port": self.local_port,
+            "local_socket": self.local_socket,
+            "remote_port": self.remote_port,
+            "remote_host": self.remote_host,
+            "spec": self.spec,
+            "ready": self.ready,
+            "up": self.up,
+            "error": self.error,
+        }
+
+def forwards_from_config(config: Dict, local_port: Optional[int] = None,
+                         remote_port: int = OLLAMA_PORT, connection: Optional[str] = None,
+                         use_socket: bool = False) -> List[Forward]:
+    """Build a connection's forwards; without a "forwards" list, just Ollama
+
+    Entries look like {"name": "jupyter", "type": "local", "remote_port": 8888}.
+    "type" defaults to local and "local_port" to an automatically leased port.
+    "socket" is true for a socket under ~/.connections/sockets/ or a path.
+    The entry named "ollama", or the first local one, is primary and takes
+    local_port when given; use_socket or "socket": true in the connection's
+    config puts it on a socket instead.
+    """
+    if use_socket and local_port is not None:
+        raise ValueError("Give either a local port or a socket, not both")
+    connection = connection or config.get("name") or "tunnel"
+    entries = config.get("forwards") or [
+        {"name": PRIMARY_FORWARD, "local_port": config.get("local_port"), "remote_port": remote_port}
+    ]
+    forwards = []
+    for i, entry in enumerate(entries):
+        forwards.append(Forward(
+            entry.get("name") or f"forward{i}",
+            kind=entry.get("type", "local"),
+            local_port=entry.get("local_port"),
+            remote_port=entry.get("remote_port"),
+            remote_host=entry.get("remote_host", "localhost"),
+            local_socket=os.path.expanduser(entry["socket"]) if isinstance(entry.get("socket"), str) else None,
+        ))
+
+    local = [forward for forward in forwards if forward.kind == "local"]
+    primary = next((forward for forward in local if forward.name == PRIMARY_FORWARD), local[0] if local else None)
+    if primary is not None:
+        primary.primary = True
+        if local_port is not None:
+            primary.local_port = local_port
+            primary.local_socket = None
+    for entry, forward in zip(entries, forwards):
+        if forward is primary and local_port is not None:
+            continue  # An explicit port wins over the config
+        wants_socket = entry.get("socket") is True or (
+            forward is primary and (use_socket or config.get("socket") is True)
+        )
+        if wants_socket and forward.local_socket is None:
+            if forward.kind != "local":
+                raise ValueError(f"Only local forwards can listen on a Unix socket, not {forward.kind} forward {forward.name}")
+            forward.local_socket = socket_path(connection, forward.name, forward.primary)
+            forward.local_port = None
+    return forwards
+
+def lease_key(connection: str, forward: Forward) -> str:
+    """Name the port lease of a forward; the primary one uses the connection's name"""
+    return connection if forward.primary else f"{connection}/{forward.name}"
+
+def lease_requests(connection: str, forwards: List[Forward]) -> Dict[str, Optional[int]]:
+    """Port leases a connection's forwards need, with their preferred ports"""
+    return {lease_key(connection, forward): forward.local_port for forward in forwards if forward.binds_local_port}
+
+def lease_keys(connection: str, forwards: List[Forward]) -> List[str]:
+    return list(lease_requests(connection, forwards))
+
+def apply_leases(connection: str, forwards: List[Forward], ports: Dict[str, int]):
+    for forward in forwards:
+        key = lease_key(connection, forward)
+        if forward.binds_local_port and key in ports:
+            forward.local_port = ports[key]
@@ -0,0 +1,708 @@
+import asyncio
+import functools
+import json
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Tuple, TypeVar, Union
+from rich.console import Console
+from .admission import INTERACTIVE, BATCH, PRIORITIES, Admission, QueueFull
+from .cache import CachedResponse, ResponseCache, cache_key, cache_ttl
+from .defaults import DEFAULT_GATEWAY_RETRIES
+from .inventory import InventoryCache, model_key
+from ..utils.health import check_ollama_health
+
+console = Console()
+
+GATEWAY_HEALTH_INTERVAL = 5.0
+HEALTH_TIMEOUT = 2.0
+CONNECT_TIMEOUT = 5.0
+# Idle upstream connections are reused for this long, a few per backend
+POOL_IDLE_TIMEOUT = 30.0
+MAX_IDLE_PER_BACKEND = 8
+READ_SIZE = 65536
+# Requests that only read, so repeating them on another backend is safe. PUT
+# and DELETE are idempotent on one server, but a second backend has its own
+# state, so those go elsewhere only if the first never received them
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+# Ollama POSTs that only read
+SAFE_PATHS = ("/api/show", "/api/embed", "/api/embeddings")
+# Requests naming a model in their JSON body, and those that load it into memory
+MODEL_PATHS = ("/api/generate", "/api/chat", "/api/embed", "/api/embeddings", "/api/show",
+               "/v1/chat/completions", "/v1/completions", "/v1/embeddings")
+LOADING_PATHS = tuple(path for path in MODEL_PATHS if path != "/api/show")
+# Spread a model to servers that only have it on disk once every server
+# with it loaded has this many requests in flight
+SPILL_OUTSTANDING = 4
+# Per-connection headers a proxy must not pass on
+HOP_BY_HOP = ("connection", "keep-alive", "proxy-connection", "te", "trailer", "upgrade", "expect")
+# Lets a client pick its priority whichever port it came in on
+PRIORITY_HEADER = "X-Priority"
+
+Headers = List[Tuple[str, str]]
+T = TypeVar("T")
+
+class HTTPError(Exception):
+    """Raised for a malformed HTTP message"""
+
+class UpstreamError(Exception):
+    """Raised when a backend fails before its response reached the client
+
+    sent is False when the request never left the gateway, so it can go to
+    another backend whatever its method; stale marks a failure of a reused
+    idle connection rather than of the backend.
+    """
+
+    def __init__(self, message: str, sent: bool = True, stale: bool = False):
+        super().__init__(message)
+        self.sent = sent
+        self.stale = stale
+
+class ModelNotFound(UpstreamError):
+    """Raised when a backend answers 404 for a model another backend may have"""
+
+class ClientGone(Exception):
+    """Raised when the client disconnects while a response is relayed"""
+
+class NoBackend(Exception):
+    """Raised when no backend could answer a request, after any retries"""
+
+    def __init__(self, message: str, status: int, reason: str):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+
+    def response(self, keep_alive: bool) -> bytes:
+        return error_response(self.status, self.reason, str(self), keep_alive)
+
+def get_header(headers: Headers, name: str, default: Optional[str] = None) -> Optional[str]:
+    name = name.lower()
+    return next((value for key, value in headers if key.lower() == name), default)
+
+def is_chunked(headers: Headers) -> bool:
+    return "chunked" in (get_header(headers, "transfer-encoding") or "").lower()
+
+async def read_head(reader: asyncio.StreamReader) -> Optional[Tuple[str, Headers]]:
+    """Read a start line and headers; None if the peer closed between messages"""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return None
+        raise HTTPError("Connection closed in the middle of the headers")
+    except asyncio.LimitOverrunError:
+        raise HTTPError("Headers too large")
+    lines = head.decode("latin-1").split("\r\n")
+    headers = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, sep, value = line.partition(":")
+        if not sep:
+            raise HTTPError(f"Malformed header line: {line!r}")
+        headers.append((name.strip(), value.strip()))
+    return lines[0], headers
+
+async def _read_chunk_size(reader: asyncio.StreamReader) -> Tuple[bytes, int]:
+    line = await reader.readline()
+    if not line:
+        raise asyncio.IncompleteReadError(b"", None)
+    try:
+        return line, int(line.split(b";")[0].strip(), 16)
+    except ValueError:
+        raise HTTPError(f"Malformed chunk size: {line!r}")
+
+async def read_body(reader: asyncio.StreamReader, headers: Headers) -> bytes:
+    """Read a whole request body, undoing chunked encoding"""
+    if is_chunked(headers):
+        parts = []
+        while True:
+            _, size = await _read_chunk_size(reader)
+            if size == 0:
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass  # Trailers
+                return b"".join(parts)
+            parts.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+    length = get_header(headers, "content-length")
+    try:
+        return await reader.readexactly(int(length)) if length else b""
+    except ValueError:
+        raise HTTPError(f"Malformed Content-Length: {length!r}")
+
+async def read_response_body(reader: asyncio.StreamReader, method: str, status: int,
+                             headers: Headers) -> Tuple[bytes, bool]:
+    """Read a whole response body, and whether the connection can carry another"""
+    if not has_body(method, status):
+        return b"", True
+    if is_chunked(headers) or get_header(headers, "content-length") is not None:
+        return await read_body(reader, headers), True
+    return await reader.read(), False
+
+async def send(writer: asyncio.StreamWriter, data: bytes):
+    writer.write(data)
+    try:
+        await writer.drain()
+    except ConnectionError as e:
+        raise ClientGone(str(e))
+
+async def relay_body(upstream: asyncio.StreamReader, client: asyncio.StreamWriter,
+                     headers: Headers) -> bool:
+    """Pass a response body on as it arrives, so streamed tokens are not held back
+
+    Returns False when the body ends by closing the connection.
+    """
+    if is_chunked(headers):
+        # Forward chunks untouched; the client decodes them itself
+        while True:
+            line, size = await _read_chunk_size(upstream)
+            if size == 0:
+                trailer = line
+                while True:
+                    line = await upstream.readline()
+                    trailer += line
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                await send(client, trailer)
+                return True
+            await send(client, line + await upstream.readexactly(size + 2))
+
+    length = get_header(headers, "content-length")
+    if length is not None:
+        remaining = int(length)
+        while remaining:
+            data = await upstream.read(min(remaining, READ_SIZE))
+            if not data:
+                raise asyncio.IncompleteReadError(b"", remaining)
+            await send(client, data)
+            remaining -= len(data)
+        return True
+
+    while True:
+        data = await upstream.read(READ_SIZE)
+        if not data:
+            return False
+        await send(client, data)
+
+def request_model(target: str, body: bytes) -> Optional[str]:
+    """The model a request asks for, if it names one"""
+    if target.split("?", 1)[0] not in MODEL_PATHS or not body:
+        return None
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return None
+    model = (payload.get("model") or payload.get("name")) if isinstance(payload, dict) else None
+    return model_key(model) if isinstance(model, str) and model else None
+
+def has_body(method: str, status: int) -> bool:
+    return method != "HEAD" and status >= 200 and status not in (204, 304)
+
+def error_response(status: int, reason: str, message: str, keep_alive: bool) -> bytes:
+    # Same shape as Ollama's own errors so clients report them sensibly
+    body = json.dumps({"error": message}).encode()
+    return (
+        f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    ).encode() + body
+
+class Backend:
+    """One tunnel the gateway sends requests to, with a pool of idle connections
+
+    admission caps how many requests the server runs at once; outstanding
+    counts those waiting for a slot too, so busy servers get fewer requests.
+    """
+
+    def __init__(self, name: str, endpoint: Union[int, str], admission: Optional[Admission] = None):
+        self.name = name
+        self.endpoint = endpoint
+        self.admission = admission or Admission()
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+        self.last_error: Optional[str] = None
+        self._idle: Deque[Tuple[asyncio.StreamReader, asyncio.StreamWriter, float]] = deque()
+
+    async def connect(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter, bool]:
+        """An upstream connection and whether it was reused from the pool"""
+        now = time.monotonic()
+        while self._idle:
+            # Most recently used first, as it is the least likely to have been closed
+            reader, writer, since = self._idle.pop()
+            if now - since < POOL_IDLE_TIMEOUT and not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+        if isinstance(self.endpoint, str):
+            opening = asyncio.open_unix_connection(self.endpoint)
+        else:
+            opening = asyncio.open_connection("127.0.0.1", self.endpoint)
+        reader, writer = await asyncio.wait_for(opening, CONNECT_TIMEOUT)
+        return reader, writer, False
+
+    def release(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Keep a connection whose response was read in full for the next request"""
+        if len(self._idle) < MAX_IDLE_PER_BACKEND:
+            self._idle.append((reader, writer, time.monotonic()))
+        else:
+            writer.close()
+
+    def close_idle(self):
+        while self._idle:
+            self._idle.pop()[1].close()
+
+    def eject(self, error: str):
+        if self.healthy:
+            self.ejections += 1
+            console.print(f"Gateway ejected {self.name}: {error}")
+        self.healthy = False
+        self.last_error = error
+        self.close_idle()
+
+    def restore(self):
+        if not self.healthy:
+            console.print(f"Gateway restored {self.name}")
+        self.healthy = True
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "endpoint": self.endpoint,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejections": self.ejections,
+            "last_error": self.last_error,
+            "admission": self.admission.to_dict(),
+        }
+
+class Gateway:
+    """One local Ollama endpoint spreading requests over several tunnels
+
+    Each request goes to the healthy backend with the fewest requests in
+    flight, so long generations naturally steer new work elsewhere. Backends
+    are ejected when a request to them fails or check_ollama_health reports
+    them down, and restored once the health check passes again. Idempotent
+    requests that fail before any response was relayed are retried on
+    another backend; responses are streamed through as they arrive.
+
+    Given the supervisor's model inventory, a request naming a model only
+    considers backends that have it loaded, then ones that have it on disk,
+    so requests avoid cold model loads wherever possible.
+
+    Given a ResponseCache, requests with deterministic answers (embeddings,
+    model details, the model list) are answered from it when possible, and
+    identical requests in flight at the same time share one upstream call.
+
+    Requests are interactive unless they come in on batch_port or ask for
+    batch in the X-Priority header; each backend's Admission decides when
+    they run.
+    """
+
+    def __init__(self, backends: Iterable[Backend], port: int, host: str = "127.0.0.1",
+                 retries: int = DEFAULT_GATEWAY_RETRIES, health_interval: float = GATEWAY_HEALTH_INTERVAL,
+                 inventory: Optional[InventoryCache] = None, cache: Optional[ResponseCache] = None,
+                 batch_port: Optional[int] = None):
+        self.backends: List[Backend] = list(backends)
+        self.inventory = inventory
+        self.cache = cache
+        # Cache misses being fetched, for identical requests to wait on
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Requests per placement of their model: loaded, installed, or elsewhere
+        self.routed: Dict[str, int] = {"loaded": 0, "installed": 0, "elsewhere": 0}
+        self.port = port
+        self.batch_port = batch_port
+        self.host = host
+        self.retries = max(0, retries)
+        self.health_interval = health_interval
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+        self.rejected = 0
+        self.started_at: Optional[float] = None
+        self._servers: List[asyncio.AbstractServer] = []
+        self._health_task: Optional[asyncio.Task] = None
+        self._clients: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    async def start(self):
+        """Check the backends once, then start listening"""
+        await self.check_health()
+        self._servers.append(await asyncio.start_server(self._handle_client, self.host, self.port))
+        if self.batch_port is not None:
+            try:
+                self._servers.append(await asyncio.start_server(
+                    functools.partial(self._handle_client, priority=BATCH), self.host, self.batch_port))
+            except OSError:
+                await self.close()
+                raise
+        self._health_task = asyncio.ensure_future(self._health_loop())
+        self.started_at = time.time()
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        for writer in self._clients.values():
+            writer.close()
+        await asyncio.gather(*self._clients, return_exceptions=True)
+        for backend in self.backends:
+            backend.close_idle()
+
+    def update_endpoint(self, name: str, endpoint: Union[int, str]):
+        """Follow a tunnel that came back on another port or socket"""
+        for backend in self.backends:
+            if backend.name == name and backend.endpoint != endpoint:
+                backend.close_idle()
+                backend.endpoint = endpoint
+
+    def candidates(self, exclude: Iterable[Backend] = (), model: Optional[str] = None) -> Tuple[List[Backend], str]:
+        """Backends a request may go to, narrowed to those with its model when any have it
+
+        Also returns where the model is on them: loaded, installed or elsewhere.
+        """
+        exclude = set(exclude)
+        healthy = [backend for backend in self.backends if backend.healthy and backend not in exclude]
+        if model is None or self.inventory is None:
+            return healthy, "elsewhere"
+        loaded = [backend for backend in healthy if self.inventory.has_loaded(backend.name, model)]
+        installed = [backend for backend in healthy if self.inventory.has_installed(backend.name, model)
+                     and backend not in loaded]
+        if loaded and (not installed or min(backend.outstanding for backend in loaded) < SPILL_OUTSTANDING):
+            return loaded, "loaded"
+        if installed:
+            return loaded + installed, "installed"
+        return healthy, "elsewhere"
+
+    def pick(self, exclude: Iterable[Backend] = (), model: Optional[str] = None) -> Optional[Backend]:
+        """The candidate with the fewest requests in flight, ties broken at random"""
+        candidates, _ = self.candidates(exclude, model)
+        if not candidates:
+            return None
+        least = min(backend.outstanding for backend in candidates)
+        return random.choice([backend for backend in candidates if backend.outstanding == least])
+
+    async def check_health(self):
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*(
+            loop.run_in_executor(None, check_ollama_health, backend.endpoint, HEALTH_TIMEOUT)
+            for backend in self.backends
+        ))
+        for backend, (healthy, error) in zip(self.backends, results):
+            if healthy:
+                backend.restore()
+            else:
+                backend.eject(error or "Health check failed")
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.check_health()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                             priority: str = INTERACTIVE):
+        self._clients[asyncio.current_task()] = writer
+        try:
+            while True:
+                request = await read_head(reader)
+                if request is None:
+                    break
+                start, headers = request
+                try:
+                    method, target, version = start.split(" ", 2)
+                except ValueError:
+                    raise HTTPError(f"Malformed request line: {start!r}")
+                if (get_header(headers, "expect") or "").lower() == "100-continue":
+                    await send(writer, b"HTTP/1.1 100 Continue\r\n\r\n")
+                body = await read_body(reader, headers)
+
+                connection = (get_header(headers, "connection") or "").lower()
+                keep_alive = "close" not in connection if version == "HTTP/1.1" else "keep-alive" in connection
+                requested = (get_header(headers, PRIORITY_HEADER) or "").strip().lower()
+                if not await self.proxy(method, target, headers, body, writer, keep_alive,
+                                        requested if requested in PRIORITIES else priority) or not keep_alive:
+                    break
+        except HTTPError as e:
+            writer.write(error_response(400, "Bad Request", str(e), keep_alive=False))
+        except (ConnectionError, ClientGone, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            self._clients.pop(asyncio.current_task(), None)
+
+    async def proxy(self, method: str, target: str, headers: Headers, body: bytes,
+                    client: asyncio.StreamWriter, keep_alive: bool, priority: str = INTERACTIVE) -> bool:
+        """Send one request to a backend, retrying elsewhere when allowed
+
+        Returns whether the client connection can carry another request.
+        """
+        self.requests += 1
+        key = cache_key(method, target, body, self._model_version(target, body)) if self.cache is not None else None
+        if key is not None:
+            return await self._proxy_cached(key, method, target, headers, body, client, keep_alive, priority)
+
+        async def relay(backend: Backend, retryable: bool, reroute: bool) -> bool:
+            return await self._forward(backend, method, target, headers, body, client, keep_alive,
+                                       retryable, reroute)
+        try:
+            return await self._dispatch(method, target, body, relay, priority)
+        except NoBackend as e:
+            await send(client, e.response(keep_alive))
+            return True
+
+    def _model_version(self, target: str, body: bytes) -> Optional[str]:
+        """Digests of the model a request names, as reported by the backends that have it"""
+        model = request_model(target, body)
+        if model is None or self.inventory is None:
+            return None
+        digests = self.inventory.digests((backend.name for backend in self.backends), model)
+        return ",".join(digests) or None
+
+    async def _proxy_cached(self, key: str, method: str, target: str, headers: Headers, body: bytes,
+                            client: asyncio.StreamWriter, keep_alive: bool, priority: str) -> bool:
+        """Answer from the cache, from an identical request in flight, or upstream"""
+        entry = self.cache.get(key)
+        cache_status = "HIT"
+        try:
+            if entry is not None:
+                self.cache.hits += 1
+            elif key in self._inflight:
+                self.cache.coalesced += 1
+                cache_status = "COALESCED"
+                entry = await asyncio.shield(self._inflight[key])
+            else:
+                entry, cache_status = await self._fill(key, method, target, headers, body, priority)
+        except NoBackend as e:
+            await send(client, e.response(keep_alive))
+            return True
+        try:
+            await send(client, entry.encode(keep_alive, cache_status))
+        except ClientGone:
+            return False
+        return keep_alive
+
+    async def _fill(self, key: str, method: str, target: str, headers: Headers, body: bytes,
+                    priority: str) -> Tuple[CachedResponse, str]:
+        """Fetch a missing entry, from disk or upstream, sharing it with identical requests"""
+        loop = asyncio.get_running_loop()
+        pending = loop.create_future()
+        self._inflight[key] = pending
+        try:
+            entry = await loop.run_in_executor(None, self.cache.load, key) if self.cache.disk else None
+            if entry is not None:
+                self.cache.disk_hits += 1
+                self.cache.put(key, entry)
+                pending.set_result(entry)
+                return entry, "HIT"
+
+            self.cache.misses += 1
+
+            async def fetch(backend: Backend, retryable: bool, reroute: bool) -> CachedResponse:
+                return await self._fetch(backend, method, target, headers, body, retryable, reroute)
+            try:
+                entry = await self._dispatch(method, target, body, fetch, priority)
+            except NoBackend as e:
+                pending.set_exception(e)
+                pending.exception()  # Nobody may be waiting; do not warn about it
+                raise
+            if entry.status == 200:
+                ttl = cache_ttl(method, target)
+                entry.expires_at = time.time() + ttl if ttl is not None else None
+                self.cache.put(key, entry)
+                if self.cache.disk:
+                    loop.run_in_executor(None, self.cache.save, key, entry)
+            pending.set_result(entry)
+            return entry, "MISS"
+        finally:
+            del self._inflight[key]
+            if not pending.done():
+                pending.cancel()
+
+    async def _dispatch(self, method: str, target: str, body: bytes,
+                        handle: Callable[[Backend, bool, bool], Awaitable[T]], priority: str = INTERACTIVE) -> T:
+        """Pick backends for a request until handle succeeds on one or retries run out
+
+        Each attempt first waits for a slot on its backend; a full queue
+        rejects the request at once.
+        """
+        path = target.split("?", 1)[0]
+        retryable = method in SAFE_METHODS or path in SAFE_PATHS
+        model = request_model(target, body)
+        tried: List[Backend] = []
+        error = "No healthy backends"
+        for attempt in range(self.retries + 1):
+            backend = self.pick(tried, model)
+            if backend is None:
+                break
+            if attempt:
+                self.retried += 1
+            if model is not None:
+                placement = self.placement(backend, model)
+                self.routed[placement] += 1
+                if placement == "installed" and path in LOADING_PATHS:
+                    # Send the model's next requests here too rather than load it twice
+                    self.inventory.note_loaded(backend.name, model)
+            tried.append(backend)
+            backend.outstanding += 1
+            try:
+                try:
+                    await backend.admission.acquire(priority)
+                except QueueFull as e:
+                    self.rejected += 1
+                    raise NoBackend(f"{backend.name}: {e}", 503, "Service Unavailable")
+                backend.requests += 1
+                try:
+                    reroute = attempt < self.retries and self._may_reroute(model, tried)
+                    return await handle(backend, retryable, reroute)
+                finally:
+                    backend.admission.release(priority)
+            except ModelNotFound as e:
+                error = f"{backend.name}: {e}"
+                self.inventory.forget(backend.name, model)
+            except UpstreamError as e:
+                error = f"{backend.name}: {e}"
+                if not e.stale:
+                    backend.errors += 1
+                    backend.eject(str(e))
+                if e.sent and not retryable:
+                    break
+            finally:
+                backend.outstanding -= 1
+
+        self.failures += 1
+        if tried:
+            raise NoBackend(error, 502, "Bad Gateway")
+        raise NoBackend(error, 503, "Service Unavailable")
+
+    def placement(self, backend: Backend, model: str) -> str:
+        if self.inventory is not None and self.inventory.has_loaded(backend.name, model):
+            return "loaded"
+        if self.inventory is not None and self.inventory.has_installed(backend.name, model):
+            return "installed"
+        return "elsewhere"
+
+    def _may_reroute(self, model: Optional[str], tried: List[Backend]) -> bool:
+        """Whether a 404 for the model can be retried on a backend that reportedly has it"""
+        if model is None or self.inventory is None:
+            return False
+        candidates, placement = self.candidates(tried, model)
+        return bool(candidates) and placement != "elsewhere"
+
+    async def _request(self, backend: Backend, method: str, target: str, headers: Headers, body: bytes,
+                       retryable: bool, reroute_missing: bool
+                       ) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter, str, int, Headers]:
+        """Send a request upstream and read the response head"""
+        lines = [f"{method} {target} HTTP/1.1"]
+        lines.extend(f"{name}: {value}" for name, value in headers
+                     if name.lower() not in HOP_BY_HOP + ("content-length", "transfer-encoding"))
+        if body or method in ("POST", "PUT", "PATCH"):
+            lines.append(f"Content-Length: {len(body)}")
+        lines.append("Connection: keep-alive")
+        request = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+        while True:
+            try:
+                reader, writer, reused = await backend.connect()
+            except (OSError, asyncio.TimeoutError) as e:
+                raise UpstreamError(f"Could not connect: {e or 'timed out'}", sent=False)
+            try:
+                writer.write(request)
+                await writer.drain()
+                response = await read_head(reader)
+                if response is None:
+                    raise UpstreamError("Connection closed without a response")
+                break
+            except (OSError, HTTPError, asyncio.IncompleteReadError, UpstreamError) as e:
+                writer.close()
+                if reused and retryable:
+                    continue  # The idle connection had gone stale; try a fresh one
+                raise UpstreamError(str(e) or type(e).__name__, stale=reused)
+
+        start, response_headers = response
+        try:
+            status = int(start.split(" ", 2)[1])
+        except (IndexError, ValueError):
+            writer.close()
+            raise UpstreamError(f"Malformed status line: {start!r}")
+        if status == 404 and reroute_missing:
+            # The inventory was out of date; nothing has reached the client yet
+            writer.close()
+            raise ModelNotFound("Model not found", sent=False)
+        return reader, writer, start, status, response_headers
+
+    async def _forward(self, backend: Backend, method: str, target: str, headers: Headers, body: bytes,
+                       client: asyncio.StreamWriter, keep_alive: bool, retryable: bool,
+                       reroute_missing: bool = False) -> bool:
+        reader, writer, start, status, response_headers = await self._request(
+            backend, method, target, headers, body, retryable, reroute_missing)
+        upstream_close = "close" in (get_header(response_headers, "connection") or "").lower()
+        delimited = not has_body(method, status) or is_chunked(response_headers) \
+            or get_header(response_headers, "content-length") is not None
+        keep_alive = keep_alive and delimited
+        head = [start]
+        head.extend(f"{name}: {value}" for name, value in response_headers
+                    if name.lower() not in ("connection", "keep-alive", "proxy-connection"))
+        head.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        head.append(f"X-Gateway-Backend: {backend.name}")
+
+        complete = False
+        try:
+            await send(client, ("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+            if has_body(method, status):
+                await relay_body(reader, client, response_headers)
+            complete = True
+        except ClientGone:
+            return False
+        except (OSError, HTTPError, asyncio.IncompleteReadError) as e:
+            # Part of the response is already out; all we can do is cut the client off
+            backend.errors += 1
+            backend.eject(f"Response broke off: {e or type(e).__name__}")
+            return False
+        finally:
+            if complete and delimited and not upstream_close:
+                backend.release(reader, writer)
+            else:
+                writer.close()
+        return keep_alive
+
+    async def _fetch(self, backend: Backend, method: str, target: str, headers: Headers, body: bytes,
+                     retryable: bool, reroute_missing: bool = False) -> CachedResponse:
+        """Read a whole response, for the cache and every client waiting on it
+
+        Nothing has reached a client while the body is read, so unlike a
+        relayed response a failure here can still be retried elsewhere.
+        """
+        reader, writer, start, status, response_headers = await self._request(
+            backend, method, target, headers, body, retryable, reroute_missing)
+        try:
+            data, reusable = await read_response_body(reader, method, status, response_headers)
+        except (OSError, HTTPError, asyncio.IncompleteReadError) as e:
+            writer.close()
+            raise UpstreamError(f"Response broke off: {e or type(e).__name__}")
+        if reusable and "close" not in (get_header(response_headers, "connection") or "").lower():
+            backend.release(reader, writer)
+        else:
+            writer.close()
+        kept = [(name, value) for name, value in response_headers
+                if name.lower() not in HOP_BY_HOP + ("content-length", "transfer-encoding")]
+        return CachedResponse(start, kept, data, backend.name)
+
+    def to_dict(self) -> Dict:
+        return {
+            "host": self.host,
+            "port": self.port,
+            "batch_port": self.batch_port,
+            "started_at": self.started_at,
+            "requests": self.requests,
+            "retries": self.retried,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "routed": dict(self.routed),
+            "backends": [backend.to_dict() for backend in self.backends],
+            "placement": self.inventory.placement(backend.name for backend in self.backends)
+            if self.inventory is not None else {},
+            "cache": self.cache.to_dict() if self.cache is not None else None,
+        }
@@ -0,0 +1,337 @@
+import csv
+import fnmatch
+import glob
+import os
+import re
+import shlex
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from .config import connection_tags
+
+SSH_CONFIG_PATH = Path.home() / ".ssh" / "config"
+FORMATS = ("ssh", "csv", "yaml")
+# Column and key spellings accepted for each connection field
+FIELD_ALIASES = {
+    "hostname": "host",
+    "address": "host",
+    "username": "user",
+    "identityfile": "identity_file",
+    "identity": "identity_file",
+    "key": "identity_file",
+    "replicas": "hosts",
+}
+# Names become key file names, so no path separators or leading dots
+NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+MAX_INCLUDE_DEPTH = 16
+# "Keyword value" or "Keyword=value"
+OPTION_RE = re.compile(r"(\S+?)\s*(?:=\s*|\s+)(.*)$")
+
+class InventoryError(ValueError):
+    """Raised for an inventory that cannot be read, or an entry that cannot be imported"""
+
+def detect_format(path: Path) -> str:
+    suffix = Path(path).suffix.lower()
+    if suffix == ".csv":
+        return "csv"
+    if suffix in (".yaml", ".yml"):
+        return "yaml"
+    return "ssh"
+
+def _ssh_config_lines(path: Path, depth: int = 0) -> Iterator[Tuple[str, str]]:
+    """(where, line) of an ssh_config file with Include directives expanded in place"""
+    if depth > MAX_INCLUDE_DEPTH:
+        raise InventoryError(f"{path}: Include nested more than {MAX_INCLUDE_DEPTH} deep")
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            match = OPTION_RE.match(line)
+            if match is None or match.group(1).lower() != "include":
+                yield f"{path}:{number}", line
+                continue
+            for pattern in shlex.split(match.group(2)):
+                pattern = os.path.expanduser(pattern)
+                if not os.path.isabs(pattern):
+                    # Relative includes are looked up in ~/.ssh, as ssh does for the user config
+                    pattern = str(Path.home() / ".ssh" / pattern)
+                for included in sorted(glob.glob(pattern)):
+                    yield from _ssh_config_lines(Path(included), depth + 1)
+
+def _host_matches(patterns: List[str], alias: str) -> bool:
+    """ssh_config Host matching: any pattern matches and no negated one does"""
+    matched = False
+    for pattern in patterns:
+        if pattern.startswith("!"):
+            if fnmatch.fnmatchcase(alias, pattern[1:]):
+                return False
+        elif fnmatch.fnmatchcase(alias, pattern):
+            matched = True
+    return matched
+
+def read_ssh_config(path: Path = SSH_CONFIG_PATH) -> Iterator[Tuple[str, Dict]]:
+    """One entry per concrete Host alias, with options resolved the way ssh does
+
+    The first value obtained for each option wins, across every Host block
+    the alias matches, so `Host *` defaults apply wherever an alias leaves
+    an option unset. Match blocks are skipped as they depend on runtime
+    conditions.
+    """
+    # (patterns, options); None patterns for a Match block
+    blocks: List[Tuple[Optional[List[str]], List[Tuple[str, str]]]] = [(["*"], [])]
+    aliases: Dict[str, str] = {}
+    for where, line in _ssh_config_lines(Path(path)):
+        match = OPTION_RE.match(line)
+        if match is None:
+            continue
+        keyword, value = match.group(1).lower(), match.group(2).strip()
+        if keyword == "host":
+            patterns = shlex.split(value)
+            blocks.append((patterns, []))
+            for pattern in patterns:
+                if not any(ch in pattern for ch in "*?!"):
+                    aliases.setdefault(pattern, where)
+        elif keyword == "match":
+            blocks.append((None, []))
+        else:
+            if len(value) > 1 and value[0] == value[-1] == '"':
+                value = value[1:-1]
+            blocks[-1][1].append((keyword, value))
+
+    for alias, where in aliases.items():
+        options: Dict[str, str] = {}
+        for patterns, block in blocks:
+            if patterns is not None and _host_matches(patterns, alias):
+                for keyword, value in block:
+                    options.setdefault(keyword, value)
+        record = {"name": alias, "host": options.get("hostname", alias).replace("%h", alias)}
+        if "port" in options:
+            record["port"] = options["port"]
+        if "user" in options:
+            record["user"] = options["user"]
+        if "identityfile" in options and options["identityfile"].lower() != "none":
+            record["identity_file"] = options["identityfile"].replace("%d", str(Path.home()))
+        yield where, record
+
+def read_csv(path: Path) -> Iterator[Tuple[str, Dict]]:
+    """One entry per row; the header names the fields, such as name,host,port,user,group,tags"""
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield f"{path}:{reader.line_num}", {
+                key.strip(): value.strip() for key, value in row.items()
+                if key is not None and value is not None and value.strip()
+            }
+
+def read_yaml(path: Path) -> Iterator[Tuple[str, Dict]]:
+    """Entries of a YAML list, or of a mapping of name to fields, optionally under "hosts"
+
+    Needs PyYAML, installed with the yaml extra.
+    """
+    try:
+        import yaml
+    except ImportError:
+        raise InventoryError("Reading YAML needs PyYAML: pip install -e .[yaml]")
+    with open(path) as f:
+        try:
+            data = yaml.safe_load(f)
+        except yaml.YAMLError as e:
+            raise InventoryError(f"{path}: {e}")
+    if isinstance(data, dict) and isinstance(data.get("hosts"), (list, dict)):
+        data = data["hosts"]
+    if isinstance(data, list):
+        for index, entry in enumerate(data):
+            yield f"{path}: entry {index + 1}", entry if isinstance(entry, dict) else {"host": entry}
+    elif isinstance(data, dict):
+        for name, entry in data.items():
+            if entry is None:
+                entry = {"host": name}
+            elif not isinstance(entry, dict):
+                entry = {"host": entry}
+            yield f"{path}: {name}", {"name": str(name), **entry}
+    elif data is not None:
+        raise InventoryError(f"{path}: expected a list or a mapping of hosts")
+
+def read_inventory(path: Path, fmt: Optional[str] = None) -> Iterator[Tuple[str, Dict]]:
+    """(where, fields) of each entry of an inventory, read as it is consumed"""
+    fmt = fmt or detect_format(path)
+    if fmt not in FORMATS:
+        raise InventoryError(f"Unknown format {fmt!r}; use one of {', '.join(FORMATS)}")
+    reader = {"ssh": read_ssh_config, "csv": read_csv, "yaml": read_yaml}[fmt]
+    try:
+        yield from reader(path)
+    except OSError as e:
+        raise InventoryError(f"Could not read {path}: {e.strerror or e}")
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise InventoryError(f"{path}: {e}")
+
+def canonical_fields(fields: Dict) -> Dict:
+    """Entry fields under the names connection configs use"""
+    return {FIELD_ALIASES.get(str(key).lower(), str(key).lower()): value for key, value in fields.items()}
+
+def normalize(fields: Dict) -> Tuple[str, Dict]:
+    """Name and connection config of an inventory entry; InventoryError if it has none"""
+    fields = canonical_fields(fields)
+    host = str(fields.get("host") or "").strip()
+    if not host:
+        raise InventoryError("no host")
+    name = str(fields.pop("name", None) or host).strip()
+    if not NAME_RE.match(name):
+        raise InventoryError(f"invalid name {name!r}; use letters, digits, '.', '_' and '-'")
+    try:
+        port = int(fields.get("port") or 22)
+    except (TypeError, ValueError):
+        raise InventoryError(f"invalid port {fields.get('port')!r}")
+    if not 1 <= port <= 65535:
+        raise InventoryError(f"port {port} out of range")
+    config = {**fields, "name": name, "host": host, "port": port}
+    if "tags" in config:
+        config["tags"] = connection_tags(config)
+    if isinstance(config.get("hosts"), str):
+        config["hosts"] = [entry.strip() for entry in config["hosts"].split(",") if entry.strip()]
+    return name, config
+
+class ImportResult:
+    """What importing one inventory entry did"""
+
+    def __init__(self, name: Optional[str], host: Optional[str], where: str, status: str,
+                 detail: Optional[str] = None):
+        self.name = name
+        self.host = host
+        self.where = where
+        # added, updated, unchanged, conflict, duplicate or invalid
+        self.status = status
+        self.detail = detail
+        self.identity_file: Optional[str] = None
+        # generated, linked, existing or failed; None when keys were not provisioned
+        self.key: Optional[str] = None
+
+    @property
+    def imported(self) -> bool:
+        return self.status in ("added", "updated", "unchanged")
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "host": self.host,
+            "where": self.where,
+            "status": self.status,
+            "detail": self.detail,
+            "key": self.key,
+        }
+
+# Fields compared to tell an unchanged entry from a conflicting one
+COMPARED_FIELDS = ("host", "port", "user", "hosts", "group", "tags")
+
+def import_connections(config_manager, entries: Iterator[Tuple[str, Dict]], update: bool = False,
+                       group: Optional[str] = None, dry_run: bool = False) -> List[ImportResult]:
+    """Upsert every entry into the store in one batch
+
+    An entry whose name exists with other settings is a conflict and is left
+    alone unless `update` is set, in which case its fields are merged over
+    the existing config. Later entries with a name already imported are
+    duplicates. Nothing is written on a dry run.
+    """
+    results = []
+    seen: Dict[str, str] = {}
+    # Which name already reaches each host, to point out aliases
+    by_host = {(config.get("host"), config.get("port", 22)): name
+               for name, config in config_manager.iter_connections()}
+
+    def apply(connections):
+        now = datetime.now().isoformat()
+        for where, fields in entries:
+            try:
+                name, config = normalize(fields)
+            except InventoryError as e:
+                fields = canonical_fields(fields)
+                results.append(ImportResult(fields.get("name"), fields.get("host"), where, "invalid", str(e)))
+                continue
+            if group is not None:
+                config.setdefault("group", group)
+            identity_file = config.pop("identity_file", None)
+            if name in seen:
+                results.append(ImportResult(name, config["host"], where, "duplicate", f"already imported from {seen[name]}"))
+                continue
+            seen[name] = where
+            existing = connections.get(name)
+            other = by_host.get((config["host"], config["port"]))
+            detail = f"same host as {other}" if other not in (None, name) else None
+            changed = [key for key in COMPARED_FIELDS if key in config and existing is not None
+                       and existing.get(key) != config[key]]
+            # Settings the existing connection lacks are filled in; ones it has are not overwritten
+            conflicting = [key for key in changed if existing.get(key) is not None]
+            if existing is None:
+                status = "added"
+            elif not changed:
+                status = "unchanged"
+            elif conflicting and not update:
+                differences = ", ".join(f"{key} {existing[key]!r} -> {config[key]!r}" for key in conflicting)
+                results.append(ImportResult(name, config["host"], where, "conflict", differences))
+                continue
+            else:
+                status = "updated"
+                detail = ", ".join(f"{key} {existing.get(key)!r} -> {config[key]!r}" for key in changed)
+                config = {**existing, **config}
+            result = ImportResult(name, config["host"], where, status, detail)
+            result.identity_file = identity_file
+            results.append(result)
+            if status != "unchanged":
+                config["last_modified"] = now
+                connections[name] = config
+                by_host.setdefault((config["host"], config["port"]), name)
+
+    if dry_run:
+        apply(config_manager.load_connections())
+    else:
+        with config_manager.batch() as connections:
+            apply(connections)
+    return results
+
+def provision_key(name: str, identity_file: Optional[str] = None) -> Tuple[str, str, Optional[str]]:
+    """Give a connection a key unless it has one: link its IdentityFile, or generate an ed25519 pair
+
+    Runs in a worker thread; returns (name, outcome, error).
+    """
+    from .ssh import SSHKeyManager
+    ssh_manager = SSHKeyManager()
+    key_path = ssh_manager.get_key_path(name)
+    if key_path.exists():
+        return name, "existing", None
+    try:
+        if identity_file:
+            identity = Path(os.path.expanduser(identity_file))
+            if identity.exists():
+                key_path.symlink_to(identity.resolve())
+                public = identity.with_name(identity.name + ".pub")
+                if public.exists():
+                    key_path.with_name(key_path.name + ".pub").symlink_to(public.resolve())
+                return name, "linked", None
+        ssh_manager.generate_key(name, quiet=True)
+    except Exception as e:
+        return name, "failed", str(e) or type(e).__name__
+    return name, "generated", None
+
+def provision_keys(results: List[ImportResult], workers: Optional[int] = None, on_done=None):
+    """Provision keys for every imported entry across a pool of threads
+
+    The work is done by ssh-keygen child processes, so threads run them in
+    parallel without paying to start and import a Python process per worker.
+    """
+    jobs = [result for result in results if result.imported]
+    if not jobs:
+        return
+    by_name = {result.name: result for result in jobs}
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(provision_key, result.name, result.identity_file) for result in jobs]
+        for future in as_completed(futures):
+            name, outcome, error = future.result()
+            result = by_name[name]
+            result.key = outcome
+            if error is not None:
+                result.detail = f"key: {error}" if result.detail is None else f"{result.detail}; key: {error}"
+            if on_done is not None:
+                on_done(result)
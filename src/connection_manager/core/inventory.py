@@ -0,0 +1,115 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set, Union
+from ..utils.health import DEFAULT_TIMEOUT, MAX_PROBE_WORKERS, fetch_json
+
+# Models come and go far less often than tunnels fail, so refresh less often than health
+INVENTORY_TTL = 30.0
+
+def model_key(name: str) -> str:
+    """Ollama treats "llama3" and "llama3:latest" as the same model"""
+    return name if ":" in name.rsplit("/", 1)[-1] else f"{name}:latest"
+
+class ModelInventory:
+    """Models one server has on disk and loaded in memory, as of the last refresh"""
+
+    def __init__(self, installed: Iterable[str] = (), loaded: Iterable[str] = (),
+                 error: Optional[str] = None, digests: Optional[Dict[str, str]] = None):
+        self.installed: Set[str] = {model_key(name) for name in installed}
+        self.loaded: Set[str] = {model_key(name) for name in loaded}
+        # Content digest of each installed model; it changes when a tag is pulled again
+        self.digests: Dict[str, str] = {model_key(name): digest for name, digest in (digests or {}).items()}
+        self.error = error
+        self.refreshed_at = time.time()
+
+    def to_dict(self) -> Dict:
+        return {
+            "installed": sorted(self.installed),
+            "loaded": sorted(self.loaded),
+            "error": self.error,
+            "refreshed_at": self.refreshed_at,
+        }
+
+def fetch_inventory(endpoint: Union[int, str], timeout: float = DEFAULT_TIMEOUT) -> ModelInventory:
+    """Ask a server for its models (/api/tags) and the ones it has loaded (/api/ps)"""
+    try:
+        tags = fetch_json(endpoint, "/api/tags", timeout)
+        running = fetch_json(endpoint, "/api/ps", timeout)
+    except Exception as e:
+        return ModelInventory(error=str(e) or type(e).__name__)
+    models = tags.get("models") or []
+    return ModelInventory(
+        (model.get("name") or model.get("model") for model in models),
+        (model.get("name") or model.get("model") for model in running.get("models") or []),
+        digests={model.get("name") or model.get("model"): model["digest"]
+                 for model in models if model.get("digest")},
+    )
+
+def fetch_many(endpoints: Dict[str, Union[int, str]], timeout: float = DEFAULT_TIMEOUT) -> Dict[str, ModelInventory]:
+    """Fetch the inventory of many connections at once, keyed like endpoints"""
+    if not endpoints:
+        return {}
+    names = sorted(endpoints)
+    with ThreadPoolExecutor(max_workers=min(MAX_PROBE_WORKERS, len(names))) as executor:
+        inventories = executor.map(lambda name: fetch_inventory(endpoints[name], timeout), names)
+        return dict(zip(names, inventories))
+
+class InventoryCache:
+    """Latest model inventory per connection, due for a refresh after `ttl` seconds"""
+
+    def __init__(self, ttl: float = INVENTORY_TTL):
+        self.ttl = ttl
+        self._inventories: Dict[str, ModelInventory] = {}
+
+    def get(self, name: str) -> Optional[ModelInventory]:
+        return self._inventories.get(name)
+
+    def stale(self, names: Iterable[str]) -> List[str]:
+        now = time.time()
+        return [name for name in names
+                if name not in self._inventories or now - self._inventories[name].refreshed_at >= self.ttl]
+
+    def update(self, inventories: Dict[str, ModelInventory]):
+        self._inventories.update(inventories)
+
+    def discard(self, name: str):
+        self._inventories.pop(name, None)
+
+    def has_loaded(self, name: str, model: str) -> bool:
+        inventory = self._inventories.get(name)
+        return inventory is not None and model in inventory.loaded
+
+    def has_installed(self, name: str, model: str) -> bool:
+        inventory = self._inventories.get(name)
+        return inventory is not None and model in inventory.installed
+
+    def digests(self, names: Iterable[str], model: str) -> List[str]:
+        """Every digest the given connections report for the model"""
+        inventories = (self._inventories.get(name) for name in names)
+        return sorted({inventory.digests[model] for inventory in inventories
+                       if inventory is not None and model in inventory.digests})
+
+    def note_loaded(self, name: str, model: str):
+        """Record a model a request is about to load, ahead of the next refresh"""
+        inventory = self._inventories.get(name)
+        if inventory is not None:
+            inventory.installed.add(model)
+            inventory.loaded.add(model)
+
+    def forget(self, name: str, model: str):
+        """Record that the server turned out not to have the model"""
+        inventory = self._inventories.get(name)
+        if inventory is not None:
+            inventory.installed.discard(model)
+            inventory.loaded.discard(model)
+
+    def placement(self, names: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, List[str]]]:
+        """Which connections have each model loaded and which only on disk"""
+        names = sorted(self._inventories if names is None else set(names) & set(self._inventories))
+        placement: Dict[str, Dict[str, List[str]]] = {}
+        for name in names:
+            inventory = self._inventories[name]
+            for model in inventory.installed | inventory.loaded:
+                entry = placement.setdefault(model, {"loaded": [], "installed": []})
+                entry["loaded" if model in inventory.loaded else "installed"].append(name)
+        return dict(sorted(placement.items()))
@@ -0,0 +1,163 @@
+import json
+import os
+import socket
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+from ..utils.files import atomic_write, file_lock
+from ..utils.procfs import process_alive, process_identity
+
+PORTS_PATH = Path.home() / ".connections" / "ports.json"
+# Set to "start-end" to hand out ports from another range
+PORT_RANGE_ENV = "CONNECTION_MANAGER_PORT_RANGE"
+DEFAULT_PORT_RANGE = (11434, 11533)
+
+class PortAllocationError(Exception):
+    """Raised when a connection cannot be given a local port"""
+
+def port_range_from_env() -> Tuple[int, int]:
+    value = os.environ.get(PORT_RANGE_ENV)
+    if not value:
+        return DEFAULT_PORT_RANGE
+    try:
+        start, end = (int(part) for part in value.split("-", 1))
+    except ValueError:
+        raise PortAllocationError(f"{PORT_RANGE_ENV} must look like 11434-11533, got {value!r}")
+    return start, end
+
+def lease_alive(lease: Dict) -> bool:
+    """Whether the process that took the lease, or the ssh bound to it, is still running
+
+    Both are checked against the identity recorded with the lease, so a PID
+    reused after a reboot or wraparound does not keep the port held.
+    """
+    return process_alive(lease.get("owner"), lease.get("owner_identity")) \
+        or process_alive(lease.get("pid"), lease.get("identity"))
+
+def port_free(port: int, host: str = "127.0.0.1") -> bool:
+    """Whether ssh could bind the port right now"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        # ssh sets SO_REUSEADDR, so ports lingering in TIME_WAIT are usable
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind((host, port))
+        except OSError:
+            return False
+    return True
+
+class PortAllocator:
+    """Hands out local ports from a lease registry shared by every process
+
+    Leases live in ~/.connections/ports.json and are only changed under an
+    exclusive lock, so concurrent connects never pick the same port.
+    A lease records the process that asked for it and, once started, the ssh
+    process bound to the port, each with its start time and command line;
+    it is reclaimed when both are gone. Every
+    connection remembers the last port it had and gets it back when free.
+    """
+
+    def __init__(self, port_range: Optional[Tuple[int, int]] = None, path: Path = PORTS_PATH):
+        self.port_range = port_range or port_range_from_env()
+        self.path = Path(path)
+        self.lock_file = self.path.with_name(self.path.name + ".lock")
+
+    def _load(self) -> Dict:
+        try:
+            registry = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            registry = {}
+        registry.setdefault("leases", {})
+        registry.setdefault("sticky", {})
+        return registry
+
+    @contextmanager
+    def _registry(self) -> Iterator[Dict]:
+        """Load the registry under the lock, drop dead leases and save it afterwards"""
+        self.path.parent.mkdir(exist_ok=True)
+        with file_lock(self.lock_file):
+            registry = self._load()
+            leases = registry["leases"]
+            for name in [name for name, lease in leases.items() if not lease_alive(lease)]:
+                del leases[name]
+            yield registry
+            atomic_write(self.path, json.dumps(registry, indent=2))
+
+    def allocate(self, name: str, port: Optional[int] = None) -> int:
+        """Lease a port for one connection; an explicit port must be available"""
+        return self.allocate_many({name: port}, strict=port is not None)[name]
+
+    def allocate_many(self, requests: Dict[str, Optional[int]], strict: bool = False) -> Dict[str, int]:
+        """Lease ports for many connections under a single lock
+
+        requests maps connection names to a preferred port or None. Unless
+        strict, an unavailable preferred port falls back to the sticky port
+        and then the first free port in the range.
+        """
+        owner = os.getpid()
+        owner_identity = process_identity(owner)
+        assigned = {}
+        with self._registry() as registry:
+            leases, sticky = registry["leases"], registry["sticky"]
+            taken = {lease["port"] for name, lease in leases.items() if name not in requests}
+
+            for name, preferred in requests.items():
+                lease = leases.get(name)
+                if lease is not None and lease.get("owner") != owner:
+                    raise PortAllocationError(
+                        f"{name} already holds port {lease['port']} (PID: {lease.get('pid') or lease.get('owner')})"
+                    )
+
+                candidates = [preferred, lease["port"] if lease else None, sticky.get(name)]
+                if strict and preferred is not None:
+                    candidates = [preferred]
+                port = next(
+                    (port for port in candidates
+                     if port is not None and port not in taken and (lease and port == lease["port"] or port_free(port))),
+                    None
+                )
+                if port is None and strict and preferred is not None:
+                    raise PortAllocationError(f"Port {preferred} is already in use")
+                if port is None:
+                    # Keep clear of ports other connections will want back
+                    remembered = {port for other, port in sticky.items() if other != name}
+                    port = self._scan(taken, remembered)
+
+                taken.add(port)
+                assigned[name] = port
+                leases[name] = {"port": port, "owner": owner, "owner_identity": owner_identity,
+                                "pid": None, "identity": None, "leased_at": time.time()}
+                sticky[name] = port
+        return assigned
+
+    def _scan(self, taken: Iterable[int], avoid: Iterable[int] = ()) -> int:
+        start, end = self.port_range
+        taken, avoid = set(taken), set(avoid)
+        for skip in (taken | avoid, taken):
+            for port in range(start, end + 1):
+                if port not in skip and port_free(port):
+                    return port
+        raise PortAllocationError(f"No free port left in {start}-{end}")
+
+    def attach(self, pids: Dict[str, Optional[int]]):
+        """Record the ssh process bound to each connection's leased port"""
+        identities = {pid: process_identity(pid) for pid in set(pids.values())}
+        with self._registry() as registry:
+            for name, pid in pids.items():
+                lease = registry["leases"].get(name)
+                if lease is not None:
+                    lease["pid"] = pid
+                    lease["identity"] = identities[pid]
+
+    def release(self, *names: str):
+        """Give leased ports back; connections keep them as their sticky port"""
+        with self._registry() as registry:
+            for name in names:
+                registry["leases"].pop(name, None)
+
+    def leases(self) -> Dict[str, Dict]:
+        """Live leases by connection; only reads, so status never rewrites the registry"""
+        self.path.parent.mkdir(exist_ok=True)
+        with file_lock(self.lock_file, shared=True):
+            registry = self._load()
+        return {name: lease for name, lease in registry["leases"].items() if lease_alive(lease)}
@@ -0,0 +1,317 @@
+import asyncio
+import re
+import subprocess
+import threading
+import time
+from collections import deque
+from typing import IO, Callable, Deque, Dict, List, Optional, Set, Tuple, Union
+from .defaults import DEFAULT_READY_TIMEOUT
+from .forwards import OLLAMA_PORT, Forward
+from ..utils.tracing import record
+
+# Printed by `ssh -v` once the local side of a -L forward is bound
+LISTENING_MARKER = "Local forwarding listening"
+# The same line for -L and -D forwards, and the server's answer to a -R request
+LISTENING_RE = re.compile(r"Local forwarding listening on \S+ port (\d+)")
+LISTENING_PATH_RE = re.compile(r"Local forwarding listening on path (.+)\.$")
+REMOTE_FORWARD_RE = re.compile(r"remote forward success for: listen (?:[^,\s]*:)?(\d+),")
+# Fallback wake-up so a silent process exit is still noticed
+POLL_INTERVAL = 0.1
+# Delay between probes of a forward just added to a master connection
+FORWARD_PROBE_INTERVAL = 0.05
+# `ssh -v` lines that mark each step of bringing a connection up, in order.
+# ssh does not timestamp them, so a step is timed by when its line is read
+SSH_MARKS = (
+    ("connecting", ("debug1: Connecting to ",)),
+    ("connected", ("debug1: Connection established",)),
+    ("banner", ("Remote protocol version",)),
+    ("kex", ("SSH2_MSG_KEXINIT sent",)),
+    ("keys", ("SSH2_MSG_NEWKEYS received",)),
+    # Older releases only log the second
+    ("authenticated", ("Authenticated to ", "Authentication succeeded")),
+)
+# Each phase runs between two marks; None is the start or the end of the run
+SSH_PHASES = (
+    ("ssh.startup", None, "connecting"),  # Reading config and resolving the host
+    ("ssh.tcp", "connecting", "connected"),
+    ("ssh.banner", "connected", "banner"),
+    ("ssh.kex", "kex", "keys"),
+    ("ssh.auth", "keys", "authenticated"),
+)
+# How often a log file is checked for new lines
+LOG_POLL_INTERVAL = 0.005
+
+def record_ssh_mark(marks: Dict[str, float], line: str):
+    """Note when a line marking a step of the handshake was seen"""
+    if len(marks) == len(SSH_MARKS):
+        return
+    for name, markers in SSH_MARKS:
+        if name not in marks and any(marker in line for marker in markers):
+            marks[name] = time.monotonic()
+            return
+
+def trace_ssh_phases(marks: Dict[str, float], started: float, finished: float, last: str):
+    """Add a span for every handshake phase both ends of which were seen
+
+    `last` names the phase from authentication to `finished`, such as
+    waiting for the forwards.
+    """
+    points = dict(marks)
+    for name, begin, end in SSH_PHASES + ((last, "authenticated", None),):
+        start = started if begin is None else points.get(begin)
+        stop = finished if end is None else points.get(end)
+        if start is not None and stop is not None:
+            record(name, start, stop)
+
+def follow_ssh_log(process: subprocess.Popen, log: IO[bytes], marks: Dict[str, float]) -> int:
+    """Wait for process, noting handshake marks as its lines reach the log file"""
+    position, pending = 0, b""
+    while True:
+        exited = process.poll() is not None
+        log.seek(position)
+        data = log.read()
+        position += len(data)
+        *lines, pending = (pending + data).split(b"\n")
+        for line in lines:
+            record_ssh_mark(marks, line.decode(errors="replace"))
+        if exited:
+            return process.returncode
+        time.sleep(LOG_POLL_INTERVAL)
+
+def record_forward_line(watcher: Union["StderrWatcher", "AsyncStderrWatcher"], line: str) -> bool:
+    """Note a forward ssh reports as bound; True if the line was one"""
+    match = LISTENING_RE.search(line)
+    if match:
+        watcher.listening_ports.add(int(match.group(1)))
+        return True
+    match = LISTENING_PATH_RE.search(line)
+    if match:
+        watcher.listening_paths.add(match.group(1))
+        return True
+    match = REMOTE_FORWARD_RE.search(line)
+    if match:
+        watcher.remote_ports.add(int(match.group(1)))
+        return True
+    return False
+
+class StderrWatcher:
+    """Drain an ssh process's stderr in the background and flag readiness markers"""
+
+    def __init__(self, process: subprocess.Popen, max_lines: int = 200):
+        self.process = process
+        self.lines: Deque[str] = deque(maxlen=max_lines)
+        self.listening = threading.Event()
+        self.listening_ports: Set[int] = set()
+        self.listening_paths: Set[str] = set()
+        self.remote_ports: Set[int] = set()
+        self.closed = threading.Event()
+        self.notify: Optional[Callable[[], None]] = None
+        self.started = time.monotonic()
+        self.marks: Dict[str, float] = {}
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> "StderrWatcher":
+        self._thread.start()
+        return self
+
+    def _run(self):
+        # Keep reading for the life of the process so verbose ssh output
+        # never fills the pipe and stalls the tunnel
+        for raw in iter(self.process.stderr.readline, b""):
+            line = raw.decode(errors="replace").rstrip()
+            self.lines.append(line)
+            record_ssh_mark(self.marks, line)
+            if record_forward_line(self, line):
+                self.listening.set()
+                self._notify()
+        self.closed.set()
+        self._notify()
+
+    def _notify(self):
+        callback = self.notify
+        if callback is not None:
+            try:
+                callback()
+            except RuntimeError:
+                # The waiting event loop has already finished
+                pass
+
+    def returncode(self) -> Optional[int]:
+        return self.process.poll()
+
+    async def wait_closed(self, timeout: float):
+        await asyncio.get_running_loop().run_in_executor(None, self.closed.wait, timeout)
+
+class AsyncStderrWatcher:
+    """StderrWatcher counterpart for processes started with asyncio.create_subprocess_exec"""
+
+    def __init__(self, process: "asyncio.subprocess.Process", max_lines: int = 200):
+        self.process = process
+        self.lines: Deque[str] = deque(maxlen=max_lines)
+        self.listening = asyncio.Event()
+        self.listening_ports: Set[int] = set()
+        self.listening_paths: Set[str] = set()
+        self.remote_ports: Set[int] = set()
+        self.closed = asyncio.Event()
+        self.notify: Optional[Callable[[], None]] = None
+        self.started = time.monotonic()
+        self.marks: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> "AsyncStderrWatcher":
+        self._task = asyncio.ensure_future(self._run())
+        return self
+
+    async def _run(self):
+        while True:
+            raw = await self.process.stderr.readline()
+            if not raw:
+                break
+            line = raw.decode(errors="replace").rstrip()
+            self.lines.append(line)
+            record_ssh_mark(self.marks, line)
+            if record_forward_line(self, line):
+                self.listening.set()
+                self._notify()
+        self.closed.set()
+        self._notify()
+
+    def _notify(self):
+        if self.notify is not None:
+            self.notify()
+
+    def returncode(self) -> Optional[int]:
+        return self.process.returncode
+
+    async def wait_closed(self, timeout: float):
+        try:
+            await asyncio.wait_for(self.closed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+def parse_ssh_error(lines, returncode: Optional[int] = None) -> str:
+    """Pick the meaningful error lines out of ssh's stderr"""
+    errors = [
+        line for line in lines
+        if line and not line.startswith(("debug", "OpenSSH_", "Transferred:"))
+    ]
+    if errors:
+        return "; ".join(errors[-3:])
+    if returncode is not None:
+        return f"ssh exited with code {returncode}"
+    return "ssh exited unexpectedly"
+
+async def probe_port(port: int, timeout: float, host: str = "127.0.0.1") -> bool:
+    """Check that something accepts connections on the local port"""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    await _close_probe(writer)
+    return True
+
+async def probe_socket(path: str, timeout: float) -> bool:
+    """Check that something accepts connections on the Unix socket"""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_unix_connection(path), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    await _close_probe(writer)
+    return True
+
+async def _close_probe(writer: asyncio.StreamWriter):
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+
+async def probe_forward(forward: Forward, timeout: float) -> bool:
+    """Connect to the local end of a forward; remote forwards have none to check"""
+    if forward.local_socket is not None:
+        return await probe_socket(forward.local_socket, timeout)
+    if forward.kind == "remote":
+        return True
+    return await probe_port(forward.local_port, timeout)
+
+async def wait_for_forward(forward: Forward, deadline: float) -> bool:
+    """Probe a forward added to a master until it answers or the deadline passes"""
+    while True:
+        remaining = deadline - time.monotonic()
+        if await probe_forward(forward, max(remaining, FORWARD_PROBE_INTERVAL)):
+            return True
+        if remaining <= FORWARD_PROBE_INTERVAL:
+            return False
+        await asyncio.sleep(FORWARD_PROBE_INTERVAL)
+
+def forward_bound(watcher: Union[StderrWatcher, AsyncStderrWatcher], forward: Forward) -> bool:
+    if forward.local_socket is not None:
+        return forward.local_socket in watcher.listening_paths
+    if forward.kind == "remote":
+        return forward.remote_port in watcher.remote_ports
+    return forward.local_port in watcher.listening_ports
+
+async def wait_for_forwards(watcher: Union[StderrWatcher, AsyncStderrWatcher], forwards: List[Forward],
+                            timeout: float = DEFAULT_READY_TIMEOUT) -> Tuple[bool, Optional[str]]:
+    """Wait until every forward works, the process dies or the deadline passes
+
+    Each forward's ready flag and error are updated as it goes.
+    """
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+    watcher.notify = lambda: loop.call_soon_threadsafe(changed.set)
+    deadline = loop.time() + timeout
+    for forward in forwards:
+        forward.reset()
+    try:
+        while True:
+            changed.clear()
+            pending = [forward for forward in forwards if not forward.ready]
+            returncode = watcher.returncode()
+            if returncode is not None:
+                # Give the reader a moment to collect the final error lines
+                await watcher.wait_closed(1.0)
+                error = parse_ssh_error(watcher.lines, returncode)
+                for forward in pending:
+                    forward.error = error
+                return False, error
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                for forward in pending:
+                    forward.error = f"Not ready after {timeout:g}s"
+                names = ", ".join(forward.name for forward in pending)
+                if len(forwards) == 1:
+                    return False, f"Tunnel was not ready after {timeout:g}s"
+                return False, f"Forwards not ready after {timeout:g}s: {names}"
+
+            # Only trust a port once ssh has bound it, otherwise an
+            # unrelated listener would look like a working tunnel. The server
+            # confirms remote forwards itself.
+            for forward in pending:
+                if forward_bound(watcher, forward) and await probe_forward(forward, remaining):
+                    forward.ready = True
+            if all(forward.ready for forward in forwards):
+                return True, None
+
+            try:
+                await asyncio.wait_for(changed.wait(), min(POLL_INTERVAL, remaining))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        watcher.notify = None
+        trace_ssh_phases(watcher.marks, watcher.started, time.monotonic(), "ssh.forwards")
+
+async def wait_until_ready(watcher: Union[StderrWatcher, AsyncStderrWatcher], local_port: int,
+                           timeout: float = DEFAULT_READY_TIMEOUT) -> Tuple[bool, Optional[str]]:
+    """Wait until a single -L forward on local_port accepts connections"""
+    return await wait_for_forwards(watcher, [Forward("tunnel", local_port=local_port, remote_port=OLLAMA_PORT)], timeout)
+
+def wait_for_tunnel(process: subprocess.Popen, local_port: int,
+                    timeout: float = DEFAULT_READY_TIMEOUT,
+                    forwards: Optional[List[Forward]] = None) -> Tuple[bool, Optional[str]]:
+    """Block until a freshly started `ssh -v` process is forwarding"""
+    watcher = StderrWatcher(process).start()
+    if forwards is None:
+        return asyncio.run(wait_until_ready(watcher, local_port, timeout))
+    return asyncio.run(wait_for_forwards(watcher, forwards, timeout))
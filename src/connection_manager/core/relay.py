@@ -0,0 +1,221 @@
+import asyncio
+import os
+import socket
+import subprocess
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+from rich.console import Console
+
+console = Console()
+
+# os.splice exists on Linux from Python 3.10; elsewhere bytes go through a buffer
+ZERO_COPY = hasattr(os, "splice")
+# One pipe's worth, which is what a single splice can move
+CHUNK = 65536
+# How long a channel gets to exit on its own once both directions are done
+CHANNEL_EXIT_TIMEOUT = 2.0
+
+class RelaySession:
+    """One client connection and the ssh channel carrying it"""
+
+    def __init__(self, peer: str):
+        self.peer = peer
+        self.started_at = time.time()
+        self.bytes_up = 0
+        self.bytes_down = 0
+
+    def to_dict(self) -> Dict:
+        return {
+            "peer": self.peer,
+            "started_at": self.started_at,
+            "bytes_up": self.bytes_up,
+            "bytes_down": self.bytes_down,
+        }
+
+async def _ready(fd: int, writable: bool = False):
+    """Wait until fd can be read, or written"""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    add, remove = (loop.add_writer, loop.remove_writer) if writable else (loop.add_reader, loop.remove_reader)
+    # The selector may report fd again before this task resumes
+    add(fd, lambda: future.done() or future.set_result(None))
+    try:
+        await future
+    finally:
+        remove(fd)
+
+async def pump(src: int, dst: int, count: Callable[[int], None], zero_copy: bool = ZERO_COPY):
+    """Move bytes from src to dst until src ends, never reading faster than dst drains
+
+    Both fds must be non-blocking, and with zero_copy one of them a pipe:
+    splice then moves the bytes inside the kernel. Otherwise one buffer is
+    reused for the life of the pump.
+    """
+    buffer = None if zero_copy else bytearray(CHUNK)
+    view = None if buffer is None else memoryview(buffer)
+    while True:
+        await _ready(src)
+        try:
+            if zero_copy:
+                moved = os.splice(src, dst, CHUNK, flags=os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK)
+            else:
+                moved = os.readv(src, [buffer])
+        except BlockingIOError:
+            # src had data, so dst is full; wait for room rather than spin.
+            # If the wakeup was spurious, the next wait on src blocks instead
+            await _ready(dst, writable=True)
+            continue
+        if moved == 0:
+            return
+        if view is not None:
+            sent = 0
+            while sent < moved:
+                try:
+                    sent += os.write(dst, view[sent:moved])
+                except BlockingIOError:
+                    await _ready(dst, writable=True)
+        count(moved)
+
+class Relay:
+    """Local listener relaying each connection over its own ssh stdio channel
+
+    Every accepted connection starts `channel_command()`, normally an
+    `ssh -W` that multiplexes over the host's master connection, and bytes
+    move between the client socket and the channel's pipes in this
+    process. Because the local leg is ours, bytes are counted per session
+    and in total, and a slow reader on either side holds back the other
+    instead of piling up in memory.
+    """
+
+    def __init__(self, channel_command: Callable[[], List[str]], port: int = 0,
+                 host: str = "127.0.0.1", zero_copy: bool = ZERO_COPY):
+        self.channel_command = channel_command
+        self.port = port
+        self.host = host
+        self.zero_copy = zero_copy
+        self.connections = 0
+        self.failures = 0
+        self.bytes_up = 0
+        self.bytes_down = 0
+        self.last_error: Optional[str] = None
+        self.sessions: Dict[asyncio.Task, RelaySession] = {}
+        self._listener: Optional[socket.socket] = None
+        self._accept_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            listener.bind((self.host, self.port))
+            listener.listen(128)
+        except OSError:
+            listener.close()
+            raise
+        listener.setblocking(False)
+        self._listener = listener
+        self.port = listener.getsockname()[1]
+        self._accept_task = asyncio.ensure_future(self._accept_loop())
+
+    async def close(self):
+        if self._accept_task is not None:
+            self._accept_task.cancel()
+            await asyncio.gather(self._accept_task, return_exceptions=True)
+        if self._listener is not None:
+            self._listener.close()
+        for task in self.sessions:
+            task.cancel()
+        await asyncio.gather(*self.sessions, return_exceptions=True)
+
+    async def _accept_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            client, address = await loop.sock_accept(self._listener)
+            client.setblocking(False)
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.connections += 1
+            session = RelaySession(f"{address[0]}:{address[1]}")
+            task = asyncio.ensure_future(self._relay(client, session))
+            self.sessions[task] = session
+            task.add_done_callback(self.sessions.pop)
+
+    async def _relay(self, client: socket.socket, session: RelaySession):
+        loop = asyncio.get_running_loop()
+        # The master connection ssh may leave behind inherits stderr, so a
+        # file rather than a pipe, as in SSHKeyManager.open_master
+        stderr = tempfile.TemporaryFile()
+        try:
+            channel = subprocess.Popen(self.channel_command(), stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE, stderr=stderr)
+        except OSError as e:
+            self.failures += 1
+            self.last_error = f"Could not start channel: {e}"
+            client.close()
+            stderr.close()
+            return
+        os.set_blocking(channel.stdin.fileno(), False)
+        os.set_blocking(channel.stdout.fileno(), False)
+
+        def up(moved: int):
+            session.bytes_up += moved
+            self.bytes_up += moved
+
+        def down(moved: int):
+            session.bytes_down += moved
+            self.bytes_down += moved
+
+        async def client_to_channel():
+            await pump(client.fileno(), channel.stdin.fileno(), up, self.zero_copy)
+            channel.stdin.close()  # EOF on the channel's stdin half-closes the remote side
+
+        async def channel_to_client():
+            await pump(channel.stdout.fileno(), client.fileno(), down, self.zero_copy)
+            try:
+                client.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass  # The client is already gone
+
+        directions = [asyncio.ensure_future(client_to_channel()), asyncio.ensure_future(channel_to_client())]
+        try:
+            done, _ = await asyncio.wait(directions, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception() is not None and not isinstance(task.exception(), ConnectionError):
+                    raise task.exception()
+        except OSError as e:
+            self.failures += 1
+            self.last_error = str(e) or type(e).__name__
+        finally:
+            for task in directions:
+                task.cancel()
+            await asyncio.gather(*directions, return_exceptions=True)
+            client.close()
+            for pipe in (channel.stdin, channel.stdout):
+                if not pipe.closed:
+                    pipe.close()
+            try:
+                await asyncio.wait_for(loop.run_in_executor(None, channel.wait), CHANNEL_EXIT_TIMEOUT)
+            except asyncio.TimeoutError:
+                channel.terminate()
+                await loop.run_in_executor(None, channel.wait)
+            if channel.returncode not in (0, -15) and session.bytes_down == 0:
+                # Nothing came back, so ssh most likely never opened the channel
+                stderr.seek(0)
+                output = stderr.read().decode(errors="replace").strip()
+                self.failures += 1
+                self.last_error = output.splitlines()[-1] if output else f"Channel exited with {channel.returncode}"
+                console.print(f"[red]Relay channel failed: {self.last_error}[/red]")
+            stderr.close()
+
+    def to_dict(self) -> Dict:
+        return {
+            "host": self.host,
+            "port": self.port,
+            "zero_copy": self.zero_copy,
+            "connections": self.connections,
+            "active": len(self.sessions),
+            "failures": self.failures,
+            "bytes_up": self.bytes_up,
+            "bytes_down": self.bytes_down,
+            "last_error": self.last_error,
+            "sessions": [session.to_dict() for session in self.sessions.values()],
+        }
@@ -0,0 +1,65 @@
+import os
+import socket
+import stat
+from pathlib import Path
+from typing import Iterable, Optional
+
+SOCKETS_DIR = Path.home() / ".connections" / "sockets"
+# sun_path holds 108 bytes on Linux and 104 on macOS, including the NUL
+MAX_SOCKET_PATH = 103
+
+class ForwardSocketError(Exception):
+    """Raised when a forward's Unix socket cannot be bound"""
+
+def socket_path(connection: str, forward: str, primary: bool = True) -> str:
+    """Default socket of a forward: <connection>.sock, or <connection>-<forward>.sock"""
+    stem = connection if primary else f"{connection}-{forward}"
+    return str(SOCKETS_DIR / (stem.replace(os.sep, "_") + ".sock"))
+
+def socket_alive(path: str, timeout: float = 0.5) -> bool:
+    """Whether a process accepts connections on the socket"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+    return True
+
+def prepare_socket(path: str):
+    """Make a socket path bindable: private directory, stale socket removed
+
+    ssh refuses to bind over an existing file, and one left behind by a
+    crashed tunnel is only removed when nothing answers on it.
+    """
+    if len(os.fsencode(path)) > MAX_SOCKET_PATH:
+        raise ForwardSocketError(f"Socket path is too long for a Unix socket: {path}")
+    directory = Path(path).parent
+    directory.mkdir(parents=True, exist_ok=True)
+    if directory == SOCKETS_DIR:
+        # Sockets are reachable by anyone who can open them; keep them to the owner
+        os.chmod(directory, 0o700)
+
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise ForwardSocketError(f"{path} exists and is not a socket")
+    if socket_alive(path):
+        raise ForwardSocketError(f"{path} is already in use by another tunnel")
+    os.unlink(path)
+
+def remove_sockets(paths: Iterable[Optional[str]]):
+    """Delete the sockets of stopped forwards, which ssh leaves behind
+
+    A socket something still answers on belongs to another tunnel and stays.
+    """
+    for path in paths:
+        if path is None:
+            continue
+        try:
+            if stat.S_ISSOCK(os.lstat(path).st_mode) and not socket_alive(path):
+                os.unlink(path)
+        except FileNotFoundError:
+            pass
@@ -1,25 +1,36 @@
 import subprocess
-import time  # Add this import
+import tempfile
 from pathlib import Path
-import os
 import stat
-from typing import Optional, Tuple
+import time
+from typing import List, Optional, Tuple
 from rich.console import Console
+from .readiness import follow_ssh_log, parse_ssh_error, trace_ssh_phases, wait_for_tunnel, DEFAULT_READY_TIMEOUT
+from ..utils.tracing import current_trace, span
+from .forwards import Forward
+from .defaults import DEFAULT_CONTROL_PERSIST, DEFAULT_USER
 
 console = Console()
 
+# Keepalives let ssh notice a dead peer in about 15s instead of waiting on TCP
+SERVER_ALIVE_INTERVAL = 5
+SERVER_ALIVE_COUNT_MAX = 3
+
 class SSHKeyManager:
-    def __init__(self):
+    def __init__(self, control_persist: str = DEFAULT_CONTROL_PERSIST):
         self.config_dir = Path.home() / ".connections"
         self.keys_dir = self.config_dir / "keys"
+        self.control_dir = self.config_dir / "control"
         self.keys_dir.mkdir(exist_ok=True)
+        self.control_dir.mkdir(mode=0o700, exist_ok=True)
+        self.control_persist = control_persist
 
     def get_key_path(self, connection_name: str) -> Path:
         """Get the path to the private key"""
         return self.keys_dir / f"{connection_name}"
 
-    def generate_key(self, connection_name: str, force: bool = False) -> Tuple[Path, Path]:
-        """Generate SSH key pair for a connection"""
+    def generate_key(self, connection_name: str, force: bool = False, quiet: bool = False) -> Tuple[Path, Path]:
+        """Generate SSH key pair for a connection; quiet leaves out the fingerprint and randomart"""
         key_path = self.keys_dir / f"{connection_name}"
         pub_key_path = self.keys_dir / f"{connection_name}.pub"
         
@@ -30,7 +41,8 @@ class SSHKeyManager:
             "ssh-keygen",
             "-t", "ed25519",
             "-f", str(key_path),
-            "-N", ""  # Empty passphrase
+            "-N", "",  # Empty passphrase
+            *(["-q"] if quiet else [])
         ], check=True)
         
         # Set correct permissions
@@ -39,62 +51,281 @@ class SSHKeyManager:
         
         return key_path, pub_key_path
 
-    def test_connection(self, host: str, port: int, key_path: Path, verbose: bool = False) -> bool:
-        """Test SSH connection with key"""
+    def control_options(self, master: str = "auto", persist: Optional[str] = None) -> List[str]:
+        """SSH options that route a call through the shared master connection"""
+        return [
+            "-o", f"ControlMaster={master}",
+            # %C is a hash of host, port and user, which keeps the socket path short
+            "-o", f"ControlPath={self.control_dir / '%C'}",
+            "-o", f"ControlPersist={persist or self.control_persist}",
+        ]
+
+    def control_command(self, host: str, port: int, operation: str, *args: str,
+                        address: Optional[str] = None, user: str = DEFAULT_USER) -> List[str]:
+        """Build an `ssh -O` command addressed to the host's master connection
+
+        address must match the one the master was started with, as it is
+        part of the control path.
+        """
+        return [
+            "ssh",
+            *self.control_options("no"),
+            *(["-o", f"HostName={address}"] if address else []),
+            "-p", str(port),
+            "-O", operation,
+            *args,
+            f"{user}@{host}"
+        ]
+
+    def master_running(self, host: str, port: int, user: str = DEFAULT_USER,
+                       address: Optional[str] = None) -> bool:
+        """Check whether a master connection is live for the host, or for one address of it"""
+        result = subprocess.run(
+            self.control_command(host, port, "check", address=address, user=user),
+            capture_output=True,
+            text=True
+        )
+        return result.returncode == 0
+
+    def open_master(self, host: str, port: int, key_path: Path,
+                    persist: Optional[str] = None, verbose: bool = False, user: str = DEFAULT_USER,
+                    address: Optional[str] = None) -> bool:
+        """Open a persistent master connection that later SSH calls multiplex over
+
+        While a trace is active ssh runs with -v and each handshake phase is
+        recorded as a span.
+        """
+        with span("ssh.master_check"):
+            if self.master_running(host, port, user, address):
+                return True
+        traced = current_trace() is not None
+
+        cmd = [
+            "ssh",
+            "-i", str(key_path),
+            "-p", str(port),
+            "-o", "BatchMode=yes",
+            "-o", "StrictHostKeyChecking=no",
+            "-o", "ConnectTimeout=10",
+            *self.control_options("yes", persist),
+            # Also keys the %C control path, as in tunnel_command
+            *(["-o", f"HostName={address}"] if address else []),
+            "-f",  # Go to background once authenticated
+            "-N"
+        ]
+        if verbose or traced:
+            cmd.append("-v")
+        cmd.append(f"{user}@{host}")
+
         try:
-            cmd = [
-                "ssh",
-                "-i", str(key_path),
-                "-p", str(port),
-                "-o", "BatchMode=yes",
-                "-o", "StrictHostKeyChecking=no",
-                "-o", "ConnectTimeout=10"
-            ]
-            
-            if verbose:
-                cmd.append("-v")
-                
-            cmd.extend([
-                f"root@{host}",
-                "echo 'Connection test successful'"
-            ])
-            
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True
-            )
-            
-            if verbose and result.stderr:
-                console.print(f"[yellow]SSH Debug Output:[/yellow]\n{result.stderr}")
-                
-            return result.returncode == 0
+            with span("ssh.master"):
+                returncode, output = self._run_logged(cmd, traced, "ssh.background")
+        except Exception as e:
+            console.print(f"[red]Failed to open master connection: {e}[/red]")
+            return False
+
+        if verbose and output:
+            console.print(f"[yellow]SSH Debug Output:[/yellow]\n{output}")
+        if returncode != 0:
+            if not verbose:
+                error = parse_ssh_error(output.splitlines(), returncode) if traced else output.strip()
+                console.print(f"[red]Master connection failed: {error}[/red]")
+            return False
+        return True
+
+    @staticmethod
+    def _run_logged(cmd: List[str], traced: bool, last: str) -> Tuple[int, str]:
+        """Run ssh to completion; its exit code and stderr
+
+        When traced, each handshake phase is recorded as ssh logs it, and
+        `last` names the phase from authentication to exit.
+        """
+        # A backgrounded master inherits stderr, so read it from a file
+        # rather than a pipe that would stay open for the master's lifetime
+        with tempfile.TemporaryFile() as stderr:
+            if traced:
+                started, marks = time.monotonic(), {}
+                with subprocess.Popen(cmd, stdin=subprocess.DEVNULL,
+                                      stdout=subprocess.DEVNULL, stderr=stderr) as process:
+                    returncode = follow_ssh_log(process, stderr, marks)
+                trace_ssh_phases(marks, started, time.monotonic(), last)
+            else:
+                returncode = subprocess.run(cmd, stdin=subprocess.DEVNULL,
+                                            stdout=subprocess.DEVNULL, stderr=stderr).returncode
+            stderr.seek(0)
+            return returncode, stderr.read().decode(errors="replace")
+
+    def close_master(self, host: str, port: int, user: str = DEFAULT_USER,
+                     address: Optional[str] = None) -> bool:
+        """Shut down the master connection and every forward on it"""
+        result = subprocess.run(
+            self.control_command(host, port, "exit", address=address, user=user),
+            capture_output=True,
+            text=True
+        )
+        return result.returncode == 0
+
+    def add_forward(self, host: str, port: int, local_port: int = 11434, remote_port: int = 11434,
+                    forward: Optional[Forward] = None, user: str = DEFAULT_USER,
+                    address: Optional[str] = None) -> bool:
+        """Add a forward to the live master connection, a local one unless given"""
+        args = forward.ssh_args() if forward else ["-L", f"{local_port}:localhost:{remote_port}"]
+        result = subprocess.run(
+            self.control_command(host, port, "forward", *args, address=address, user=user),
+            capture_output=True,
+            text=True
+        )
+        if result.returncode != 0:
+            console.print(f"[red]Forward request failed: {result.stderr.strip()}[/red]")
+            return False
+        return True
+
+    def cancel_forward(self, host: str, port: int, local_port: int = 11434, remote_port: int = 11434,
+                       forward: Optional[Forward] = None, user: str = DEFAULT_USER,
+                       address: Optional[str] = None) -> bool:
+        """Remove a forward from the live master connection"""
+        args = forward.ssh_args() if forward else ["-L", f"{local_port}:localhost:{remote_port}"]
+        result = subprocess.run(
+            self.control_command(host, port, "cancel", *args, address=address, user=user),
+            capture_output=True,
+            text=True
+        )
+        return result.returncode == 0
+
+    def test_connection(self, host: str, port: int, key_path: Path, verbose: bool = False,
+                        user: str = DEFAULT_USER) -> bool:
+        """Test SSH connection with key
+
+        Goes over a warm master when there is one; otherwise the connection
+        lasts only as long as the test command, so verifying a key leaves
+        nothing running. While a trace is active each handshake phase is
+        recorded as a span.
+        """
+        traced = current_trace() is not None
+        cmd = [
+            "ssh",
+            "-i", str(key_path),
+            "-p", str(port),
+            "-o", "BatchMode=yes",
+            "-o", "StrictHostKeyChecking=no",
+            "-o", "ConnectTimeout=10",
+            *self.control_options("auto", persist="no")
+        ]
+        if verbose or traced:
+            cmd.append("-v")
+        cmd.extend([
+            f"{user}@{host}",
+            "echo 'Connection test successful'"
+        ])
+
+        try:
+            with span("ssh.exec"):
+                returncode, output = self._run_logged(cmd, traced, "ssh.command")
         except Exception as e:
             console.print(f"[red]Connection test failed: {e}[/red]")
             return False
 
+        if verbose and output:
+            console.print(f"[yellow]SSH Debug Output:[/yellow]\n{output}")
+        elif returncode != 0:
+            console.print(f"[red]Connection test failed: {parse_ssh_error(output.splitlines(), returncode)}[/red]")
+        return returncode == 0
+
+    def tunnel_command(self, host: str, port: int, key_path: Path,
+                       local_port: int = 11434, remote_port: int = 11434,
+                       forwards: Optional[List[Forward]] = None, address: Optional[str] = None,
+                       user: str = DEFAULT_USER) -> List[str]:
+        """Build the ssh command line for an Ollama tunnel, or for every given forward
+
+        address connects to one particular address of the host, such as a
+        replica picked by failover, while ssh_config still matches the host.
+        """
+        if forwards:
+            forward_args = [arg for forward in forwards for arg in forward.ssh_args()]
+            if any(forward.local_socket is not None for forward in forwards):
+                # Owner-only sockets whatever the user's ssh_config says
+                forward_args[:0] = ["-o", "StreamLocalBindMask=0177"]
+        else:
+            forward_args = ["-L", f"{local_port}:localhost:{remote_port}"]
+        return [
+            "ssh",
+            "-i", str(key_path),
+            "-N",  # Don't execute remote command
+            "-v",  # Verbose output, needed for readiness detection
+            "-o", "StrictHostKeyChecking=no",
+            "-o", "ExitOnForwardFailure=yes",
+            "-o", f"ServerAliveInterval={SERVER_ALIVE_INTERVAL}",
+            "-o", f"ServerAliveCountMax={SERVER_ALIVE_COUNT_MAX}",
+            # Act as the master for later calls, but stay in the foreground
+            # so the tunnel lives exactly as long as this process
+            *self.control_options("auto", persist="no"),
+            *forward_args,
+            # Also keys the %C control path, so each address gets its own master
+            *(["-o", f"HostName={address}"] if address else []),
+            "-p", str(port),
+            f"{user}@{host}"
+        ]
+
+    def stdio_command(self, host: str, port: int, key_path: Path,
+                      remote_host: str = "localhost", remote_port: int = 11434,
+                      user: str = DEFAULT_USER) -> List[str]:
+        """Build an `ssh -W` command whose stdin and stdout are one connection to remote_host:remote_port
+
+        It goes over the host's master connection when there is one, and
+        otherwise leaves one behind, so later channels skip the handshake.
+        """
+        return [
+            "ssh",
+            "-i", str(key_path),
+            "-o", "BatchMode=yes",
+            "-o", "StrictHostKeyChecking=no",
+            "-o", "ConnectTimeout=10",
+            *self.control_options("auto"),
+            "-W", f"{remote_host}:{remote_port}",
+            "-p", str(port),
+            f"{user}@{host}"
+        ]
+
+    def check_command(self, host: str, port: int, key_path: Path, address: Optional[str] = None,
+                      timeout: int = 10, user: str = DEFAULT_USER) -> List[str]:
+        """Build an ssh command that only logs in, with a fresh handshake
+
+        Unlike test_connection it never goes over a master connection, so
+        the server checks the key again and the login time is a real one.
+        """
+        return [
+            "ssh",
+            "-i", str(key_path),
+            "-o", "BatchMode=yes",
+            "-o", "StrictHostKeyChecking=no",
+            "-o", f"ConnectTimeout={timeout}",
+            "-o", "ControlPath=none",
+            *(["-o", f"HostName={address}"] if address else []),
+            "-p", str(port),
+            f"{user}@{host}",
+            "true"
+        ]
+
     def setup_tunnel(self, host: str, port: int, key_path: Path,
-                    local_port: int = 11434, remote_port: int = 11434) -> Optional[subprocess.Popen]:
-        """Create SSH tunnel for Ollama"""
+                    local_port: int = 11434, remote_port: int = 11434,
+                    ready_timeout: float = DEFAULT_READY_TIMEOUT,
+                    forwards: Optional[List[Forward]] = None,
+                    address: Optional[str] = None, user: str = DEFAULT_USER) -> Optional[subprocess.Popen]:
+        """Create SSH tunnel for Ollama, or one process carrying every given forward"""
         console.print("[yellow]Setting up SSH tunnel...[/yellow]")
         try:
-            process = subprocess.Popen([
-                "ssh",
-                "-i", str(key_path),
-                "-N",  # Don't execute remote command
-                "-v",  # Verbose output
-                "-o", "StrictHostKeyChecking=no",
-                "-o", "ExitOnForwardFailure=yes",
-                "-L", f"{local_port}:localhost:{remote_port}",
-                "-p", str(port),
-                f"root@{host}"
-            ], stderr=subprocess.PIPE)
-            
-            # Wait a moment to check if the process is still running
-            time.sleep(2)
-            if process.poll() is not None:
-                _, stderr = process.communicate()
-                console.print(f"[red]Tunnel setup failed: {stderr.decode()}[/red]")
+            with span("ssh.tunnel"):
+                process = subprocess.Popen(
+                    self.tunnel_command(host, port, key_path, local_port, remote_port, forwards, address, user),
+                    stderr=subprocess.PIPE
+                )
+
+                # Wait until the forward accepts connections or ssh gives up
+                ready, error = wait_for_tunnel(process, local_port, timeout=ready_timeout, forwards=forwards)
+            if not ready:
+                if process.poll() is None:
+                    process.terminate()
+                console.print(f"[red]Tunnel setup failed: {error}[/red]")
                 return None
                 
             console.print("[green]SSH tunnel established successfully![/green]")
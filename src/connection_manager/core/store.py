@@ -0,0 +1,180 @@
+import json
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .config import connection_tags, glob_pattern
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS connections (
+    name TEXT PRIMARY KEY,
+    host TEXT,
+    type TEXT,
+    group_name TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_connections_host ON connections(host);
+CREATE INDEX IF NOT EXISTS idx_connections_type ON connections(type);
+CREATE INDEX IF NOT EXISTS idx_connections_group ON connections(group_name);
+CREATE TABLE IF NOT EXISTS connection_tags (
+    tag TEXT NOT NULL,
+    name TEXT NOT NULL REFERENCES connections(name) ON DELETE CASCADE,
+    PRIMARY KEY (tag, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_connection_tags_name ON connection_tags(name);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+class SQLiteConfigManager:
+    """Connection store backed by SQLite, with the same interface as ConfigManager"""
+
+    def __init__(self, db_path: Optional[Path] = None):
+        self.config_dir = Path.home() / ".connections"
+        self.config_file = self.config_dir / "config.json"
+        self.db_path = Path(db_path) if db_path else self.config_dir / "connections.db"
+        self.keys_dir = self.config_dir / "keys"
+        self.config_dir.mkdir(exist_ok=True)
+        self.keys_dir.mkdir(exist_ok=True)
+
+        self.db = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        # WAL lets readers carry on while another process writes
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        # Every open after the first only reads, so it never waits on a writer
+        if not self._migrated():
+            self.db.executescript(SCHEMA)
+            self._migrate_json()
+
+    def close(self):
+        self.db.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Cursor]:
+        cursor = self.db.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            yield cursor
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        cursor.execute("COMMIT")
+
+    def _migrated(self) -> bool:
+        try:
+            return self.db.execute("SELECT 1 FROM meta WHERE key = 'migrated_json'").fetchone() is not None
+        except sqlite3.OperationalError:
+            return False  # A new database, without the schema yet
+
+    def _migrate_json(self):
+        """Import config.json once, the first time the database is opened"""
+        with self._transaction() as cursor:
+            if cursor.execute("SELECT 1 FROM meta WHERE key = 'migrated_json'").fetchone():
+                return
+            if self.config_file.exists():
+                connections = json.loads(self.config_file.read_text() or "{}")
+                for name, config in connections.items():
+                    self._upsert(cursor, name, config)
+            cursor.execute(
+                "INSERT INTO meta (key, value) VALUES ('migrated_json', ?)",
+                (datetime.now().isoformat(),)
+            )
+
+    def _upsert(self, cursor: sqlite3.Cursor, name: str, config: Dict):
+        cursor.execute(
+            "INSERT OR REPLACE INTO connections (name, host, type, group_name, data) VALUES (?, ?, ?, ?, ?)",
+            (name, config.get("host"), config.get("type"), config.get("group"), json.dumps(config))
+        )
+        cursor.execute("DELETE FROM connection_tags WHERE name = ?", (name,))
+        cursor.executemany(
+            "INSERT INTO connection_tags (tag, name) VALUES (?, ?)",
+            [(tag, name) for tag in connection_tags(config)]
+        )
+
+    @contextmanager
+    def batch(self) -> Iterator["_Batch"]:
+        """Apply many changes in a single transaction
+
+        The yielded object supports item assignment, deletion, `get` and `in`
+        like the dict ConfigManager.batch yields. Nothing is committed if the
+        block raises.
+        """
+        with self._transaction() as cursor:
+            yield _Batch(self, cursor)
+
+    def save_connection(self, name: str, config: Dict):
+        config['last_modified'] = datetime.now().isoformat()
+        with self._transaction() as cursor:
+            self._upsert(cursor, name, config)
+
+    def delete_connection(self, name: str) -> bool:
+        with self._transaction() as cursor:
+            cursor.execute("DELETE FROM connections WHERE name = ?", (name,))
+            return cursor.rowcount > 0
+
+    def load_connections(self) -> Dict:
+        return dict(self.iter_connections())
+
+    def get_connection(self, name: str) -> Optional[Dict]:
+        row = self.db.execute("SELECT data FROM connections WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def count_connections(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM connections").fetchone()[0]
+
+    def iter_connections(self, pattern: Optional[str] = None, tags: Optional[List[str]] = None,
+                         group: Optional[str] = None, limit: Optional[int] = None,
+                         offset: int = 0) -> Iterator[Tuple[str, Dict]]:
+        """Stream (name, config) pairs in name order without loading the whole table"""
+        clauses, params = [], []
+        if pattern:
+            # GLOB keeps the index usable for patterns without a leading wildcard
+            clauses.append("(name GLOB ? OR host GLOB ?)")
+            params += [glob_pattern(pattern)] * 2
+        if group:
+            clauses.append("group_name = ?")
+            params.append(group)
+        for tag in tags or []:
+            clauses.append("name IN (SELECT name FROM connection_tags WHERE tag = ?)")
+            params.append(tag)
+        query = "SELECT name, data FROM connections"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY name LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else limit, offset]
+        for name, data in self.db.execute(query, params):
+            yield name, json.loads(data)
+
+class _Batch:
+    """Dict-like view of the store inside one transaction"""
+
+    def __init__(self, store: SQLiteConfigManager, cursor: sqlite3.Cursor):
+        self.store = store
+        self.cursor = cursor
+
+    def __setitem__(self, name: str, config: Dict):
+        self.store._upsert(self.cursor, name, config)
+
+    def __delitem__(self, name: str):
+        self.cursor.execute("DELETE FROM connections WHERE name = ?", (name,))
+        if not self.cursor.rowcount:
+            raise KeyError(name)
+
+    def __contains__(self, name: str) -> bool:
+        return self.get(name) is not None
+
+    def get(self, name: str, default: Optional[Dict] = None) -> Optional[Dict]:
+        row = self.cursor.execute("SELECT data FROM connections WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def pop(self, name: str, default: Optional[Dict] = None) -> Optional[Dict]:
+        config = self.get(name)
+        if config is None:
+            return default
+        del self[name]
+        return config
@@ -0,0 +1,593 @@
+import asyncio
+import json
+import os
+import random
+import signal
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Optional, Set
+from rich.console import Console
+from .client import LOCK_PATH, PID_PATH, SOCKET_PATH, supervisor_running
+from .cache import ResponseCache
+from .config import open_config_manager
+from .forwards import apply_leases, lease_keys, lease_requests
+from .admission import Admission
+from .gateway import Backend, Gateway
+from .inventory import InventoryCache, fetch_many
+from .ports import PortAllocationError, PortAllocator
+from .readiness import probe_forward
+from .ssh import SSHKeyManager
+from .readiness import DEFAULT_READY_TIMEOUT
+from .defaults import DEFAULT_DISK_CACHE_SIZE_MB, DEFAULT_GATEWAY_PORT, DEFAULT_GATEWAY_RETRIES, DEFAULT_MAX_QUEUE
+from .telemetry import SAMPLE_INTERVAL, TelemetryRecorder
+from .tunnel import Tunnel, run_control, start_tunnel, stop_tunnel
+from ..utils.health import check_many, HealthCache
+from ..utils.procfs import ProcessInspector, established_connections, process_alive, read_stats
+from ..utils.files import file_lock
+from ..utils.tracing import Trace, activate, span
+from ..utils.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, render_metrics, write_textfile
+
+console = Console()
+
+# Watchdog tuning: restart delays grow as BACKOFF_BASE * 2**attempt up to
+# BACKOFF_CAP, with full jitter so a fleet-wide blip doesn't reconnect in lockstep
+BACKOFF_BASE = 0.25
+BACKOFF_CAP = 30.0
+HEALTH_INTERVAL = 10.0
+HEALTH_FAILURE_LIMIT = 3
+FORWARD_PROBE_TIMEOUT = 1.0
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> float:
+    """Capped exponential backoff with full jitter"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def _read_traffic(pids, ports):
+    """I/O counters of the given processes and connections open on the given ports"""
+    stats = {pid: read_stats(pid) for pid in pids if pid}
+    return {pid: stats for pid, stats in stats.items() if stats is not None}, established_connections(ports)
+
+def _use_pidfd_child_watcher():
+    # Before 3.12 asyncio reaps each child from its own thread; a pidfd
+    # watcher reaps them all from the event loop instead
+    if sys.version_info >= (3, 12) or not hasattr(asyncio, "PidfdChildWatcher"):
+        return
+    try:
+        watcher = asyncio.PidfdChildWatcher()
+        watcher.attach_loop(asyncio.get_running_loop())
+        asyncio.set_child_watcher(watcher)
+    except (OSError, AttributeError, NotImplementedError):
+        pass
+
+class Supervisor:
+    """Single process that owns every tunnel and answers requests on a Unix socket
+
+    With the watchdog enabled, tunnels that exit or keep failing health checks
+    are restarted on the same local port with jittered exponential backoff.
+
+    Each client connection carries one request line and gets one response
+    line back, both JSON objects. Requests carry a "command" (ping, connect,
+    stop, status, gateway, gateway_stop, metrics or shutdown) plus its
+    arguments; responses always carry "ok" and either the result or an
+    "error" message.
+    """
+
+    def __init__(self, socket_path: Path = SOCKET_PATH, watchdog: bool = True,
+                 metrics_port: Optional[int] = None, metrics_file: Optional[Path] = None):
+        self.socket_path = socket_path
+        self.watchdog = watchdog
+        self.metrics_port = metrics_port
+        self.metrics_file = metrics_file
+        self.config_manager = open_config_manager()
+        self.ssh_manager = SSHKeyManager()
+        self.ports = PortAllocator()
+        self.tunnels: Dict[str, Tunnel] = {}
+        self.gateway: Optional[Gateway] = None
+        self._shutdown: Optional[asyncio.Event] = None
+        self._clients: Set[asyncio.Task] = set()
+        self.health = HealthCache()
+        self._health_refresh: Optional[asyncio.Future] = None
+        self.inventory = InventoryCache()
+        self._inventory_refresh: Optional[asyncio.Future] = None
+        self.inspector = ProcessInspector()
+        self.telemetry = TelemetryRecorder()
+
+    async def run(self):
+        """Serve requests until told to shut down, then stop every tunnel
+
+        Only one supervisor runs at a time: the lock is held for as long as
+        it serves, and a second one gives up at once.
+        """
+        try:
+            with file_lock(LOCK_PATH, blocking=False):
+                await self._serve()
+        except BlockingIOError:
+            console.print("Another supervisor is already running")
+
+    async def _serve(self):
+        _use_pidfd_child_watcher()
+        self._shutdown = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self._shutdown.set)
+
+        if self.socket_path.exists():
+            # Left behind by a supervisor that died; a live one would answer
+            if supervisor_running(self.socket_path):
+                console.print(f"A supervisor already answers on {self.socket_path}")
+                return
+            self.socket_path.unlink()
+        server = await asyncio.start_unix_server(self._handle_client, path=str(self.socket_path))
+        os.chmod(self.socket_path, 0o600)
+        PID_PATH.write_text(str(os.getpid()))
+        console.print(f"Supervisor listening on {self.socket_path} (PID: {os.getpid()})")
+        health_task = asyncio.ensure_future(self._health_loop())
+        telemetry_task = asyncio.ensure_future(self._telemetry_loop())
+        metrics_server = None
+        if self.metrics_port is not None:
+            metrics_server = await asyncio.start_server(self._handle_metrics, "127.0.0.1", self.metrics_port)
+            console.print(f"Serving metrics on http://127.0.0.1:{self.metrics_port}/metrics")
+
+        try:
+            await self._shutdown.wait()
+        finally:
+            health_task.cancel()
+            telemetry_task.cancel()
+            self.telemetry.close()
+            if self.gateway is not None:
+                await self.gateway.close()
+            if metrics_server is not None:
+                metrics_server.close()
+            server.close()
+            await server.wait_closed()
+            # Let in-flight requests, including the shutdown itself, answer
+            await asyncio.gather(*self._clients, return_exceptions=True)
+            tunnels = list(self.tunnels.values())
+            self.tunnels.clear()
+            await asyncio.gather(*(stop_tunnel(self.ssh_manager, tunnel) for tunnel in tunnels))
+            self.ports.release(*(key for tunnel in tunnels for key in lease_keys(tunnel.name, tunnel.forwards)))
+            for path in (self.socket_path, PID_PATH):
+                if path.exists():
+                    path.unlink()
+            console.print("Supervisor stopped")
+
+    async def _telemetry_loop(self):
+        """Append a sample of every tunnel's traffic to its stats ring"""
+        loop = asyncio.get_running_loop()
+        sampled_at = time.time()
+        while True:
+            await asyncio.sleep(SAMPLE_INTERVAL)
+            tunnels = list(self.tunnels.values())
+            ports = {tunnel.name: [forward.local_port for forward in tunnel.forwards
+                                   if forward.kind != "remote" and forward.local_socket is None
+                                   and forward.local_port is not None]
+                     for tunnel in tunnels}
+            # /proc reads block; everything else is read here, on the loop
+            processes, connections = await loop.run_in_executor(None, _read_traffic, [
+                tunnel.pid for tunnel in tunnels], [port for listed in ports.values() for port in listed])
+            requests = {backend.name: backend.requests for backend in self.gateway.backends} \
+                if self.gateway is not None else {}
+            now, previous = time.time(), sampled_at
+            sampled_at = now
+            for tunnel in tunnels:
+                process = processes.get(tunnel.pid)
+                result = self.health.get(tunnel.endpoint)
+                self.telemetry.record(
+                    tunnel.name, now,
+                    bytes_read=process.bytes_read if process is not None else None,
+                    bytes_written=process.bytes_written if process is not None else None,
+                    connections=sum(connections.get(port, 0) for port in ports[tunnel.name])
+                    if ports[tunnel.name] else None,
+                    requests=requests.get(tunnel.name, 0),
+                    # Only a probe that finished since the last sample belongs to this one
+                    latency=result["latency"] if result is not None and result["checked_at"] > previous else None,
+                    up=tunnel.is_up,
+                )
+            self.telemetry.retain(self.tunnels)
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._clients.add(task)
+        try:
+            line = await reader.readline()
+            if not line:
+                return
+            try:
+                request = json.loads(line)
+            except ValueError:
+                request = None
+            if isinstance(request, dict):
+                response = await self.dispatch(request)
+            else:
+                response = {"ok": False, "error": "Malformed request"}
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            self._clients.discard(task)
+
+    async def dispatch(self, request: Dict) -> Dict:
+        handler = getattr(self, f"_cmd_{request.get('command')}", None)
+        if handler is None:
+            return {"ok": False, "error": f"Unknown command: {request.get('command')}"}
+        try:
+            return await handler(request)
+        except Exception as e:
+            return {"ok": False, "error": f"Unexpected error: {e}"}
+
+    async def _cmd_ping(self, request: Dict) -> Dict:
+        return {"ok": True, "pid": os.getpid(), "tunnels": len(self.tunnels)}
+
+    async def _cmd_connect(self, request: Dict) -> Dict:
+        """Start a tunnel; with "trace" in the request, also time each phase
+
+        A traced connect ends with a first health check, and the response
+        carries the spans so the CLI can merge them into its own trace.
+        """
+        traced = request.get("trace")
+        if not traced:
+            return await self._connect(request)
+        trace = Trace("connect", traced.get("id"))
+        with activate(trace, traced.get("parent")):
+            response = await self._connect(request)
+            tunnel = self.tunnels.get(request.get("name"))
+            if response["ok"] and tunnel is not None and tunnel.endpoint is not None:
+                with span("health") as health:
+                    results = await asyncio.get_running_loop().run_in_executor(None, check_many, [tunnel.endpoint])
+                    result = results.get(tunnel.endpoint)
+                    if result is not None:
+                        health.attributes.update(state=result["state"], error=result["error"])
+                        tunnel.record_probe(result)
+                self.health.update(results)
+        response["trace"] = trace.to_records()
+        return response
+
+    async def _connect(self, request: Dict) -> Dict:
+        name = request.get("name")
+        existing = self.tunnels.get(name)
+        if existing is not None:
+            if existing.is_up or existing.started_at is None or existing.down_since is not None:
+                return {"ok": False, "error": f"Connection {name} is already running", "tunnel": existing.to_dict()}
+            del self.tunnels[name]
+
+        config = self.config_manager.get_connection(name)
+        if not config:
+            return {"ok": False, "error": f"No connection found with name: {name}"}
+
+        try:
+            tunnel = Tunnel(name, config, request.get("local_port"), use_socket=bool(request.get("socket")))
+        except ValueError as e:
+            return {"ok": False, "error": str(e)}
+        # Claim the name before leasing ports and the handshake so
+        # concurrent requests don't race
+        self.tunnels[name] = tunnel
+        loop = asyncio.get_running_loop()
+        keys = lease_keys(name, tunnel.forwards)
+        try:
+            # Ports asked for explicitly, here or in the config, must be honoured
+            strict = any(port is not None for port in lease_requests(name, tunnel.forwards).values())
+            with span("ports.lease"):
+                ports = await loop.run_in_executor(
+                    None, self.ports.allocate_many, lease_requests(name, tunnel.forwards), strict
+                )
+        except PortAllocationError as e:
+            del self.tunnels[name]
+            return {"ok": False, "error": str(e)}
+        apply_leases(name, tunnel.forwards, ports)
+
+        if not await start_tunnel(self.ssh_manager, tunnel, float(request.get("ready_timeout", DEFAULT_READY_TIMEOUT))):
+            del self.tunnels[name]
+            await loop.run_in_executor(None, self.ports.release, *keys)
+            return {"ok": False, "error": tunnel.error}
+
+        with span("ports.attach"):
+            await loop.run_in_executor(None, self.ports.attach, dict.fromkeys(keys, tunnel.pid))
+        if tunnel.process is not None:
+            asyncio.ensure_future(self._reap(tunnel))
+        if self.gateway is not None:
+            self.gateway.update_endpoint(name, tunnel.endpoint)
+        console.print(f"Connected {name} on {tunnel.endpoint} in {tunnel.elapsed:.2f}s")
+        return {"ok": True, "tunnel": tunnel.to_dict()}
+
+    async def _reap(self, tunnel: Tunnel):
+        returncode = await tunnel.process.wait()
+        if self.tunnels.get(tunnel.name) is not tunnel:
+            return
+        console.print(f"Tunnel {tunnel.name} exited with code {returncode}")
+        if self.watchdog:
+            await self._recover(tunnel)
+        else:
+            del self.tunnels[tunnel.name]
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.ports.release, *lease_keys(tunnel.name, tunnel.forwards)
+            )
+
+    async def _recover(self, tunnel: Tunnel):
+        """Restart a dead tunnel on the same local port until it comes back or is stopped"""
+        if tunnel.down_since is not None:
+            return  # Already recovering
+        tunnel.mark_down()
+        await stop_tunnel(self.ssh_manager, tunnel)
+
+        attempt = 0
+        while self.tunnels.get(tunnel.name) is tunnel:
+            await asyncio.sleep(backoff_delay(attempt))
+            if self.tunnels.get(tunnel.name) is not tunnel:
+                break
+            if await start_tunnel(self.ssh_manager, tunnel):
+                if self.tunnels.get(tunnel.name) is not tunnel:
+                    # Stopped while we were reconnecting
+                    await stop_tunnel(self.ssh_manager, tunnel)
+                    return
+                tunnel.mark_recovered()
+                console.print(f"Reconnected {tunnel.name} after {attempt + 1} attempt(s)")
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.ports.attach, dict.fromkeys(lease_keys(tunnel.name, tunnel.forwards), tunnel.pid)
+                )
+                if tunnel.process is not None:
+                    asyncio.ensure_future(self._reap(tunnel))
+                return
+            console.print(f"Reconnect of {tunnel.name} failed: {tunnel.error}")
+            attempt += 1
+
+    async def _check_masters(self):
+        """Notice master connections that closed under the tunnels riding them
+
+        Forwards do not keep an idle master open past its ControlPersist, and
+        with no ssh process of their own such tunnels have nothing to reap.
+        Recovery falls back to a dedicated tunnel process once the master is gone.
+        """
+        tunnels = [tunnel for tunnel in self.tunnels.values() if tunnel.on_master and tunnel.is_up]
+        results = await asyncio.gather(*(run_control(self.ssh_manager, tunnel, "check") for tunnel in tunnels))
+        for tunnel, returncode in zip(tunnels, results):
+            if returncode == 0 or self.tunnels.get(tunnel.name) is not tunnel:
+                continue
+            tunnel.error = "Master connection closed"
+            console.print(f"Master connection of {tunnel.name} closed")
+            if self.watchdog:
+                asyncio.ensure_future(self._recover(tunnel))
+            else:
+                del self.tunnels[tunnel.name]
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.ports.release, *lease_keys(tunnel.name, tunnel.forwards)
+                )
+
+    async def _refresh_health(self) -> Dict[int, Dict]:
+        """Probe every live tunnel at once and store the results in the cache"""
+        if self._health_refresh is None or self._health_refresh.done():
+            endpoints = [tunnel.endpoint for tunnel in self.tunnels.values()
+                         if tunnel.is_up and tunnel.endpoint is not None]
+            loop = asyncio.get_running_loop()
+            self._health_refresh = loop.run_in_executor(None, check_many, endpoints)
+        # Concurrent callers share the refresh already in flight
+        results = await asyncio.shield(self._health_refresh)
+        for tunnel in self.tunnels.values():
+            result = results.get(tunnel.endpoint)
+            # Callers sharing one refresh must only record it once
+            if result is not None and self.health.get(tunnel.endpoint) is not result:
+                tunnel.record_probe(result)
+        self.health.update(results)
+        return results
+
+    async def _refresh_inventory(self):
+        """Fetch the models of every live tunnel whose inventory is out of date"""
+        if self._inventory_refresh is None or self._inventory_refresh.done():
+            live = {tunnel.name: tunnel.endpoint for tunnel in self.tunnels.values()
+                    if tunnel.is_up and tunnel.endpoint is not None}
+            stale = {name: live[name] for name in self.inventory.stale(live)}
+            loop = asyncio.get_running_loop()
+            self._inventory_refresh = loop.run_in_executor(None, fetch_many, stale)
+        self.inventory.update(await asyncio.shield(self._inventory_refresh))
+
+    def render_metrics(self) -> str:
+        return render_metrics(self.tunnels.values(), self.config_manager.load_connections().keys(), self.gateway)
+
+    async def _handle_metrics(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Minimal HTTP/1.0 endpoint for Prometheus scrapes"""
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode(errors="replace").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] in ("/", "/metrics"):
+                status, content_type, body = "200 OK", METRICS_CONTENT_TYPE, self.render_metrics().encode()
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", b"Not found\n"
+            writer.write(
+                f"HTTP/1.0 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _health_loop(self):
+        """Keep the health cache warm and restart tunnels that stop answering"""
+        while True:
+            await asyncio.sleep(HEALTH_INTERVAL)
+            try:
+                await self._health_pass()
+            except Exception as e:
+                # One bad pass must not end health checks for the daemon's lifetime
+                console.print(f"Health check pass failed: {e!r}")
+
+    async def _health_pass(self):
+        """One round of health checks, and recovery of tunnels that keep failing them"""
+        await self._check_masters()
+        results = await self._refresh_health()
+        await self._refresh_inventory()
+        if self.metrics_file is not None:
+            try:
+                write_textfile(self.metrics_file, self.render_metrics())
+            except OSError as e:
+                console.print(f"Could not write metrics to {self.metrics_file}: {e}")
+        if not self.watchdog:
+            return
+        for tunnel in [tunnel for tunnel in self.tunnels.values() if tunnel.is_up]:
+            result = results.get(tunnel.endpoint)
+            if result is None:
+                continue
+            if result["state"] != "down":
+                tunnel.health_failures = 0
+                continue
+            tunnel.health_failures += 1
+            if tunnel.health_failures >= HEALTH_FAILURE_LIMIT and tunnel.down_since is None:
+                console.print(f"Tunnel {tunnel.name} failed {tunnel.health_failures} health checks: {result['error']}")
+                if tunnel.process is not None and tunnel.process.returncode is None:
+                    # The reaper notices the exit and starts recovery
+                    tunnel.process.terminate()
+                else:
+                    asyncio.ensure_future(self._recover(tunnel))
+
+    async def _cmd_stop(self, request: Dict) -> Dict:
+        tunnel = self.tunnels.pop(request.get("name"), None)
+        if tunnel is None:
+            return {"ok": False, "error": f"No active connection found for {request.get('name')}"}
+        await stop_tunnel(self.ssh_manager, tunnel)
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.ports.release, *lease_keys(tunnel.name, tunnel.forwards)
+        )
+        self.health.discard(tunnel.endpoint)
+        self.inventory.discard(tunnel.name)
+        console.print(f"Stopped {tunnel.name}")
+        return {"ok": True, "tunnel": tunnel.to_dict()}
+
+    async def _cmd_status(self, request: Dict) -> Dict:
+        name = request.get("name")
+        tunnels = [tunnel for tunnel in self.tunnels.values() if name is None or tunnel.name == name]
+        if request.get("forwards"):
+            await asyncio.gather(*(self._probe_forwards(tunnel) for tunnel in tunnels))
+        entries = [tunnel.to_dict() for tunnel in tunnels]
+        if request.get("health"):
+            # Answer from cache right away and refresh stale entries behind the scenes
+            if self.health.stale_ports(tunnel.endpoint for tunnel in tunnels
+                                       if tunnel.is_up and tunnel.endpoint is not None):
+                asyncio.ensure_future(self._refresh_health())
+            for tunnel, entry in zip(tunnels, entries):
+                entry["health"] = self.health.get(tunnel.endpoint)
+        response = {"ok": True, "tunnels": entries}
+        if request.get("models"):
+            # Same as health: answer from cache, refresh what is out of date behind the scenes
+            if self.inventory.stale(tunnel.name for tunnel in tunnels if tunnel.is_up):
+                asyncio.ensure_future(self._refresh_inventory())
+            for tunnel, entry in zip(tunnels, entries):
+                inventory = self.inventory.get(tunnel.name)
+                entry["models"] = inventory.to_dict() if inventory is not None else None
+            response["placement"] = self.inventory.placement(tunnel.name for tunnel in tunnels)
+
+        loop = asyncio.get_running_loop()
+        leases = await loop.run_in_executor(None, self.ports.leases)
+        entries.extend(self._external_entry(key, lease) for key, lease in sorted(leases.items())
+                       if "/" not in key and key not in self.tunnels and (name is None or key == name)
+                       and lease.get("owner") != os.getpid())
+        processes = await loop.run_in_executor(None, self.inspector.scan, (entry["pid"] for entry in entries))
+        for entry in entries:
+            process = processes.get(entry["pid"])
+            entry["process"] = process.to_dict() if process is not None else None
+
+        if self.gateway is not None:
+            response["gateway"] = self.gateway.to_dict()
+        return response
+
+    @staticmethod
+    def _external_entry(name: str, lease: Dict) -> Dict:
+        """A tunnel run outside the supervisor, such as connect --foreground, seen through its lease
+
+        The lease registry has already checked that its process is the one
+        that took the lease, not a later process with the same PID.
+        """
+        return {
+            "name": name,
+            "local_port": lease["port"],
+            "local_socket": None,
+            "pid": lease.get("pid"),
+            "external": True,
+            # With no ssh process of its own the tunnel rides a master; its owner is alive
+            "up": process_alive(lease["pid"], lease.get("identity")) if lease.get("pid") else True,
+            "started_at": lease.get("leased_at"),
+            "error": None,
+            "reconnecting": False,
+            "reconnects": 0,
+            "downtime": 0.0,
+            "forwards": [],
+        }
+
+    async def _probe_forwards(self, tunnel: Tunnel):
+        """Check that every forward of a live tunnel still accepts connections"""
+        async def probe(forward):
+            if not tunnel.is_up:
+                forward.up = False
+            elif forward.kind == "remote":
+                # Remote forwards listen on the server; ssh being alive is all we can see
+                forward.up = forward.ready
+            else:
+                forward.up = await probe_forward(forward, FORWARD_PROBE_TIMEOUT)
+
+        await asyncio.gather(*(probe(forward) for forward in tunnel.forwards))
+
+    async def _cmd_gateway(self, request: Dict) -> Dict:
+        """Start the load-balancing gateway, connecting any backend not yet up"""
+        if self.gateway is not None:
+            return {"ok": False, "error": f"Gateway is already running on port {self.gateway.port}",
+                    "gateway": self.gateway.to_dict()}
+        names = request.get("names") or []
+        if not names:
+            return {"ok": False, "error": "No connections given for the gateway"}
+
+        missing = [name for name in names if name not in self.tunnels]
+        results = await asyncio.gather(*(self._cmd_connect({"name": name}) for name in missing))
+        errors = {name: result["error"] for name, result in zip(missing, results) if not result["ok"]}
+        backends = [Backend(name, self.tunnels[name].endpoint, self._admission(self.tunnels[name].config, request))
+                    for name in names if name in self.tunnels and self.tunnels[name].endpoint is not None]
+        if not backends:
+            return {"ok": False, "error": "None of the connections came up", "errors": errors}
+
+        cache = None
+        if request.get("cache_size"):
+            disk_size = int(request.get("disk_cache_size", DEFAULT_DISK_CACHE_SIZE_MB))
+            try:
+                cache = ResponseCache(int(request["cache_size"]) * 1024 * 1024, disk=bool(request.get("disk_cache")),
+                                      disk_max_bytes=disk_size * 1024 * 1024)
+            except OSError as e:
+                return {"ok": False, "error": f"Could not open the response cache: {e.strerror or e}", "errors": errors}
+
+        await self._refresh_inventory()
+        batch_port = request.get("batch_port")
+        gateway = Gateway(backends, int(request.get("port", DEFAULT_GATEWAY_PORT)),
+                          retries=int(request.get("retries", DEFAULT_GATEWAY_RETRIES)),
+                          inventory=self.inventory, cache=cache,
+                          batch_port=int(batch_port) if batch_port else None)
+        try:
+            await gateway.start()
+        except OSError as e:
+            ports = f"{gateway.port} or {gateway.batch_port}" if gateway.batch_port else str(gateway.port)
+            return {"ok": False, "error": f"Could not listen on port {ports}: {e.strerror or e}", "errors": errors}
+        self.gateway = gateway
+        console.print(f"Gateway listening on port {gateway.port} across {len(backends)} backend(s)")
+        return {"ok": True, "gateway": gateway.to_dict(), "errors": errors}
+
+    @staticmethod
+    def _admission(config: Dict, request: Dict) -> Admission:
+        """A backend's request limit: its connection's max_concurrent, else the gateway's"""
+        limit = config.get("max_concurrent", request.get("max_concurrent"))
+        return Admission(int(limit) if limit else None, int(request.get("max_queue", DEFAULT_MAX_QUEUE)),
+                         int(request.get("reserve", 1)))
+
+    async def _cmd_gateway_stop(self, request: Dict) -> Dict:
+        gateway, self.gateway = self.gateway, None
+        if gateway is None:
+            return {"ok": False, "error": "Gateway is not running"}
+        await gateway.close()
+        console.print("Gateway stopped")
+        return {"ok": True, "gateway": gateway.to_dict()}
+
+    async def _cmd_metrics(self, request: Dict) -> Dict:
+        return {"ok": True, "metrics": self.render_metrics()}
+
+    async def _cmd_shutdown(self, request: Dict) -> Dict:
+        self._shutdown.set()
+        return {"ok": True}
@@ -0,0 +1,125 @@
+import asyncio
+import time
+from typing import Dict, List, Optional
+from .config import connection_user
+from .defaults import DEFAULT_CONCURRENCY
+from .failover import connection_hosts, probe_all, resolve
+from .readiness import parse_ssh_error
+from .ssh import SSHKeyManager
+
+# A host that does not accept a TCP connection in this long is reported dead
+# without starting ssh
+PRECHECK_TIMEOUT = 1.0
+# Pre-checks are only a connect() each, so many more may be in flight than handshakes
+PRECHECK_CONCURRENCY = 256
+AUTH_TIMEOUT = 10
+
+class KeyCheck:
+    """Outcome of verifying one connection's key"""
+
+    def __init__(self, name: str, config: Dict):
+        self.name = name
+        self.host = config.get("host")
+        self.port = config.get("port", 22)
+        self.user = connection_user(config)
+        self.address: Optional[str] = None
+        # Seconds to open a TCP connection to the ssh port, and for ssh to log in
+        self.tcp_latency: Optional[float] = None
+        self.auth_latency: Optional[float] = None
+        self.ok = False
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "host": self.host,
+            "port": self.port,
+            "address": self.address,
+            "ok": self.ok,
+            "tcp_latency": self.tcp_latency,
+            "auth_latency": self.auth_latency,
+            "error": self.error,
+        }
+
+def sort_checks(checks: List[KeyCheck]) -> List[KeyCheck]:
+    """Verified keys fastest first, then failures by name"""
+    return sorted(checks, key=lambda check: (not check.ok, check.auth_latency or 0.0, check.name))
+
+class KeySweep:
+    """Verify the keys of many connections at once
+
+    Every host gets a short TCP pre-check first, so a dead one fails in
+    about a second instead of ssh's ConnectTimeout; ssh is then run for the
+    hosts that answered, at most `concurrency` at a time.
+    """
+
+    def __init__(self, ssh_manager: SSHKeyManager, concurrency: int = DEFAULT_CONCURRENCY,
+                 precheck_timeout: float = PRECHECK_TIMEOUT, timeout: int = AUTH_TIMEOUT):
+        self.ssh_manager = ssh_manager
+        self.concurrency = max(1, concurrency)
+        self.precheck_timeout = precheck_timeout
+        self.timeout = timeout
+        self.done = 0
+
+    async def run(self, connections: Dict[str, Dict]) -> List[KeyCheck]:
+        checks = [KeyCheck(name, config) for name, config in connections.items()]
+        prechecks = asyncio.Semaphore(PRECHECK_CONCURRENCY)
+        handshakes = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(
+            self._check(check, connections[check.name], prechecks, handshakes) for check in checks
+        ))
+        return checks
+
+    async def _check(self, check: KeyCheck, config: Dict, prechecks: asyncio.Semaphore,
+                     handshakes: asyncio.Semaphore):
+        try:
+            key_path = self.ssh_manager.get_key_path(check.name)
+            if not key_path.exists():
+                check.error = f"No SSH key found. Run 'setup-key {check.name}' first."
+                return
+            async with prechecks:
+                if not await self._precheck(check, config):
+                    return
+            async with handshakes:
+                await self._authenticate(check, key_path)
+        except Exception as e:
+            check.error = str(e) or type(e).__name__
+        finally:
+            self.done += 1
+
+    async def _precheck(self, check: KeyCheck, config: Dict) -> bool:
+        """Find the fastest address of the host, or of any replica, that accepts connections"""
+        candidates = await resolve(connection_hosts(config))
+        await probe_all(candidates, self.precheck_timeout)
+        answered = [candidate for candidate in candidates if candidate.rtt is not None]
+        if not answered:
+            check.error = "; ".join(
+                f"{candidate.address}:{candidate.port}: {candidate.error or 'no answer'}" for candidate in candidates
+            )
+            return False
+        best = min(answered, key=lambda candidate: candidate.rtt)
+        check.address, check.port, check.tcp_latency = best.address, best.port, best.rtt
+        return True
+
+    async def _authenticate(self, check: KeyCheck, key_path):
+        started = time.monotonic()
+        process = await asyncio.create_subprocess_exec(
+            *self.ssh_manager.check_command(check.host, check.port, key_path, check.address, self.timeout,
+                                            check.user),
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            # ConnectTimeout does not cover a server that stalls after the banner
+            _, stderr = await asyncio.wait_for(process.communicate(), self.timeout * 2)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            check.error = f"No login within {self.timeout * 2}s"
+            return
+        if process.returncode != 0:
+            check.error = parse_ssh_error(stderr.decode(errors="replace").splitlines(), process.returncode)
+            return
+        check.auth_latency = time.monotonic() - started
+        check.ok = True
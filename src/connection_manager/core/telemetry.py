@@ -0,0 +1,257 @@
+import math
+import mmap
+import os
+import re
+import struct
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from .admission import percentile
+
+STATS_DIR = Path.home() / ".connections" / "stats"
+MAGIC = b"CMTS"
+VERSION = 1
+# Magic, version, record size, slot count, seconds between samples, samples
+# written so far. The count is 8-byte aligned so it is stored in one go
+HEADER = struct.Struct("<4sHHI4xdQ")
+COUNT = struct.Struct("<Q")
+COUNT_OFFSET = HEADER.size - COUNT.size
+HEADER_SIZE = 64
+# Sequence, time, bytes read and written per second, client connections,
+# requests, probe latency and flags; the sequence comes first so it can be
+# checked on its own
+RECORD = struct.Struct("<QdddIIfI")
+SAMPLE_INTERVAL = 5.0
+# A day of samples: under 1 MB per connection, however long it stays up
+SLOTS = 17280
+# Stored where a count could not be taken, such as for a Unix socket forward
+UNKNOWN = 0xFFFFFFFF
+FLAG_UP = 1
+WINDOW_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+def stats_path(name: str, directory: Path = STATS_DIR) -> Path:
+    return Path(directory) / f"{name}.ring"
+
+def parse_window(text: str) -> float:
+    """Seconds in a window such as 90s, 30m, 1h or 1d; a bare number is seconds"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*", text.lower())
+    if match is None:
+        raise ValueError(f"Invalid window {text!r}; use a number with s, m, h or d, such as 1h")
+    return float(match.group(1)) * WINDOW_UNITS[match.group(2) or "s"]
+
+class Sample:
+    """One interval of a tunnel's traffic, as stored in its ring"""
+
+    def __init__(self, timestamp: float, bytes_in: float, bytes_out: float, connections: Optional[int],
+                 requests: int, latency: Optional[float], up: bool):
+        self.timestamp = timestamp
+        # Per second over the interval ending at timestamp
+        self.bytes_in = bytes_in
+        self.bytes_out = bytes_out
+        self.connections = connections
+        self.requests = requests
+        # Seconds; None when no health probe finished during the interval
+        self.latency = latency
+        self.up = up
+
+    def to_dict(self) -> Dict:
+        return {
+            "timestamp": self.timestamp,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "connections": self.connections,
+            "requests": self.requests,
+            "latency": self.latency,
+            "up": self.up,
+        }
+
+class RingWriter:
+    """Fixed-size, memory-mapped ring of samples for one connection
+
+    The file is sized once for `slots` records, so appending is a couple of
+    stores into the mapping and the oldest sample is overwritten once the
+    ring is full. Only the supervisor writes; readers take no lock but
+    check each record's sequence number before and after reading it, the
+    way a seqlock works.
+    """
+
+    def __init__(self, path: Path, slots: int = SLOTS, interval: float = SAMPLE_INTERVAL):
+        self.path = Path(path)
+        self.slots = slots
+        self.interval = interval
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        size = HEADER_SIZE + slots * RECORD.size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            compatible = os.fstat(fd).st_size == size and self._header_matches(os.pread(fd, HEADER.size, 0))
+            if not compatible:
+                # A new file, or one written with another layout: start over
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+                os.pwrite(fd, HEADER.pack(MAGIC, VERSION, RECORD.size, slots, interval, 0), 0)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        # Picks up where the previous supervisor left off
+        self.count = COUNT.unpack_from(self._map, COUNT_OFFSET)[0]
+
+    def _header_matches(self, data: bytes) -> bool:
+        if len(data) < HEADER.size:
+            return False
+        magic, version, record_size, slots, interval, _ = HEADER.unpack(data)
+        return (magic, version, record_size, slots, interval) == (MAGIC, VERSION, RECORD.size, self.slots, self.interval)
+
+    def append(self, sample: Sample):
+        offset = HEADER_SIZE + (self.count % self.slots) * RECORD.size
+        sequence = self.count + 1
+        # Invalidate the slot first so a reader never takes a half-written record
+        COUNT.pack_into(self._map, offset, 0)
+        RECORD.pack_into(
+            self._map, offset, 0, sample.timestamp, sample.bytes_in, sample.bytes_out,
+            UNKNOWN if sample.connections is None else min(sample.connections, UNKNOWN - 1),
+            min(sample.requests, UNKNOWN), math.nan if sample.latency is None else sample.latency,
+            FLAG_UP if sample.up else 0,
+        )
+        COUNT.pack_into(self._map, offset, sequence)
+        COUNT.pack_into(self._map, COUNT_OFFSET, sequence)
+        self.count = sequence
+
+    def close(self):
+        self._map.close()
+
+class RingReader:
+    """Reads a connection's ring without contacting the supervisor
+
+    Raises OSError when there is no ring and ValueError when the file is
+    not one.
+    """
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER_SIZE:
+            self._map.close()
+            raise ValueError(f"{path} is not a stats file")
+        magic, version, record_size, self.slots, self.interval, _ = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size \
+                or len(self._map) < HEADER_SIZE + self.slots * RECORD.size:
+            self._map.close()
+            raise ValueError(f"{path} is not a stats file this version can read")
+
+    def samples(self, since: Optional[float] = None) -> List[Sample]:
+        """Samples in the ring, oldest first, from `since` on if given"""
+        count = COUNT.unpack_from(self._map, COUNT_OFFSET)[0]
+        samples = []
+        # Newest first, so a short window stops after a few records
+        for index in range(count - 1, max(0, count - self.slots) - 1, -1):
+            offset = HEADER_SIZE + (index % self.slots) * RECORD.size
+            sequence, timestamp, bytes_in, bytes_out, connections, requests, latency, flags = \
+                RECORD.unpack_from(self._map, offset)
+            if sequence != index + 1 or COUNT.unpack_from(self._map, offset)[0] != sequence:
+                continue  # Being rewritten, or already overwritten by a newer lap
+            if since is not None and timestamp < since:
+                break
+            samples.append(Sample(
+                timestamp, bytes_in, bytes_out,
+                None if connections == UNKNOWN else connections,
+                requests, None if math.isnan(latency) else latency, bool(flags & FLAG_UP),
+            ))
+        samples.reverse()
+        return samples
+
+    def close(self):
+        self._map.close()
+
+class TelemetryRecorder:
+    """Turns the supervisor's running totals into per-interval samples
+
+    Keeps one open ring per connection and the totals seen last time, so
+    byte counters become rates and request counters become counts per
+    interval. A counter that went down belongs to a new ssh process or
+    gateway and starts over from zero.
+    """
+
+    def __init__(self, directory: Path = STATS_DIR, slots: int = SLOTS, interval: float = SAMPLE_INTERVAL):
+        self.directory = Path(directory)
+        self.slots = slots
+        self.interval = interval
+        self.write_errors = 0
+        self._writers: Dict[str, RingWriter] = {}
+        # Name -> (time, bytes read, bytes written, requests)
+        self._previous: Dict[str, tuple] = {}
+
+    def record(self, name: str, now: float, bytes_read: Optional[int], bytes_written: Optional[int],
+               connections: Optional[int], requests: int, latency: Optional[float], up: bool):
+        previous = self._previous.get(name)
+        self._previous[name] = (now, bytes_read, bytes_written, requests)
+        rate_in = rate_out = 0.0
+        if previous is not None and now > previous[0]:
+            elapsed = now - previous[0]
+            if bytes_read is not None and previous[1] is not None and bytes_read >= previous[1]:
+                rate_in = (bytes_read - previous[1]) / elapsed
+            if bytes_written is not None and previous[2] is not None and bytes_written >= previous[2]:
+                rate_out = (bytes_written - previous[2]) / elapsed
+        served = requests - previous[3] if previous is not None and requests >= previous[3] else 0
+        writer = self._writers.get(name)
+        try:
+            if writer is None:
+                writer = self._writers[name] = RingWriter(stats_path(name, self.directory), self.slots, self.interval)
+            writer.append(Sample(now, rate_in, rate_out, connections, served, latency, up))
+        except (OSError, ValueError):
+            self.write_errors += 1
+
+    def retain(self, names: Iterable[str]):
+        """Close the rings of connections that are gone; their files stay readable"""
+        keep = set(names)
+        for name in [name for name in self._writers if name not in keep]:
+            self._writers.pop(name).close()
+            self._previous.pop(name, None)
+
+    def close(self):
+        self.retain(())
+
+def summarize(samples: List[Sample], interval: float) -> Dict:
+    """Totals, rates and percentiles over a list of samples"""
+    def spread(values: List[float]) -> Dict:
+        return {
+            "mean": sum(values) / len(values) if values else None,
+            "p50": percentile(values, 0.5),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99),
+            "max": max(values) if values else None,
+        }
+
+    connections = [sample.connections for sample in samples if sample.connections is not None]
+    latencies = [sample.latency for sample in samples if sample.latency is not None]
+    requests = sum(sample.requests for sample in samples)
+    span = len(samples) * interval
+    return {
+        "samples": len(samples),
+        "first": samples[0].timestamp if samples else None,
+        "last": samples[-1].timestamp if samples else None,
+        "uptime": sum(sample.up for sample in samples) / len(samples) if samples else None,
+        "bytes_in": sum(sample.bytes_in for sample in samples) * interval,
+        "bytes_out": sum(sample.bytes_out for sample in samples) * interval,
+        "rate_in": spread([sample.bytes_in for sample in samples]),
+        "rate_out": spread([sample.bytes_out for sample in samples]),
+        "connections": {
+            "current": samples[-1].connections if samples else None,
+            "mean": sum(connections) / len(connections) if connections else None,
+            "max": max(connections) if connections else None,
+        },
+        "requests": requests,
+        "request_rate": requests / span if span else None,
+        "latency": spread(latencies),
+    }
+
+def load_stats(name: str, window: Optional[float] = None, directory: Path = STATS_DIR) -> Dict:
+    """A connection's samples over the last `window` seconds and their summary"""
+    reader = RingReader(stats_path(name, directory))
+    try:
+        since = time.time() - window if window is not None else None
+        samples = reader.samples(since)
+        interval = reader.interval
+    finally:
+        reader.close()
+    return {"name": name, "interval": interval, "since": since, "samples": samples,
+            "summary": summarize(samples, interval)}
@@ -0,0 +1,304 @@
+import asyncio
+import copy
+import time
+from typing import Dict, List, Optional, Union
+from .config import connection_user
+from .forwards import Forward, forwards_from_config
+from .sockets import prepare_socket, remove_sockets
+from .ssh import SSHKeyManager
+from .readiness import AsyncStderrWatcher, wait_for_forward, wait_for_forwards, DEFAULT_READY_TIMEOUT
+from .failover import Candidate, HostHistory, NoReplica, connection_hosts, race, select
+from ..utils.metrics import LatencyHistogram
+from ..utils.tracing import span
+
+class Tunnel:
+    """A connection's forwards, carried by one ssh process started from an asyncio event loop"""
+
+    def __init__(self, name: str, config: Dict, local_port: Optional[int], remote_port: int = 11434,
+                 use_socket: bool = False):
+        self.name = name
+        self.config = config
+        self.forwards: List[Forward] = forwards_from_config(config, local_port, remote_port, name, use_socket)
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.watcher: Optional[AsyncStderrWatcher] = None
+        # Replica, address and port the process connected to, when the config lists several
+        self.host: Optional[str] = None
+        self.address: Optional[str] = None
+        self.port: Optional[int] = None
+        # Set when the forward was added to an already open master connection
+        self.on_master = False
+        self.started_at: Optional[float] = None
+        self.elapsed = 0.0
+        self.error: Optional[str] = None
+        # Watchdog bookkeeping, kept across restarts of the same tunnel
+        self.reconnects = 0
+        self.downtime = 0.0
+        self.down_since: Optional[float] = None
+        self.health_failures = 0
+        self.probe_latency = LatencyHistogram()
+        self.last_healthy_at: Optional[float] = None
+
+    @property
+    def primary(self) -> Optional[Forward]:
+        """The Ollama forward health checks and metrics refer to"""
+        return next((forward for forward in self.forwards if forward.primary), None)
+
+    @property
+    def local_port(self) -> Optional[int]:
+        primary = self.primary
+        return primary.local_port if primary is not None else None
+
+    @local_port.setter
+    def local_port(self, port: Optional[int]):
+        if self.primary is not None:
+            self.primary.local_port = port
+
+    @property
+    def local_socket(self) -> Optional[str]:
+        primary = self.primary
+        return primary.local_socket if primary is not None else None
+
+    @property
+    def endpoint(self) -> Optional[Union[int, str]]:
+        """Where Ollama is reached locally: the primary forward's socket or port"""
+        return self.local_socket or self.local_port
+
+    @property
+    def remote_port(self) -> Optional[int]:
+        primary = self.primary
+        return primary.remote_port if primary is not None else None
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid if self.process is not None else None
+
+    @property
+    def is_up(self) -> bool:
+        """Whether the tunnel is running as far as we last saw
+
+        A tunnel riding a master has no process of its own, so the
+        supervisor re-checks the master and sets error when it is gone.
+        """
+        if self.error is not None:
+            return False
+        if self.on_master:
+            return True
+        return self.process is not None and self.process.returncode is None
+
+    def mark_down(self):
+        if self.down_since is None:
+            self.down_since = time.time()
+
+    def mark_recovered(self):
+        if self.down_since is not None:
+            self.downtime += time.time() - self.down_since
+            self.down_since = None
+        self.reconnects += 1
+        self.health_failures = 0
+
+    def current_downtime(self) -> float:
+        if self.down_since is None:
+            return self.downtime
+        return self.downtime + time.time() - self.down_since
+
+    def record_probe(self, result: Dict):
+        self.probe_latency.observe(result["latency"])
+        if result["state"] != "down":
+            self.last_healthy_at = result["checked_at"]
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "host": self.host or self.config.get("host"),
+            "address": self.address,
+            "local_port": self.local_port,
+            "local_socket": self.local_socket,
+            "pid": self.pid,
+            "on_master": self.on_master,
+            "up": self.is_up,
+            "started_at": self.started_at,
+            "elapsed": round(self.elapsed, 3),
+            "error": self.error,
+            "reconnecting": self.down_since is not None,
+            "reconnects": self.reconnects,
+            "downtime": round(self.current_downtime(), 3),
+            "forwards": [forward.to_dict() for forward in self.forwards],
+        }
+
+async def run_control(ssh_manager: SSHKeyManager, tunnel: Tunnel, operation: str, *args: str) -> int:
+    """Run an `ssh -O` command against the master connection of the replica the tunnel uses"""
+    process = await asyncio.create_subprocess_exec(
+        *ssh_manager.control_command(tunnel.config['host'], tunnel.port or tunnel.config['port'],
+                                     operation, *args, address=tunnel.address,
+                                     user=connection_user(tunnel.config)),
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+    return await process.wait()
+
+async def start_tunnel(ssh_manager: SSHKeyManager, tunnel: Tunnel,
+                       timeout: float = DEFAULT_READY_TIMEOUT) -> bool:
+    """Start the tunnel and wait until it forwards, recording any error on it"""
+    started = time.monotonic()
+    tunnel.error = None
+    tunnel.process = None
+    tunnel.watcher = None
+    tunnel.on_master = False
+    tunnel.host = tunnel.address = tunnel.port = None
+    with span("tunnel.start", connection=tunnel.name) as current:
+        try:
+            await _start_tunnel(ssh_manager, tunnel, timeout)
+        except Exception as e:
+            tunnel.error = str(e)
+        if current is not None and tunnel.error is not None:
+            current.attributes["error"] = tunnel.error
+    tunnel.elapsed = time.monotonic() - started
+    if tunnel.error is None:
+        tunnel.started_at = time.time()
+    return tunnel.error is None
+
+async def _start_tunnel(ssh_manager: SSHKeyManager, tunnel: Tunnel, timeout: float):
+    key_path = ssh_manager.get_key_path(tunnel.name)
+    if not key_path.exists():
+        tunnel.error = f"No SSH key found. Run 'setup-key {tunnel.name}' first."
+        return
+    for forward in tunnel.forwards:
+        if forward.local_socket is not None:
+            prepare_socket(forward.local_socket)
+
+    replicated = len(connection_hosts(tunnel.config)) > 1
+    if replicated:
+        # Each replica address has its own master; the last one used may still be open
+        chosen = await asyncio.get_running_loop().run_in_executor(None, HostHistory().chosen, tunnel.name)
+        if chosen is not None:
+            tunnel.host, tunnel.address, tunnel.port = chosen.host, chosen.address, chosen.port
+
+    # Reuse a warm master connection instead of paying for a new handshake
+    with span("ssh.master_check"):
+        on_master = await run_control(ssh_manager, tunnel, "check") == 0
+    if on_master:
+        deadline = time.monotonic() + timeout
+        for forward in tunnel.forwards:
+            forward.reset()
+            with span("ssh.master_forward", forward=forward.name):
+                returncode = await run_control(ssh_manager, tunnel, "forward", *forward.ssh_args())
+                # The master may accept the request and still fail to bind, or be on its way out
+                working = returncode == 0 and await wait_for_forward(forward, deadline)
+            if not working:
+                forward.error = "Forward request on master connection failed" if returncode != 0 \
+                    else f"Not accepting connections after {timeout:g}s"
+                tunnel.error = f"Forward {forward.name} on master connection: {forward.error}"
+                if returncode == 0:
+                    forward.ready = True  # Bound as far as the master knows, so cancel it too
+                await _cancel_ready_forwards(ssh_manager, tunnel)
+                return
+            forward.ready = True
+        tunnel.on_master = True
+        return
+
+    if replicated:
+        tunnel.host = tunnel.address = tunnel.port = None
+        await _race_replicas(ssh_manager, tunnel, key_path, timeout)
+        return
+
+    with span("ssh.tunnel"):
+        tunnel.process = await asyncio.create_subprocess_exec(
+            *ssh_manager.tunnel_command(
+                tunnel.config['host'],
+                tunnel.config['port'],
+                key_path,
+                forwards=tunnel.forwards,
+                user=connection_user(tunnel.config)
+            ),
+            stdin=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        tunnel.watcher = AsyncStderrWatcher(tunnel.process).start()
+        ready, error = await wait_for_forwards(tunnel.watcher, tunnel.forwards, timeout)
+    if not ready:
+        tunnel.error = error
+        if tunnel.process.returncode is None:
+            tunnel.process.terminate()
+            await tunnel.process.wait()
+
+async def _race_replicas(ssh_manager: SSHKeyManager, tunnel: Tunnel, key_path, timeout: float):
+    """Start the tunnel through whichever replica completes its handshake first
+
+    Every replica's port is probed at once, then a full tunnel is started to
+    the best few, one STAGGER apart. The first whose forwards all work is
+    kept and the others are stopped before they bind anything, or fail to
+    because the winner holds the ports.
+    """
+    history = HostHistory()
+    loop = asyncio.get_running_loop()
+    try:
+        candidates = await select(tunnel.name, connection_hosts(tunnel.config), history)
+    except NoReplica as e:
+        tunnel.error = str(e)
+        await loop.run_in_executor(None, history.record, tunnel.name, e.candidates, None)
+        return
+    started: Dict[str, tuple] = {}
+
+    async def attempt(candidate: Candidate):
+        forwards = [copy.copy(forward) for forward in tunnel.forwards]
+        process = await asyncio.create_subprocess_exec(
+            *ssh_manager.tunnel_command(
+                tunnel.config['host'],
+                candidate.port,
+                key_path,
+                forwards=forwards,
+                address=candidate.address,
+                user=connection_user(tunnel.config)
+            ),
+            stdin=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        watcher = AsyncStderrWatcher(process).start()
+        begun = time.monotonic()
+        ready, error = False, None
+        try:
+            ready, error = await wait_for_forwards(watcher, forwards, timeout)
+        finally:
+            if ready:
+                started[candidate.key] = (process, watcher, forwards, time.monotonic() - begun)
+            elif process.returncode is None:
+                process.terminate()
+                await process.wait()
+        return ready, error
+
+    with span("ssh.race", candidates=len(candidates)):
+        winner, errors = await race(candidates, attempt)
+    # Another replica may have finished in the same instant as the winner
+    for key, (process, _, _, _) in list(started.items()):
+        if winner is None or key != winner.key:
+            del started[key]
+            if process.returncode is None:
+                process.terminate()
+                await process.wait()
+    if winner is None:
+        tunnel.error = "No replica connected: " + "; ".join(f"{key}: {error}" for key, error in errors.items())
+        await loop.run_in_executor(None, history.record, tunnel.name, candidates, None)
+        return
+    tunnel.process, tunnel.watcher, forwards, handshake = started[winner.key]
+    for forward, raced in zip(tunnel.forwards, forwards):
+        forward.ready, forward.up, forward.error = raced.ready, raced.up, raced.error
+    tunnel.host, tunnel.address, tunnel.port = winner.host, winner.address, winner.port
+    await loop.run_in_executor(None, history.record, tunnel.name, candidates, winner, handshake)
+
+async def stop_tunnel(ssh_manager: SSHKeyManager, tunnel: Tunnel):
+    """Tear the tunnel down and wait for its process to exit"""
+    if tunnel.on_master:
+        if tunnel.error is None:
+            await _cancel_ready_forwards(ssh_manager, tunnel)
+        tunnel.on_master = False
+    elif tunnel.process is not None and tunnel.process.returncode is None:
+        tunnel.process.terminate()
+    if tunnel.process is not None:
+        await tunnel.process.wait()
+    remove_sockets(forward.local_socket for forward in tunnel.forwards)
+
+async def _cancel_ready_forwards(ssh_manager: SSHKeyManager, tunnel: Tunnel):
+    for forward in tunnel.forwards:
+        if forward.ready:
+            await run_control(ssh_manager, tunnel, "cancel", *forward.ssh_args())
+            forward.ready = False
@@ -1,3 +1,9 @@
-from .health import check_ollama_health, verify_port_available
+__all__ = ['check_ollama_health', 'check_many', 'probe_ollama', 'verify_port_available', 'HealthCache']
 
-__all__ = ['check_ollama_health', 'verify_port_available']
+def __getattr__(name):
+    # health pulls in requests; only load it when one of its names is used so
+    # light helpers like utils.files stay cheap to import
+    if name in __all__:
+        from . import health
+        return getattr(health, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,285 @@
+import asyncio
+import http.client
+import json
+import os
+import socket
+import stat
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, ContextManager, Dict, Iterator, List, Optional
+from ..core.defaults import DEFAULT_USER
+
+BENCH_DIR = Path.home() / ".connections" / "bench"
+STUB_MODEL = "stub:latest"
+EMBED_DIMENSIONS = 768
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """Serves just enough of the Ollama API to exercise a tunnel"""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; without this, Nagle plus
+    # delayed ACKs add ~40ms to every response and swamp what we measure
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def _send_json(self, payload: Dict, status: int = 200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path in ("/api/tags", "/api/ps"):
+            # The one stub model, always on disk and loaded
+            self._send_json({"models": [{"name": STUB_MODEL, "model": STUB_MODEL, "size": 0}]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        request = self._read_json()
+        if self.path == "/api/generate":
+            self._stream_generate(int(request.get("options", {}).get("num_predict", 128)))
+        elif self.path == "/api/embed":
+            inputs = request.get("input", "")
+            count = len(inputs) if isinstance(inputs, list) else 1
+            self._send_json({
+                "model": request.get("model", STUB_MODEL),
+                "embeddings": [[0.0] * EMBED_DIMENSIONS for _ in range(count)],
+            })
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _stream_generate(self, tokens: int):
+        # Newline-delimited JSON over chunked encoding, like Ollama's streaming mode
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        line = json.dumps({"model": STUB_MODEL, "response": "token ", "done": False}).encode() + b"\n"
+        for _ in range(tokens):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        last = json.dumps({"model": STUB_MODEL, "response": "", "done": True}).encode() + b"\n"
+        self.wfile.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(last), last))
+
+@contextmanager
+def stub_server() -> Iterator[int]:
+    """Run a stub Ollama server on a free loopback port for the duration of the block"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllamaHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server.server_address[1]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@contextmanager
+def fake_ssh_on_path() -> Iterator[Path]:
+    """Put an `ssh` stand-in first on PATH so tunnels work without sshd"""
+    with tempfile.TemporaryDirectory() as bin_dir:
+        shim = Path(bin_dir) / "ssh"
+        shim.write_text(f"#!/bin/sh\nexec {sys.executable} -m connection_manager.utils.fake_ssh \"$@\"\n")
+        shim.chmod(shim.stat().st_mode | stat.S_IXUSR)
+        original_path = os.environ.get("PATH", "")
+        os.environ["PATH"] = f"{bin_dir}{os.pathsep}{original_path}"
+        try:
+            yield shim
+        finally:
+            os.environ["PATH"] = original_path
+
+@contextmanager
+def ssh_tunnel(ssh_manager, host: str, port: int, key_path: Path, remote_port: int,
+               user: str = DEFAULT_USER) -> Iterator[int]:
+    """Forward a free local port to remote_port through setup_tunnel"""
+    local_port = free_port()
+    process = ssh_manager.setup_tunnel(host, port, key_path, local_port=local_port, remote_port=remote_port,
+                                       user=user)
+    if process is None:
+        raise RuntimeError("Tunnel setup failed")
+    try:
+        yield local_port
+    finally:
+        process.terminate()
+        process.wait()
+
+@contextmanager
+def relay_tunnel(ssh_manager, host: str, port: int, key_path: Path, remote_port: int,
+                 user: str = DEFAULT_USER) -> Iterator[int]:
+    """Forward a free local port to remote_port through the in-process relay over ssh -W"""
+    from ..core.relay import Relay
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    relay = Relay(lambda: ssh_manager.stdio_command(host, port, key_path, "localhost", remote_port, user))
+    try:
+        asyncio.run_coroutine_threadsafe(relay.start(), loop).result()
+        yield relay.port
+    finally:
+        asyncio.run_coroutine_threadsafe(relay.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def request_once(connection: http.client.HTTPConnection, method: str, path: str,
+                 body: Optional[Dict] = None) -> int:
+    """Send one request on a kept-alive connection and drain the response"""
+    payload = json.dumps(body).encode() if body is not None else None
+    headers = {"Content-Type": "application/json"} if payload is not None else {}
+    connection.request(method, path, body=payload, headers=headers)
+    response = connection.getresponse()
+    size = 0
+    while True:
+        chunk = response.read(65536)
+        if not chunk:
+            break
+        size += len(chunk)
+    if response.status != 200:
+        raise RuntimeError(f"{path} returned status code: {response.status}")
+    return size
+
+def measure_requests(port: int, method: str, path: str, body: Optional[Dict] = None,
+                     count: int = 200, concurrency: int = 8) -> Dict:
+    """Requests/sec and latency percentiles for one endpoint"""
+    per_worker = [count // concurrency + (1 if i < count % concurrency else 0) for i in range(concurrency)]
+
+    def worker(requests: int):
+        latencies, errors, size = [], 0, 0
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        try:
+            for _ in range(requests):
+                started = time.perf_counter()
+                try:
+                    size += request_once(connection, method, path, body)
+                except (OSError, RuntimeError, http.client.HTTPException):
+                    errors += 1
+                    connection.close()
+                    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                    continue
+                latencies.append(time.perf_counter() - started)
+        finally:
+            connection.close()
+        return latencies, errors, size
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(worker, [n for n in per_worker if n]))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for outcome in outcomes for latency in outcome[0]]
+    total_bytes = sum(outcome[2] for outcome in outcomes)
+    return {
+        "requests": len(latencies),
+        "errors": sum(outcome[1] for outcome in outcomes),
+        "seconds": elapsed,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "bytes": total_bytes,
+        "bytes_per_sec": total_bytes / elapsed if elapsed else 0.0,
+    }
+
+def run_suite(port: int, count: int = 200, concurrency: int = 8, tokens: int = 2000) -> Dict:
+    """Measure the endpoints an Ollama client hits most through one port"""
+    return {
+        "tags": measure_requests(port, "GET", "/api/tags", count=count, concurrency=concurrency),
+        "embed": measure_requests(
+            port, "POST", "/api/embed",
+            body={"model": STUB_MODEL, "input": ["benchmark input"] * 4},
+            count=count, concurrency=concurrency
+        ),
+        "generate_stream": measure_requests(
+            port, "POST", "/api/generate",
+            body={"model": STUB_MODEL, "prompt": "benchmark", "options": {"num_predict": tokens}},
+            count=max(1, count // 20), concurrency=min(concurrency, 4)
+        ),
+    }
+
+# A forwarder takes the stub's port and yields the local port clients should use.
+# "direct" is the baseline; other entries put a forwarding layer in between.
+Forwarder = Callable[[int], ContextManager[int]]
+
+@contextmanager
+def direct(stub_port: int) -> Iterator[int]:
+    yield stub_port
+
+def run_benchmarks(forwarders: Dict[str, Forwarder], count: int = 200,
+                   concurrency: int = 8, tokens: int = 2000) -> Dict:
+    """Run the suite against a fresh stub server through every forwarder"""
+    results = {
+        "timestamp": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "settings": {"requests": count, "concurrency": concurrency, "tokens": tokens},
+        "modes": {},
+    }
+    with stub_server() as stub_port:
+        for mode, forwarder in forwarders.items():
+            setup_started = time.perf_counter()
+            with forwarder(stub_port) as port:
+                setup_seconds = time.perf_counter() - setup_started
+                suite = run_suite(port, count=count, concurrency=concurrency, tokens=tokens)
+            suite["setup_seconds"] = setup_seconds
+            results["modes"][mode] = suite
+    return results
+
+def save_results(results: Dict, output: Optional[Path] = None) -> Path:
+    if output is None:
+        BENCH_DIR.mkdir(parents=True, exist_ok=True)
+        output = BENCH_DIR / f"bench-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    Path(output).write_text(json.dumps(results, indent=2))
+    return Path(output)
+
+def compare_results(current: Dict, baseline: Dict) -> List[Dict]:
+    """Relative change per mode, endpoint and metric against an earlier run"""
+    rows = []
+    for mode, suite in current["modes"].items():
+        base_suite = baseline.get("modes", {}).get(mode)
+        if not base_suite:
+            continue
+        for endpoint, stats in suite.items():
+            if not isinstance(stats, dict) or endpoint not in base_suite:
+                continue
+            for metric in ("rps", "p50_ms", "p99_ms", "bytes_per_sec"):
+                before, after = base_suite[endpoint].get(metric), stats.get(metric)
+                if before:
+                    rows.append({
+                        "mode": mode,
+                        "endpoint": endpoint,
+                        "metric": metric,
+                        "before": before,
+                        "after": after,
+                        "change": (after - before) / before,
+                    })
+    return rows
@@ -0,0 +1,131 @@
+"""Stand-in for the ssh binary, for benchmarking on machines without sshd
+
+Only what the tunnel code needs is implemented: each `-L local:host:remote`
+forward is served by relaying connections on a local port or socket path to
+host:remote on this machine, `-W host:port` relays stdin and stdout to
+host:port, `-D port` listens but closes every connection, `-R` forwards are
+acknowledged without listening anywhere, and `-O` control requests always
+report that no master is running. With `-v` the handshake lines ssh logs
+are printed too, so phase tracing has something to parse.
+"""
+import asyncio
+import os
+import socket
+import sys
+import threading
+from typing import List
+
+def parse_forwards(args: List[str], flag: str = "-L") -> List[str]:
+    return [args[i + 1] for i, arg in enumerate(args[:-1]) if arg == flag]
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def _close(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    writer.close()
+
+async def _serve(local: List[str], dynamic: List[str], remote: List[str]):
+    for spec in local:
+        listen, host, remote_port = spec.rsplit(":", 2)
+
+        async def handle(reader, writer, host=host, remote_port=int(remote_port)):
+            try:
+                upstream_reader, upstream_writer = await asyncio.open_connection(host, remote_port)
+            except OSError:
+                writer.close()
+                return
+            await asyncio.gather(_pipe(reader, upstream_writer), _pipe(upstream_reader, writer))
+
+        if listen.isdigit():
+            await asyncio.start_server(handle, "127.0.0.1", int(listen))
+            print(f"debug1: Local forwarding listening on 127.0.0.1 port {listen}.", file=sys.stderr, flush=True)
+            continue
+        # ssh's default StreamLocalBindMask leaves the socket to its owner
+        umask = os.umask(0o177)
+        try:
+            await asyncio.start_unix_server(handle, listen)
+        finally:
+            os.umask(umask)
+        print(f"debug1: Local forwarding listening on path {listen}.", file=sys.stderr, flush=True)
+    for port in dynamic:
+        await asyncio.start_server(_close, "127.0.0.1", int(port))
+        print(f"debug1: Local forwarding listening on 127.0.0.1 port {port}.", file=sys.stderr, flush=True)
+    for spec in remote:
+        listen_port, host, port = spec.rsplit(":", 2)
+        print(f"debug1: remote forward success for: listen {listen_port}, connect {host}:{port}",
+              file=sys.stderr, flush=True)
+    await asyncio.Event().wait()
+
+def _stdio(spec: str) -> int:
+    host, port = spec.rsplit(":", 1)
+    try:
+        upstream = socket.create_connection((host, int(port)))
+        upstream.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError as e:
+        print(f"channel 0: open failed: connect failed: {e}", file=sys.stderr)
+        print("stdio forwarding failed", file=sys.stderr)
+        return 255
+
+    def outbound():
+        while True:
+            data = os.read(0, 65536)
+            if not data:
+                break
+            upstream.sendall(data)
+        upstream.shutdown(socket.SHUT_WR)
+
+    sender = threading.Thread(target=outbound, daemon=True)
+    sender.start()
+    while True:
+        data = upstream.recv(65536)
+        if not data:
+            break
+        os.write(1, data)
+    os.close(1)
+    sender.join()
+    return 0
+
+def _handshake(host: str):
+    for line in (
+        f"debug1: Connecting to {host} [127.0.0.1] port 22.",
+        "debug1: Connection established.",
+        "debug1: Remote protocol version 2.0, remote software version fake_ssh",
+        "debug1: SSH2_MSG_KEXINIT sent",
+        "debug1: SSH2_MSG_NEWKEYS received",
+        "debug1: SSH2_MSG_SERVICE_ACCEPT received",
+        f"Authenticated to {host} ([127.0.0.1]:22) using \"publickey\".",
+    ):
+        print(line, file=sys.stderr, flush=True)
+
+def main(args: List[str]) -> int:
+    if "-O" in args:
+        print("Control socket connect: No such file or directory", file=sys.stderr)
+        return 255
+    if "-v" in args:
+        _handshake(next((arg.split("@", 1)[1] for arg in args if "@" in arg), "localhost"))
+    if "-W" in args:
+        return _stdio(args[args.index("-W") + 1])
+    local, dynamic, remote = (parse_forwards(args, flag) for flag in ("-L", "-D", "-R"))
+    if not (local or dynamic or remote):
+        return 0
+    try:
+        asyncio.run(_serve(local, dynamic, remote))
+    except OSError as e:
+        print(f"bind: {e}", file=sys.stderr)
+        return 255
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
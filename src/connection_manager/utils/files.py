@@ -0,0 +1,41 @@
+import fcntl
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Union
+
+@contextmanager
+def file_lock(path: Path, blocking: bool = True, shared: bool = False) -> Iterator[None]:
+    """Hold an exclusive flock on path, shared by every process using it
+
+    Without blocking, raises BlockingIOError at once if another process holds
+    it. A shared lock only keeps out exclusive holders, for readers.
+    """
+    operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    with open(path, "a") as lock:
+        fcntl.flock(lock, operation if blocking else operation | fcntl.LOCK_NB)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def atomic_write(path: Path, text: Union[str, bytes]):
+    """Replace path through a fsynced temp file so readers never see a partial write"""
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.stem}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb" if isinstance(text, bytes) else "w") as tmp:
+            tmp.write(text)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
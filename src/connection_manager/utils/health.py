@@ -1,22 +1,142 @@
+import http.client
+import json
 import requests
-from typing import Optional, Tuple
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 from rich.console import Console
 
 console = Console()
 
-def check_ollama_health(port: int) -> Tuple[bool, Optional[str]]:
-    """Check if Ollama is responding on the given port"""
+DEFAULT_TIMEOUT = 2.0
+# Probes slower than this still work but mark the endpoint as degraded
+DEGRADED_LATENCY = 0.5
+HEALTH_TTL = 15.0
+MAX_PROBE_WORKERS = 32
+
+# A local port, or the path of a forward bound to a Unix socket
+Endpoint = Union[int, str]
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    """Shared keep-alive session so repeated probes reuse their connections"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=MAX_PROBE_WORKERS,
+                pool_maxsize=MAX_PROBE_WORKERS
+            )
+            session.mount("http://", adapter)
+            _session = session
+    return _session
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP over a Unix socket, which requests cannot speak without an extra package"""
+
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+def _get(endpoint: Endpoint, path: str, timeout: float) -> Tuple[int, bytes]:
+    """Status and body of a GET against Ollama on a port or socket"""
+    if isinstance(endpoint, int):
+        response = get_session().get(f"http://localhost:{endpoint}{path}", timeout=timeout)
+        return response.status_code, response.content
+    connection = UnixHTTPConnection(endpoint, timeout)
     try:
-        response = requests.get(f"http://localhost:{port}/api/tags", timeout=5)
-        if response.status_code == 200:
-            return True, None
-        return False, f"Ollama returned status code: {response.status_code}"
-    except requests.exceptions.ConnectionError:
-        return False, "Could not connect to Ollama"
-    except requests.exceptions.Timeout:
-        return False, "Connection to Ollama timed out"
+        connection.request("GET", path)
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+def fetch_json(endpoint: Endpoint, path: str, timeout: float = DEFAULT_TIMEOUT) -> Dict:
+    """GET one of Ollama's JSON endpoints; raises on errors and bad status codes"""
+    status_code, body = _get(endpoint, path, timeout)
+    if status_code != 200:
+        raise ValueError(f"Ollama returned status code: {status_code}")
+    return json.loads(body)
+
+def classify_health(latency: float, error: Optional[str],
+                    degraded_after: float = DEGRADED_LATENCY) -> str:
+    """Turn a probe outcome into up, degraded or down"""
+    if error is not None:
+        return "down"
+    if latency > degraded_after:
+        return "degraded"
+    return "up"
+
+def probe_ollama(port: Endpoint, timeout: float = DEFAULT_TIMEOUT,
+                 degraded_after: float = DEGRADED_LATENCY) -> Dict:
+    """Probe Ollama's /api/tags once on a port or socket and record latency and state"""
+    started = time.monotonic()
+    error = None
+    try:
+        status_code, _ = _get(port, "/api/tags", timeout)
+        if status_code != 200:
+            error = f"Ollama returned status code: {status_code}"
+    except (requests.exceptions.Timeout, socket.timeout):
+        error = "Connection to Ollama timed out"
+    except (requests.exceptions.ConnectionError, OSError):
+        error = "Could not connect to Ollama"
     except Exception as e:
-        return False, f"Unexpected error: {str(e)}"
+        error = f"Unexpected error: {str(e)}"
+    latency = time.monotonic() - started
+    return {
+        "port": port,
+        "state": classify_health(latency, error, degraded_after),
+        "latency": latency,
+        "error": error,
+        "checked_at": time.time(),
+    }
+
+def check_ollama_health(port: Endpoint, timeout: float = 5) -> Tuple[bool, Optional[str]]:
+    """Check if Ollama is responding on the given port or socket"""
+    result = probe_ollama(port, timeout=timeout)
+    return result["state"] != "down", result["error"]
+
+def check_many(ports: Iterable[Endpoint], timeout: float = DEFAULT_TIMEOUT) -> Dict[Endpoint, Dict]:
+    """Probe many ports or sockets at once; total time is bounded by the slowest probe"""
+    ports = sorted(set(ports), key=str)
+    if not ports:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(MAX_PROBE_WORKERS, len(ports))) as executor:
+        results = executor.map(lambda port: probe_ollama(port, timeout=timeout), ports)
+        return {result["port"]: result for result in results}
+
+class HealthCache:
+    """Latest probe result per port or socket, considered fresh for `ttl` seconds"""
+
+    def __init__(self, ttl: float = HEALTH_TTL):
+        self.ttl = ttl
+        self._results: Dict[Endpoint, Dict] = {}
+
+    def get(self, port: Endpoint) -> Optional[Dict]:
+        return self._results.get(port)
+
+    def is_fresh(self, port: Endpoint) -> bool:
+        result = self._results.get(port)
+        return result is not None and time.time() - result["checked_at"] < self.ttl
+
+    def stale_ports(self, ports: Iterable[Endpoint]) -> List[Endpoint]:
+        return [port for port in ports if not self.is_fresh(port)]
+
+    def update(self, results: Dict[Endpoint, Dict]):
+        self._results.update(results)
+
+    def discard(self, port: Endpoint):
+        self._results.pop(port, None)
 
 def verify_port_available(port: int) -> Tuple[bool, Optional[str]]:
     """Check if a port is available for use"""
@@ -0,0 +1,161 @@
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+from .files import atomic_write
+from .procfs import read_stats
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "connection_manager"
+# Probe latency buckets in seconds, from a quick loopback hop to a stalled tunnel
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class LatencyHistogram:
+    """Cumulative histogram in the shape Prometheus expects"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    # Keep counters exact; %g would round large byte counts
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+class MetricsWriter:
+    """Accumulates samples grouped by metric family and renders the exposition text"""
+
+    def __init__(self):
+        self._families: Dict[str, Tuple[str, str, List[str]]] = {}
+
+    def add(self, name: str, kind: str, help_text: str, value: float, **labels: str):
+        self.add_sample(name, kind, help_text, name, value, **labels)
+
+    def add_sample(self, family: str, kind: str, help_text: str, sample: str, value: float, **labels: str):
+        full_family = f"{PREFIX}_{family}"
+        if full_family not in self._families:
+            self._families[full_family] = (kind, help_text, [])
+        label_text = _labels(**labels) if labels else ""
+        self._families[full_family][2].append(f"{PREFIX}_{sample}{label_text} {_format_value(value)}")
+
+    def add_histogram(self, name: str, help_text: str, histogram: LatencyHistogram, **labels: str):
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            self.add_sample(name, "histogram", help_text, f"{name}_bucket", count, **dict(labels, le=f"{bound:g}"))
+        self.add_sample(name, "histogram", help_text, f"{name}_bucket", histogram.count, **dict(labels, le="+Inf"))
+        self.add_sample(name, "histogram", help_text, f"{name}_sum", histogram.sum, **labels)
+        self.add_sample(name, "histogram", help_text, f"{name}_count", histogram.count, **labels)
+
+    def render(self) -> str:
+        lines = []
+        for family, (kind, help_text, samples) in self._families.items():
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+def render_metrics(tunnels: Iterable, configured: Iterable[str], gateway=None) -> str:
+    """Render per-connection tunnel, Ollama and gateway metrics in Prometheus text format"""
+    now = time.time()
+    writer = MetricsWriter()
+    running = {tunnel.name: tunnel for tunnel in tunnels}
+    configured = sorted(set(configured) | set(running))
+    writer.add("connections_configured", "gauge", "Number of configured connections", len(configured))
+
+    for name in configured:
+        tunnel = running.get(name)
+        writer.add("tunnel_up", "gauge", "Whether the tunnel is forwarding (1) or not (0)",
+                   1 if tunnel is not None and tunnel.is_up else 0, connection=name)
+        if tunnel is None:
+            continue
+
+        writer.add("tunnel_reconnects_total", "counter", "Automatic reconnects performed by the watchdog",
+                   tunnel.reconnects, connection=name)
+        writer.add("tunnel_downtime_seconds_total", "counter", "Time spent down waiting for a reconnect",
+                   tunnel.current_downtime(), connection=name)
+        writer.add("tunnel_handshake_seconds", "gauge", "Duration of the last tunnel bring-up",
+                   tunnel.elapsed, connection=name)
+        if tunnel.started_at is not None and tunnel.is_up:
+            writer.add("tunnel_uptime_seconds", "gauge", "Time since the tunnel last came up",
+                       now - tunnel.started_at, connection=name)
+
+        for forward in tunnel.forwards:
+            writer.add("forward_ready", "gauge", "Whether each forward of the tunnel came up (1) or not (0)",
+                       1 if tunnel.is_up and forward.ready else 0,
+                       connection=name, forward=forward.name, type=forward.kind)
+
+        process = read_stats(tunnel.pid) if tunnel.pid else None
+        if process is not None:
+            if process.bytes_read is not None:
+                help_text = "Bytes moved by the tunnel's ssh process, including SSH framing"
+                writer.add("tunnel_bytes_total", "counter", help_text, process.bytes_read,
+                           connection=name, direction="read")
+                writer.add("tunnel_bytes_total", "counter", help_text, process.bytes_written,
+                           connection=name, direction="write")
+            writer.add("tunnel_resident_bytes", "gauge", "Resident memory of the tunnel's ssh process",
+                       process.rss, connection=name)
+            writer.add("tunnel_cpu_seconds_total", "counter", "CPU time used by the tunnel's ssh process",
+                       process.cpu_seconds, connection=name)
+            if process.fds is not None:
+                writer.add("tunnel_open_fds", "gauge", "File descriptors open in the tunnel's ssh process",
+                           process.fds, connection=name)
+
+        writer.add_histogram("ollama_probe_latency_seconds", "Latency of /api/tags health probes",
+                             tunnel.probe_latency, connection=name)
+        if tunnel.last_healthy_at is not None:
+            writer.add("ollama_seconds_since_healthy", "gauge", "Time since the last successful health check",
+                       now - tunnel.last_healthy_at, connection=name)
+
+    if gateway is not None:
+        writer.add("gateway_retries_total", "counter", "Requests the gateway retried on another backend",
+                   gateway.retried)
+        writer.add("gateway_failures_total", "counter", "Requests the gateway answered with an error",
+                   gateway.failures)
+        for backend in gateway.backends:
+            writer.add("gateway_requests_total", "counter", "Requests the gateway sent to each backend",
+                       backend.requests, backend=backend.name)
+            writer.add("gateway_errors_total", "counter", "Failed requests per gateway backend",
+                       backend.errors, backend=backend.name)
+            writer.add("gateway_outstanding_requests", "gauge", "Requests in flight per gateway backend",
+                       backend.outstanding, backend=backend.name)
+            writer.add("gateway_backend_healthy", "gauge", "Whether the gateway sends requests to the backend",
+                       1 if backend.healthy else 0, backend=backend.name)
+            admission = backend.admission
+            for priority, stats in admission.stats.items():
+                writer.add("gateway_queued_requests", "gauge", "Requests waiting for a slot per backend and priority",
+                           admission.queued(priority), backend=backend.name, priority=priority)
+                writer.add("gateway_rejected_total", "counter", "Requests turned away by a full queue",
+                           stats.rejected, backend=backend.name, priority=priority)
+                writer.add_histogram("gateway_queue_wait_seconds", "Time requests waited for a slot",
+                                     stats.waits, backend=backend.name, priority=priority)
+        cache = gateway.cache
+        if cache is not None:
+            for result, count in (("hit", cache.hits), ("disk_hit", cache.disk_hits),
+                                  ("coalesced", cache.coalesced), ("miss", cache.misses)):
+                writer.add("gateway_cache_lookups_total", "counter", "Cacheable gateway requests by outcome",
+                           count, result=result)
+            writer.add("gateway_cache_evictions_total", "counter", "Responses evicted from the gateway's memory cache",
+                       cache.evictions)
+            writer.add("gateway_cache_bytes", "gauge", "Bytes of responses in the gateway cache",
+                       cache.size, tier="memory")
+            writer.add("gateway_cache_bytes", "gauge", "Bytes of responses in the gateway cache",
+                       cache.disk_size, tier="disk")
+
+    return writer.render()
+
+def write_textfile(path: Path, text: str):
+    """Atomically replace a node_exporter textfile-collector file"""
+    # The collector skips files not ending in .prom, so it never reads the temp file
+    atomic_write(path, text)
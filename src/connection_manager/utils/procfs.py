@@ -0,0 +1,190 @@
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+PROC = Path("/proc")
+# Changes on every boot, so a recorded start time cannot match a process
+# that got the same PID after a reboot
+BOOT_ID_PATH = PROC / "sys" / "kernel" / "random" / "boot_id"
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def have_proc() -> bool:
+    return (PROC / "self" / "stat").exists()
+
+def _boot_id() -> Optional[str]:
+    try:
+        return BOOT_ID_PATH.read_text().strip()
+    except OSError:
+        return None
+
+def _stat_fields(pid: int) -> Optional[List[str]]:
+    """Fields of /proc/<pid>/stat from the state on (field 3 in proc(5))"""
+    try:
+        data = (PROC / str(pid) / "stat").read_text()
+    except OSError:
+        return None
+    # The command name may hold spaces and parentheses; it ends at the last ")"
+    return data[data.rindex(")") + 2:].split()
+
+def _cmdline(pid: int) -> Optional[List[str]]:
+    try:
+        data = (PROC / str(pid) / "cmdline").read_bytes()
+    except OSError:
+        return None
+    return [arg.decode(errors="replace") for arg in data.split(b"\0")[:-1]]
+
+def process_identity(pid: Optional[int]) -> Optional[Dict]:
+    """What makes a PID one particular process: boot, start time and command line
+
+    None when the process is gone or there is no /proc to ask.
+    """
+    if not pid:
+        return None
+    fields = _stat_fields(pid)
+    cmdline = _cmdline(pid)
+    if fields is None or cmdline is None or fields[0] == "Z":
+        return None
+    return {"pid": pid, "boot_id": _boot_id(), "start_time": int(fields[19]), "cmdline": cmdline}
+
+def _signal_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def process_alive(pid: Optional[int], identity: Optional[Dict] = None) -> bool:
+    """Whether pid is still the process recorded in identity
+
+    Without an identity, or without /proc, all we can tell is that some
+    process has the PID.
+    """
+    if not pid:
+        return False
+    if identity is None or not have_proc():
+        return _signal_alive(pid)
+    current = process_identity(pid)
+    return current is not None and all(
+        current[key] == identity.get(key) for key in ("boot_id", "start_time", "cmdline")
+    )
+
+class ProcessStats:
+    """Resource use of one process as of one /proc read"""
+
+    def __init__(self, pid: int, rss: int, cpu_seconds: float, threads: int, fds: Optional[int],
+                 sockets: Optional[int], bytes_read: Optional[int], bytes_written: Optional[int]):
+        self.pid = pid
+        self.rss = rss
+        self.cpu_seconds = cpu_seconds
+        self.threads = threads
+        # None where /proc/<pid>/fd or io is not ours to read
+        self.fds = fds
+        self.sockets = sockets
+        self.bytes_read = bytes_read
+        self.bytes_written = bytes_written
+        self.cpu_percent: Optional[float] = None
+        self.sampled_at = time.monotonic()
+
+    def to_dict(self) -> Dict:
+        return {
+            "pid": self.pid,
+            "rss": self.rss,
+            "cpu_seconds": round(self.cpu_seconds, 2),
+            "cpu_percent": None if self.cpu_percent is None else round(self.cpu_percent, 1),
+            "threads": self.threads,
+            "fds": self.fds,
+            "sockets": self.sockets,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+        }
+
+def read_stats(pid: int) -> Optional[ProcessStats]:
+    """Memory, CPU time, descriptors and I/O of one process; None once it is gone"""
+    fields = _stat_fields(pid)
+    if fields is None or fields[0] == "Z":
+        return None
+    base = PROC / str(pid)
+    try:
+        fds, sockets = 0, 0
+        for fd in os.listdir(base / "fd"):
+            try:
+                link = os.readlink(base / "fd" / fd)
+            except OSError:
+                continue  # Closed since the listing
+            fds += 1
+            sockets += link.startswith("socket:")
+    except OSError:
+        fds = sockets = None
+    try:
+        io = dict(line.split(":", 1) for line in (base / "io").read_text().splitlines())
+        # Every read and write, which for ssh is almost all socket and pipe traffic
+        bytes_read, bytes_written = int(io["rchar"]), int(io["wchar"])
+    except (OSError, KeyError, ValueError):
+        bytes_read = bytes_written = None
+    return ProcessStats(
+        pid,
+        rss=int(fields[21]) * PAGE_SIZE,
+        cpu_seconds=(int(fields[11]) + int(fields[12])) / CLOCK_TICKS,
+        threads=int(fields[17]),
+        fds=fds,
+        sockets=sockets,
+        bytes_read=bytes_read,
+        bytes_written=bytes_written,
+    )
+
+class ProcessInspector:
+    """Reads the stats of many processes in one pass over /proc
+
+    Keeps the previous sample of each PID so CPU use can be given as a
+    share of the time between two scans.
+    """
+
+    def __init__(self):
+        self._previous: Dict[int, ProcessStats] = {}
+
+    def scan(self, pids: Iterable[Optional[int]]) -> Dict[int, ProcessStats]:
+        if not have_proc():
+            return {}
+        stats = {}
+        for pid in {pid for pid in pids if pid}:
+            current = read_stats(pid)
+            if current is None:
+                self._previous.pop(pid, None)
+                continue
+            previous = self._previous.get(pid)
+            if previous is not None and current.sampled_at > previous.sampled_at \
+                    and current.cpu_seconds >= previous.cpu_seconds:
+                current.cpu_percent = 100 * (current.cpu_seconds - previous.cpu_seconds) \
+                    / (current.sampled_at - previous.sampled_at)
+            stats[pid] = current
+        self._previous.update(stats)
+        return stats
+
+# "01" is ESTABLISHED in the st column of /proc/net/tcp
+TCP_ESTABLISHED = "01"
+
+def established_connections(ports: Iterable[int]) -> Dict[int, int]:
+    """Open TCP connections accepted on each of the given local ports
+
+    Read from /proc/net/tcp and tcp6 in one pass; empty without /proc.
+    """
+    counts = {port: 0 for port in ports}
+    if not counts:
+        return counts
+    for table in ("tcp", "tcp6"):
+        try:
+            lines = (PROC / "net" / table).read_text().splitlines()[1:]
+        except OSError:
+            continue
+        for line in lines:
+            fields = line.split()
+            if len(fields) < 4 or fields[3] != TCP_ESTABLISHED:
+                continue
+            port = int(fields[1].rsplit(":", 1)[1], 16)
+            if port in counts:
+                counts[port] += 1
+    return counts
@@ -0,0 +1,159 @@
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+TRACE_DIR = Path.home() / ".connections" / "traces"
+
+class Span:
+    """One timed phase; times are time.monotonic() seconds"""
+
+    def __init__(self, name: str, start: float, parent: Optional[str] = None, attributes: Optional[Dict] = None):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.start = start
+        self.end: Optional[float] = None
+        self.parent = parent
+        self.attributes = attributes or {}
+
+    def to_dict(self, trace_id: str, epoch: float) -> Dict:
+        end = self.end if self.end is not None else self.start
+        return {
+            "trace": trace_id,
+            "id": self.id,
+            "parent": self.parent,
+            "name": self.name,
+            "start": self.start,
+            "duration": end - self.start,
+            # Wall clock, for lining a trace up with logs
+            "timestamp": epoch + self.start,
+            "pid": os.getpid(),
+            "attributes": self.attributes,
+        }
+
+class Trace:
+    """Spans recorded for one operation, such as a connect
+
+    The monotonic clock is shared by every process on the machine, so
+    spans the supervisor records can be merged into the CLI's trace as
+    they are.
+    """
+
+    def __init__(self, name: str, trace_id: Optional[str] = None):
+        self.name = name
+        self.id = trace_id or uuid.uuid4().hex
+        # time.time() at monotonic zero
+        self.epoch = time.time() - time.monotonic()
+        self.spans: List[Span] = []
+        self.records: List[Dict] = []
+
+    def add(self, name: str, start: float, end: float, parent: Optional[str] = None, **attributes) -> Span:
+        span = Span(name, start, parent, attributes)
+        span.end = end
+        self.spans.append(span)
+        return span
+
+    def extend(self, records: Iterable[Dict]):
+        """Take in spans another process recorded for this trace"""
+        self.records.extend(records)
+
+    def to_records(self) -> List[Dict]:
+        records = [span.to_dict(self.id, self.epoch) for span in self.spans] + self.records
+        return sorted(records, key=lambda record: record["start"])
+
+    def write(self, path: Optional[Path] = None) -> Path:
+        """Append the spans to a JSON-lines file, one span per line"""
+        if path is None:
+            path = TRACE_DIR / f"{self.name}-{time.strftime('%Y%m%d-%H%M%S')}.jsonl"
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a") as f:
+            for record in self.to_records():
+                f.write(json.dumps(record) + "\n")
+        return path
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+# Id of the span new spans nest under
+_parent: ContextVar[Optional[str]] = ContextVar("parent", default=None)
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+@contextmanager
+def activate(trace: Trace, parent: Optional[str] = None) -> Iterator[Trace]:
+    """Record the spans of this thread or task, and the tasks it starts, into trace
+
+    parent nests them under a span of another process, such as the CLI
+    span waiting on a supervisor request.
+    """
+    token, parent_token = _trace.set(trace), _parent.set(parent)
+    try:
+        yield trace
+    finally:
+        _parent.reset(parent_token)
+        _trace.reset(token)
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """Time the enclosed block as a child of the current span; free when nothing is traced"""
+    trace = _trace.get()
+    if trace is None:
+        yield None
+        return
+    current = Span(name, time.monotonic(), _parent.get(), attributes)
+    trace.spans.append(current)
+    token = _parent.set(current.id)
+    try:
+        yield current
+    except BaseException as e:
+        current.attributes["error"] = str(e) or type(e).__name__
+        raise
+    finally:
+        current.end = time.monotonic()
+        _parent.reset(token)
+
+def record(name: str, start: float, end: float, **attributes):
+    """Add a phase timed elsewhere, such as from a log, under the current span"""
+    trace = _trace.get()
+    if trace is None:
+        return
+    trace.add(name, start, end, _parent.get(), **attributes)
+
+def load_trace(path: Path) -> List[Dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def to_chrome(records: List[Dict]) -> Dict:
+    """Spans in the Trace Event format read by chrome://tracing and Perfetto"""
+    return {
+        "traceEvents": [
+            {
+                "name": record["name"],
+                "cat": "connection_manager",
+                "ph": "X",
+                "ts": record["start"] * 1e6,
+                "dur": record["duration"] * 1e6,
+                "pid": record["pid"],
+                # One row per trace, so concurrent connects do not overlap
+                "tid": int(record["trace"][:8], 16),
+                "args": record["attributes"],
+            }
+            for record in records
+        ],
+        "displayTimeUnit": "ms",
+    }
+
+def depths(records: List[Dict]) -> Dict[str, int]:
+    """How deep each span is nested, by span id"""
+    parents = {record["id"]: record["parent"] for record in records}
+    result = {}
+    for span_id in parents:
+        depth, parent = 0, parents[span_id]
+        while parent in parents and depth < len(parents):
+            depth, parent = depth + 1, parents[parent]
+        result[span_id] = depth
+    return result
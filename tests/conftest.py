@@ -0,0 +1,37 @@
+import multiprocessing
+import sys
+from pathlib import Path
+
+import pytest
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+
+# Run against the source tree without installing it
+sys.path.insert(0, str(SRC))
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    """A HOME of its own, inherited by the processes a test forks"""
+    monkeypatch.setenv("HOME", str(tmp_path))
+    (tmp_path / ".connections").mkdir()
+    return tmp_path
+
+@pytest.fixture
+def run_processes():
+    """Run target once per argument tuple, each in a forked process, all at once
+
+    Every call gets a queue as its first argument; returns what they put on it.
+    """
+    return _run_processes
+
+def _run_processes(target, *args_per_process):
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    processes = [context.Process(target=target, args=(queue, *args)) for args in args_per_process]
+    for process in processes:
+        process.start()
+    results = [queue.get(timeout=60) for _ in processes]
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+    return results
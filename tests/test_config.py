@@ -0,0 +1,45 @@
+from connection_manager.core.config import ConfigManager
+
+def _save(queue, prefix, count):
+    manager = ConfigManager()
+    for index in range(count):
+        manager.save_connection(f"{prefix}{index}", {"host": f"{prefix}{index}.example.com", "port": 22})
+    queue.put(count)
+
+def _batch(queue, prefix, count):
+    manager = ConfigManager()
+    for index in range(count):
+        with manager.batch() as connections:
+            connections[f"{prefix}{index}"] = {"host": "batch.example.com", "port": 22}
+    queue.put(count)
+
+def test_concurrent_saves_lose_nothing(home, run_processes):
+    run_processes(_save, ("a", 30), ("b", 30), ("c", 30))
+    connections = ConfigManager().load_connections()
+    assert len(connections) == 90
+    assert connections["b7"]["host"] == "b7.example.com"
+
+def test_concurrent_batches_lose_nothing(home, run_processes):
+    run_processes(_batch, ("x", 30), ("y", 30))
+    assert ConfigManager().count_connections() == 60
+
+def test_failed_batch_changes_nothing(home):
+    manager = ConfigManager()
+    manager.save_connection("conn", {"host": "h", "port": 22, "tags": ["gpu"]})
+    try:
+        with manager.batch() as connections:
+            connections["conn"]["tags"].append("cpu")
+            connections["new"] = {"host": "n", "port": 22}
+            raise RuntimeError("abort")
+    except RuntimeError:
+        pass
+    assert manager.load_connections() == ConfigManager().load_connections()
+    assert manager.get_connection("conn")["tags"] == ["gpu"]
+    assert manager.get_connection("new") is None
+
+def test_reads_are_independent_copies(home):
+    manager = ConfigManager()
+    manager.save_connection("conn", {"host": "h", "port": 22, "tags": ["gpu"]})
+    manager.load_connections()["conn"]["tags"].append("cpu")
+    next(manager.iter_connections())[1]["tags"].append("cpu")
+    assert manager.get_connection("conn")["tags"] == ["gpu"]
@@ -0,0 +1,36 @@
+from connection_manager.core.ports import PortAllocator, port_free
+
+PORT_RANGE = (41000, 41199)
+
+def allocator(home) -> PortAllocator:
+    return PortAllocator(PORT_RANGE, home / ".connections" / "ports.json")
+
+def _allocate(queue, home, prefix, count):
+    ports = allocator(home).allocate_many({f"{prefix}{index}": None for index in range(count)})
+    queue.put(ports)
+
+def test_concurrent_allocations_get_distinct_ports(home, run_processes):
+    results = run_processes(_allocate, (home, "a", 20), (home, "b", 20))
+    ports = [port for result in results for port in result.values()]
+    assert len(ports) == 40
+    assert len(set(ports)) == 40
+    assert all(PORT_RANGE[0] <= port <= PORT_RANGE[1] for port in ports)
+
+def test_released_port_is_given_back(home):
+    ports = allocator(home)
+    first = ports.allocate("conn")
+    ports.allocate("other")
+    ports.release("conn")
+    assert ports.allocate("conn") == first
+
+def test_lease_of_dead_owner_is_reclaimed(home, run_processes):
+    [leased] = run_processes(_allocate, (home, "gone", 1))
+    port = leased["gone0"]
+    ports = allocator(home)
+    # The process that took the lease has exited, so nothing holds the port
+    assert "gone0" not in ports.leases()
+    assert port_free(port)
+    assert ports.allocate("taker", port) == port
+    # The dead owner's connection still gets its port back once it is free
+    ports.release("taker")
+    assert ports.allocate("gone0") == port